@@ -1,7 +1,15 @@
 #!/usr/bin/env python3
 
+import argparse
+import hashlib
+import heapq
+import json
+import os
 import sys
-import re
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../test/lint'))
+
+from source_index import SourceIndex  # noqa: E402
 
 MAPPING = {
     'core_read.cpp': 'core_io.cpp',
@@ -15,6 +23,8 @@ HEADER_MODULE_PATHS = [
     'interfaces/'
 ]
 
+INCREMENTAL_VERSION = 1
+
 def module_name(path):
     if path in MAPPING:
         path = MAPPING[path]
@@ -28,61 +38,192 @@ def module_name(path):
         return path[:-4]
     return None
 
-files = dict()
-deps = dict()
-
-RE = re.compile("^#include <(.*)>")
-
-# Iterate over files, and create list of modules
-for arg in sys.argv[1:]:
-    module = module_name(arg)
-    if module is None:
-        print("Ignoring file %s (does not constitute module)\n" % arg)
-    else:
-        files[arg] = module
-        deps[module] = set()
-
-# Iterate again, and build list of direct dependencies for each module
-# TODO: implement support for multiple include directories
-for arg in sorted(files.keys()):
-    module = files[arg]
-    with open(arg, 'r', encoding="utf8") as f:
-        for line in f:
-            match = RE.match(line)
-            if match:
-                include = match.group(1)
+def root_relative(path, roots):
+    """Return path relative to the innermost include root containing it."""
+    path = os.path.normpath(path)
+    best = None
+    for root in roots:
+        rel = os.path.relpath(path, root)
+        if not rel.startswith(os.pardir) and (best is None or len(rel) < len(best)):
+            best = rel
+    return (best if best is not None else path).replace(os.sep, '/')
+
+def strongly_connected_components(deps, nodes):
+    """Tarjan's algorithm over the subgraph of deps induced by nodes.
+
+    Iterative, so deep include chains do not hit the recursion limit. Nodes
+    are visited in sorted order to keep the output deterministic."""
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    components = []
+    counter = 0
+    for start in sorted(nodes):
+        if start in index:
+            continue
+        work = [(start, iter(sorted(deps[start] & nodes)))]
+        index[start] = lowlink[start] = counter
+        counter += 1
+        stack.append(start)
+        on_stack.add(start)
+        while work:
+            node, successors = work[-1]
+            for succ in successors:
+                if succ not in index:
+                    index[succ] = lowlink[succ] = counter
+                    counter += 1
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(sorted(deps[succ] & nodes))))
+                    break
+                if succ in on_stack:
+                    lowlink[node] = min(lowlink[node], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = set()
+                    while True:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        component.add(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+def shortest_cycle_through(module, deps, limit):
+    """Return the shortest cycle starting at module, if shorter than limit.
+
+    Breadth first, expanding each level in sorted order, so the path found is
+    the one the original closure-based search reported."""
+    closure = dict((dep, []) for dep in deps[module])
+    frontier = sorted(closure)
+    while module not in closure and frontier and len(closure[frontier[0]]) + 2 < limit:
+        next_frontier = []
+        for src in frontier:
+            for dep in deps[src]:
+                if dep not in closure:
+                    closure[dep] = closure[src] + [src]
+                    next_frontier.append(dep)
+        frontier = sorted(next_frontier)
+    if module in closure and len(closure[module]) + 1 < limit:
+        return [module] + closure[module]
+    return None
+
+def shortest_cycle(deps, component):
+    """Return the shortest cycle in component, preferring the first module in sorted order."""
+    best = None
+    for module in sorted(component):
+        cycle = shortest_cycle_through(module, deps, len(best) if best else len(component) + 1)
+        if cycle is not None:
+            best = cycle
+    return best
+
+def component_cycles(deps, component):
+    """Report the circular dependencies of one strongly connected component.
+
+    Repeatedly takes the shortest remaining cycle and breaks its last edge, as
+    the whole-graph search used to, but only re-examines the component the
+    broken edge belonged to, after splitting it into its own components."""
+    deps = dict((module, deps[module] & component) for module in component)
+    heap = []
+
+    def push(nodes):
+        for sub in strongly_connected_components(deps, nodes):
+            if len(sub) > 1:
+                cycle = shortest_cycle(deps, sub)
+                heapq.heappush(heap, (len(cycle), cycle[0], cycle, sub))
+
+    push(component)
+    cycles = []
+    while heap:
+        _, module, cycle, sub = heapq.heappop(heap)
+        cycles.append(cycle)
+        # Break the dependency to avoid repeating in other cycles
+        deps[cycle[-1]] = deps[cycle[-1]] - set([module])
+        push(sub)
+    return cycles
+
+def component_key(deps, component):
+    edges = [[module, sorted(deps[module] & component)] for module in sorted(component)]
+    return hashlib.sha1(json.dumps(edges).encode()).hexdigest()
+
+def load_incremental(path):
+    try:
+        with open(path, 'r', encoding="utf8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if state.get("version") != INCREMENTAL_VERSION:
+        return {}
+    return state["components"]
+
+def save_incremental(path, components):
+    tmp = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp, 'w', encoding="utf8") as f:
+        json.dump({"version": INCREMENTAL_VERSION, "components": components}, f)
+    os.replace(tmp, path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Find circular dependencies between modules, treating the .cpp "
+                                     "and .h file of a module as one unit.")
+    parser.add_argument('-I', '--include-root', dest='roots', action='append', metavar='DIR',
+                        help="directory #include <...> paths are relative to; may be given multiple times "
+                        "(default: the current directory)")
+    parser.add_argument('--incremental', metavar='FILE',
+                        help="reuse the cycles of components whose includes did not change since the "
+                        "run that wrote FILE, and update FILE")
+    parser.add_argument('files', nargs='*', help="source files (e.g. validation.cpp)")
+    args = parser.parse_args()
+    roots = [os.path.normpath(root) for root in args.roots or ['.']]
+
+    files = dict()
+    deps = dict()
+
+    # Iterate over files, and create list of modules
+    for arg in args.files:
+        module = module_name(root_relative(arg, roots))
+        if module is None:
+            print("Ignoring file %s (does not constitute module)\n" % arg)
+        else:
+            files[arg] = module
+            deps[module] = set()
+
+    # Iterate again, and build list of direct dependencies for each module
+    with SourceIndex() as index:
+        for arg in sorted(files.keys()):
+            module = files[arg]
+            for include in index.includes(arg):
                 included_module = module_name(include)
                 if included_module is not None and included_module in deps and included_module != module:
                     deps[module].add(included_module)
 
-# Loop to find the shortest (remaining) circular dependency
-have_cycle = False
-while True:
-    shortest_cycle = None
-    for module in sorted(deps.keys()):
-        # Build the transitive closure of dependencies of module
-        closure = dict()
-        for dep in deps[module]:
-            closure[dep] = []
-        while True:
-            old_size = len(closure)
-            old_closure_keys = sorted(closure.keys())
-            for src in old_closure_keys:
-                for dep in deps[src]:
-                    if dep not in closure:
-                        closure[dep] = closure[src] + [src]
-            if len(closure) == old_size:
-                break
-        # If module is in its own transitive closure, it's a circular dependency; check if it is the shortest
-        if module in closure and (shortest_cycle is None or len(closure[module]) + 1 < len(shortest_cycle)):
-            shortest_cycle = [module] + closure[module]
-    if shortest_cycle is None:
-        break
-    # We have the shortest circular dependency; report it
-    module = shortest_cycle[0]
-    print("Circular dependency: %s" % (" -> ".join(shortest_cycle + [module])))
-    # And then break the dependency to avoid repeating in other cycles
-    deps[shortest_cycle[-1]] = deps[shortest_cycle[-1]] - set([module])
-    have_cycle = True
-
-sys.exit(1 if have_cycle else 0)
+    # Cycles only exist within strongly connected components, and breaking one
+    # never affects the cycles of another component.
+    previous = load_incremental(args.incremental) if args.incremental else {}
+    current = {}
+    reports = []
+    for component in strongly_connected_components(deps, set(deps)):
+        if len(component) < 2:
+            continue
+        key = component_key(deps, component)
+        cycles = previous[key] if key in previous else component_cycles(deps, component)
+        current[key] = cycles
+        reports.append(cycles)
+    if args.incremental:
+        save_incremental(args.incremental, current)
+
+    # Report the shortest remaining cycle of any component first
+    have_cycle = False
+    for cycle in heapq.merge(*reports, key=lambda cycle: (len(cycle), cycle[0])):
+        print("Circular dependency: %s" % (" -> ".join(cycle + [cycle[0]])))
+        have_cycle = True
+
+    sys.exit(1 if have_cycle else 0)
+
+if __name__ == '__main__':
+    main()
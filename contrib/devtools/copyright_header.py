@@ -5,6 +5,9 @@
 
 import re
 import fnmatch
+import hashlib
+import json
+import multiprocessing
 import sys
 import subprocess
 import datetime
@@ -49,6 +52,8 @@ def applies_to_file(filename):
 ################################################################################
 
 GIT_LS_CMD = 'git ls-files --full-name'.split(' ')
+GIT_LS_STAGE_CMD = 'git ls-files --full-name --stage'.split(' ')
+GIT_MODIFIED_CMD = 'git diff --name-only'.split(' ')
 GIT_TOPLEVEL_CMD = 'git rev-parse --show-toplevel'.split(' ')
 
 def call_git_ls(base_directory):
@@ -66,6 +71,89 @@ def get_filenames_to_examine(base_directory):
     return sorted([os.path.join(root, filename) for filename in filenames if
                    applies_to_file(filename)])
 
+def hash_blob(filename):
+    "Returns the git blob hash of the file's current contents"
+    with open(filename, 'rb') as f:
+        data = f.read()
+    return hashlib.sha1(b'blob %d\0' % len(data) + data).hexdigest()
+
+def get_blob_hashes(base_directory):
+    "Returns a dict of absolute path to blob hash of the files in the base_directory, as they are in the working tree"
+    root = call_git_toplevel()
+    out = subprocess.check_output([*GIT_LS_STAGE_CMD, base_directory])
+    blobs = {}
+    for line in out.decode("utf-8").split('\n'):
+        if line == '':
+            continue
+        meta, filename = line.split('\t', 1)
+        blobs[os.path.join(root, filename)] = meta.split(' ')[1]
+    # files with unstaged changes differ from the index
+    out = subprocess.check_output(GIT_MODIFIED_CMD, cwd=root)
+    for filename in out.decode("utf-8").split('\n'):
+        path = os.path.join(root, filename)
+        if filename != '' and path in blobs and os.path.isfile(path):
+            blobs[path] = hash_blob(path)
+    return blobs
+
+################################################################################
+# cache of file scans and git change years, kept across runs
+################################################################################
+
+CACHE_FILE_NAME = 'copyright_header_cache.json'
+GIT_DIR_CMD = 'git rev-parse --git-dir'.split(' ')
+
+def get_cache_path():
+    root = call_git_toplevel()
+    git_dir = subprocess.check_output(GIT_DIR_CMD, cwd=root).strip().decode("utf-8")
+    return os.path.join(root, git_dir, CACHE_FILE_NAME)
+
+def get_cache_fingerprint():
+    "Scans made with different patterns (i.e. another version of this script) are not reused"
+    with open(os.path.abspath(__file__), 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def load_cache():
+    """Returns the cache: git change years of all files as of commit 'head',
+    and the results of the report and update scans, keyed by blob hash"""
+    empty = {'fingerprint': get_cache_fingerprint(), 'head': None,
+             'years': {}, 'report': {}, 'update': {}}
+    try:
+        with open(get_cache_path(), 'r', encoding="utf8") as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return empty
+    if cache.get('fingerprint') != empty['fingerprint']:
+        return empty
+    return cache
+
+def save_cache(cache, scan, blobs):
+    "Writes the cache back, keeping only the scans of current blobs"
+    current = set(blobs.values())
+    cache[scan] = {blob: result for blob, result in cache[scan].items() if
+                   blob in current}
+    path = get_cache_path()
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w', encoding="utf8") as f:
+        json.dump(cache, f)
+    os.replace(tmp, path)
+
+def scan_files(cache, scan, func, filenames, blobs):
+    """Returns func(filename) for all filenames, running it in parallel for the
+    files whose blob is not in the cache"""
+    results = cache[scan]
+    todo = {}
+    for f in filenames:
+        if blobs[f] not in results:
+            todo.setdefault(blobs[f], f)
+    todo = sorted(todo.items())
+    if todo:
+        with multiprocessing.Pool() as pool:
+            scanned = pool.map(func, [f for _, f in todo], chunksize=16)
+        results.update(zip([blob for blob, _ in todo], scanned))
+    print("%d files scanned, %d unchanged files taken from the cache" %
+          (len(todo), len(filenames) - len(todo)), file=sys.stderr)
+    return [results[blobs[f]] for f in filenames]
+
 ################################################################################
 # define and compile regexes for the patterns we are looking for
 ################################################################################
@@ -144,9 +232,7 @@ def read_file(filename):
 
 def gather_file_info(filename):
     info = {}
-    info['filename'] = filename
     c = read_file(filename)
-    info['contents'] = c
 
     info['all_copyrights'] = get_count_of_copyrights_of_any_style_any_holder(c)
 
@@ -255,7 +341,11 @@ def print_report(file_infos, verbose):
 
 def exec_report(base_directory, verbose):
     filenames = get_filenames_to_examine(base_directory)
-    file_infos = [gather_file_info(f) for f in filenames]
+    blobs = get_blob_hashes(base_directory)
+    cache = load_cache()
+    infos = scan_files(cache, 'report', gather_file_info, filenames, blobs)
+    save_cache(cache, 'report', blobs)
+    file_infos = [dict(info, filename=f) for f, info in zip(filenames, infos)]
     print_report(file_infos, verbose)
 
 ################################################################################
@@ -296,21 +386,65 @@ def report_cmd(argv):
 ################################################################################
 
 GIT_LOG_CMD = "git log --pretty=format:%%ai %s"
+GIT_LOG_ALL_CMD = ['git', '-c', 'core.quotepath=off', 'log', '--pretty=format:%x00%ai', '--name-only']
+GIT_HEAD_CMD = 'git rev-parse HEAD'.split(' ')
+GIT_IS_ANCESTOR_CMD = 'git merge-base --is-ancestor'.split(' ')
 
 def call_git_log(filename):
     out = subprocess.check_output((GIT_LOG_CMD % filename).split(' '))
     return out.decode("utf-8").split('\n')
 
 def get_git_change_years(filename):
-    git_log_lines = call_git_log(filename)
+    git_log_lines = [line for line in call_git_log(filename) if line != '']
     if len(git_log_lines) == 0:
-        return [datetime.date.today().year]
+        return [str(datetime.date.today().year)]
     # timestamp is in ISO 8601 format. e.g. "2016-09-05 14:25:32 -0600"
     return [line.split(' ')[0].split('-')[0] for line in git_log_lines]
 
 def get_most_recent_git_change_year(filename):
     return max(get_git_change_years(filename))
 
+def call_git_log_all(root, since):
+    """Returns a dict of filename (relative to root) to [first, last] year of
+    change, from a single pass over the history of HEAD (after commit since,
+    if given)"""
+    cmd = GIT_LOG_ALL_CMD + (['%s..HEAD' % since] if since else [])
+    out = subprocess.check_output(cmd, cwd=root).decode("utf-8")
+    years = {}
+    for entry in out.split('\0')[1:]:
+        lines = entry.split('\n')
+        year = lines[0].split(' ')[0].split('-')[0]
+        for filename in lines[1:]:
+            if filename == '':
+                continue
+            if filename in years:
+                first, last = years[filename]
+                years[filename] = [min(first, year), max(last, year)]
+            else:
+                years[filename] = [year, year]
+    return years
+
+def get_all_git_change_years(cache):
+    """Returns a dict of absolute path to [first, last] year of change. The
+    history is only read since the commit the cache was made at."""
+    root = call_git_toplevel()
+    head = subprocess.check_output(GIT_HEAD_CMD, cwd=root).strip().decode("utf-8")
+    since = cache['head']
+    if since != head:
+        if since and subprocess.call(GIT_IS_ANCESTOR_CMD + [since, head], cwd=root) == 0:
+            years = cache['years']
+        else:
+            years = {}
+            since = None
+        for filename, (first, last) in call_git_log_all(root, since).items():
+            if filename in years:
+                years[filename] = [min(first, years[filename][0]), max(last, years[filename][1])]
+            else:
+                years[filename] = [first, last]
+        cache['head'] = head
+        cache['years'] = years
+    return {os.path.join(root, filename): span for filename, span in cache['years'].items()}
+
 ################################################################################
 # read and write to file
 ################################################################################
@@ -373,25 +507,36 @@ def create_updated_copyright_line(line, last_git_change_year):
             year_range_to_str(start_year, last_git_change_year) + ' ' +
             ' '.join(space_split[1:]))
 
-def update_updatable_copyright(filename):
-    file_lines = read_file_lines(filename)
-    index, line = get_updatable_copyright_line(file_lines)
+def scan_updatable_copyright(filename):
+    return get_updatable_copyright_line(read_file_lines(filename))
+
+def update_updatable_copyright(filename, line, last_git_change_year):
     if not line:
         print_file_action_message(filename, "No updatable copyright.")
         return
-    last_git_change_year = get_most_recent_git_change_year(filename)
     new_line = create_updated_copyright_line(line, last_git_change_year)
     if line == new_line:
         print_file_action_message(filename, "Copyright up-to-date.")
         return
+    file_lines = read_file_lines(filename)
+    index, _ = get_updatable_copyright_line(file_lines)
     file_lines[index] = new_line
     write_file_lines(filename, file_lines)
     print_file_action_message(filename,
                               "Copyright updated! -> %s" % last_git_change_year)
 
 def exec_update_header_year(base_directory):
-    for filename in get_filenames_to_examine(base_directory):
-        update_updatable_copyright(filename)
+    filenames = get_filenames_to_examine(base_directory)
+    blobs = get_blob_hashes(base_directory)
+    cache = load_cache()
+    years = get_all_git_change_years(cache)
+    scans = scan_files(cache, 'update', scan_updatable_copyright, filenames, blobs)
+    today = str(datetime.date.today().year)
+    for filename, (_, line) in zip(filenames, scans):
+        last_git_change_year = years.get(filename, [today, today])[1]
+        update_updatable_copyright(filename, line, last_git_change_year)
+    # updated files are scanned again on the next run, as their blob changed
+    save_cache(cache, 'update', blobs)
 
 ################################################################################
 # update cmd
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+'''
+Minimal read-only ELF parser for security-check.py and symbol-check.py.
+
+The file is mmapped once and only the parts the release checks need are
+decoded: the file header, program headers, dynamic section and dynamic
+symbols with their versions. Both 32 and 64 bit, little and big endian files
+are supported.
+'''
+import mmap
+import struct
+
+ET_DYN = 3
+
+PT_LOAD = 1
+PT_DYNAMIC = 2
+PT_GNU_STACK = 0x6474e551
+PT_GNU_RELRO = 0x6474e552
+
+PF_X = 1
+PF_W = 2
+PF_R = 4
+
+SHT_DYNSYM = 11
+SHT_GNU_verdef = 0x6ffffffd
+SHT_GNU_verneed = 0x6ffffffe
+SHT_GNU_versym = 0x6fffffff
+
+DT_NULL = 0
+DT_NEEDED = 1
+DT_STRTAB = 5
+DT_BIND_NOW = 24
+DT_FLAGS = 30
+DF_BIND_NOW = 8
+
+SHN_UNDEF = 0
+VERSYM_VERSION = 0x7fff
+# Version indices 0 and 1 mean local and global (unversioned)
+VER_NDX_GLOBAL = 1
+
+# Machine names as printed by `readelf -h`, as far as the checks care about them
+MACHINES = {
+    3: '80386',
+    40: 'ARM',
+    62: 'X86-64',
+    183: 'AArch64',
+    243: 'RISC-V',
+}
+
+class ELFError(ValueError):
+    pass
+
+class Symbol(object):
+    __slots__ = ('name', 'version', 'section', 'is_import')
+
+    def __init__(self, name, version, section):
+        self.name = name
+        self.version = version
+        self.section = section
+        self.is_import = section == SHN_UNDEF
+
+class ELFFile(object):
+    '''
+    Parsed view of an ELF file. Use as a context manager, or call close().
+    '''
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as f:
+            try:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError: # empty file
+                raise ELFError('%s: not an ELF file' % filename)
+        try:
+            self._parse()
+        except (struct.error, IndexError) as e:
+            self.close()
+            raise ELFError('%s: truncated or malformed ELF file (%s)' % (filename, e))
+        except ELFError:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.data.close()
+
+    def _unpack(self, fmt, offset):
+        return struct.unpack_from(self.endian + fmt, self.data, offset)
+
+    def _parse(self):
+        ident = self.data[:16]
+        if ident[:4] != b'\x7fELF':
+            raise ELFError('%s: not an ELF file' % self.filename)
+        if ident[4] not in (1, 2) or ident[5] not in (1, 2):
+            raise ELFError('%s: unsupported ELF class or data encoding' % self.filename)
+        self.bits = 32 if ident[4] == 1 else 64
+        self.endian = '<' if ident[5] == 1 else '>'
+        word = 'I' if self.bits == 32 else 'Q'
+        (self.type, self.machine, _, _, phoff, shoff, _, _, phentsize, phnum, shentsize, shnum, _) = \
+            self._unpack('HHI' + word * 3 + 'IHHHHHH', 16)
+
+        self.program_headers = []
+        for i in range(phnum):
+            if self.bits == 32:
+                (p_type, p_offset, p_vaddr, _, p_filesz, _, p_flags, _) = self._unpack('8I', phoff + i * phentsize)
+            else:
+                (p_type, p_flags, p_offset, p_vaddr, _, p_filesz, _, _) = self._unpack('IIQQQQQQ', phoff + i * phentsize)
+            self.program_headers.append((p_type, p_flags, p_offset, p_vaddr, p_filesz))
+
+        self.sections = []
+        for i in range(shnum):
+            if self.bits == 32:
+                (_, sh_type, _, _, sh_offset, sh_size, sh_link, _, _, sh_entsize) = self._unpack('10I', shoff + i * shentsize)
+            else:
+                (_, sh_type, _, _, sh_offset, sh_size, sh_link, _, _, sh_entsize) = self._unpack('IIQQQQIIQQ', shoff + i * shentsize)
+            self.sections.append((sh_type, sh_offset, sh_size, sh_link, sh_entsize))
+
+        self.dynamic = self._read_dynamic()
+        self._dynamic_symbols = None
+
+    @property
+    def machine_name(self):
+        return MACHINES.get(self.machine, str(self.machine))
+
+    @property
+    def is_pie(self):
+        return self.type == ET_DYN
+
+    def program_header_types(self):
+        '''Return (type, flags) of all program headers'''
+        return [(p_type, p_flags) for (p_type, p_flags, _, _, _) in self.program_headers]
+
+    def _vaddr_to_offset(self, vaddr):
+        for (p_type, _, p_offset, p_vaddr, p_filesz) in self.program_headers:
+            if p_type == PT_LOAD and p_vaddr <= vaddr < p_vaddr + p_filesz:
+                return vaddr - p_vaddr + p_offset
+        raise ELFError('%s: address 0x%x is not mapped' % (self.filename, vaddr))
+
+    def _read_dynamic(self):
+        '''Return the (tag, value) entries of the dynamic section'''
+        entries = []
+        fmt = 'iI' if self.bits == 32 else 'qQ'
+        size = struct.calcsize(self.endian + fmt)
+        for (p_type, _, p_offset, _, p_filesz) in self.program_headers:
+            if p_type != PT_DYNAMIC:
+                continue
+            for offset in range(p_offset, p_offset + p_filesz - size + 1, size):
+                (tag, value) = self._unpack(fmt, offset)
+                if tag == DT_NULL:
+                    break
+                entries.append((tag, value))
+        return entries
+
+    def _string(self, offset):
+        end = self.data.find(b'\0', offset)
+        if end < 0:
+            raise ELFError('%s: unterminated string' % self.filename)
+        return self.data[offset:end].decode('utf8', 'replace')
+
+    def dynamic_tags(self):
+        return set(tag for (tag, _) in self.dynamic)
+
+    def dynamic_flags(self):
+        '''Return the value of DT_FLAGS (0 if absent)'''
+        flags = 0
+        for (tag, value) in self.dynamic:
+            if tag == DT_FLAGS:
+                flags |= value
+        return flags
+
+    def needed_libraries(self):
+        '''Return the DT_NEEDED entries, in order'''
+        strtab = [value for (tag, value) in self.dynamic if tag == DT_STRTAB]
+        if not strtab:
+            return []
+        base = self._vaddr_to_offset(strtab[0])
+        return [self._string(base + value) for (tag, value) in self.dynamic if tag == DT_NEEDED]
+
+    def _versions(self, verneed_section, verdef_section):
+        '''Map version indices to version names'''
+        names = {}
+        if verneed_section is not None:
+            (_, offset, _, link, _) = verneed_section
+            strbase = self.sections[link][1]
+            while True:
+                (_, vn_cnt, _, vn_aux, vn_next) = self._unpack('HHIII', offset)
+                aux = offset + vn_aux
+                for _ in range(vn_cnt):
+                    (_, _, vna_other, vna_name, vna_next) = self._unpack('IHHII', aux)
+                    names[vna_other] = self._string(strbase + vna_name)
+                    aux += vna_next
+                if vn_next == 0:
+                    break
+                offset += vn_next
+        if verdef_section is not None:
+            (_, offset, _, link, _) = verdef_section
+            strbase = self.sections[link][1]
+            while True:
+                (_, _, vd_ndx, vd_cnt, _, vd_aux, vd_next) = self._unpack('HHHHIII', offset)
+                if vd_cnt:
+                    (vda_name, _) = self._unpack('II', offset + vd_aux)
+                    names[vd_ndx] = self._string(strbase + vda_name)
+                if vd_next == 0:
+                    break
+                offset += vd_next
+        return names
+
+    def dynamic_symbols(self):
+        '''Return the named dynamic symbols, with their version names ('' if unversioned)'''
+        if self._dynamic_symbols is not None:
+            return self._dynamic_symbols
+        dynsym = versym = verneed = verdef = None
+        for section in self.sections:
+            if section[0] == SHT_DYNSYM:
+                dynsym = section
+            elif section[0] == SHT_GNU_versym:
+                versym = section
+            elif section[0] == SHT_GNU_verneed:
+                verneed = section
+            elif section[0] == SHT_GNU_verdef:
+                verdef = section
+        symbols = []
+        if dynsym is not None:
+            (_, offset, size, link, entsize) = dynsym
+            strbase = self.sections[link][1]
+            versions = self._versions(verneed, verdef)
+            fmt = 'IIIBBH' if self.bits == 32 else 'IBBHQQ'
+            for i in range(1, size // entsize):
+                if self.bits == 32:
+                    (st_name, _, _, _, _, st_shndx) = self._unpack(fmt, offset + i * entsize)
+                else:
+                    (st_name, _, _, st_shndx, _, _) = self._unpack(fmt, offset + i * entsize)
+                name = self._string(strbase + st_name)
+                if not name:
+                    continue
+                version = ''
+                if versym is not None:
+                    (index,) = self._unpack('H', versym[1] + i * 2)
+                    index &= VERSYM_VERSION
+                    if index > VER_NDX_GLOBAL:
+                        version = versions.get(index, '')
+                symbols.append(Symbol(name, version, st_shndx))
+        self._dynamic_symbols = symbols
+        return symbols
@@ -5,11 +5,19 @@
 '''
 Run this script every time you change one of the png files. Using pngcrush, it will optimize the png files, remove various color profiles, remove ancillary chunks (alla) and text chunks (text).
 #pngcrush -brute -ow -rem gAMA -rem cHRM -rem iCCP -rem sRGB -rem alla -rem text
+
+The sha256 of every file this script produced is kept in a manifest (by default in the git directory), and files
+whose current hash is listed there are skipped, as crushing them again would not change them. The remaining files
+are crushed in parallel.
 '''
+import argparse
+import json
+import multiprocessing
 import os
 import sys
 import subprocess
 import hashlib
+import time
 from PIL import Image  # pip3 install Pillow
 
 def file_hash(filename):
@@ -27,50 +35,130 @@ def content_hash(filename):
 pngcrush = 'pngcrush'
 git = 'git'
 folders = ["src/qt/res/movies", "src/qt/res/icons", "share/pixmaps"]
-basePath = subprocess.check_output([git, 'rev-parse', '--show-toplevel'], universal_newlines=True, encoding='utf8').rstrip('\n')
-totalSaveBytes = 0
-noHashChange = True
-
-outputArray = []
-for folder in folders:
-    absFolder=os.path.join(basePath, folder)
-    for file in os.listdir(absFolder):
-        extension = os.path.splitext(file)[1]
-        if extension.lower() == '.png':
-            print("optimizing {}...".format(file), end =' ')
-            file_path = os.path.join(absFolder, file)
-            fileMetaMap = {'file' : file, 'osize': os.path.getsize(file_path), 'sha256Old' : file_hash(file_path)}
-            fileMetaMap['contentHashPre'] = content_hash(file_path)
-
-            try:
-                subprocess.call([pngcrush, "-brute", "-ow", "-rem", "gAMA", "-rem", "cHRM", "-rem", "iCCP", "-rem", "sRGB", "-rem", "alla", "-rem", "text", file_path],
-                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            except:
-                print("pngcrush is not installed, aborting...")
-                sys.exit(0)
-
-            #verify
-            if "Not a PNG file" in subprocess.check_output([pngcrush, "-n", "-v", file_path], stderr=subprocess.STDOUT, universal_newlines=True, encoding='utf8'):
-                print("PNG file "+file+" is corrupted after crushing, check out pngcursh version")
-                sys.exit(1)
-
-            fileMetaMap['sha256New'] = file_hash(file_path)
-            fileMetaMap['contentHashPost'] = content_hash(file_path)
-
-            if fileMetaMap['contentHashPre'] != fileMetaMap['contentHashPost']:
-                print("Image contents of PNG file {} before and after crushing don't match".format(file))
-                sys.exit(1)
-
-            fileMetaMap['psize'] = os.path.getsize(file_path)
-            outputArray.append(fileMetaMap)
-            print("done")
-
-print("summary:\n+++++++++++++++++")
-for fileDict in outputArray:
-    oldHash = fileDict['sha256Old']
-    newHash = fileDict['sha256New']
-    totalSaveBytes += fileDict['osize'] - fileDict['psize']
-    noHashChange = noHashChange and (oldHash == newHash)
-    print(fileDict['file']+"\n  size diff from: "+str(fileDict['osize'])+" to: "+str(fileDict['psize'])+"\n  old sha256: "+oldHash+"\n  new sha256: "+newHash+"\n")
-
-print("completed. Checksum stable: "+str(noHashChange)+". Total reduction: "+str(totalSaveBytes)+" bytes")
+MANIFEST_VERSION = 1
+
+class CrushError(Exception):
+    pass
+
+def load_manifest(path):
+    '''Return the set of sha256 hashes of files optimized before'''
+    try:
+        with open(path, 'r', encoding='utf8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if manifest.get('version') != MANIFEST_VERSION:
+        return set()
+    return set(manifest['optimized'])
+
+def save_manifest(path, hashes):
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w', encoding='utf8') as f:
+        json.dump({'version': MANIFEST_VERSION, 'optimized': sorted(hashes)}, f, indent=1)
+    os.replace(tmp, path)
+
+def optimize(file_path):
+    '''Crush one png file and verify its image contents did not change'''
+    start = time.time()
+    file = os.path.basename(file_path)
+    fileMetaMap = {'file' : file, 'osize': os.path.getsize(file_path), 'sha256Old' : file_hash(file_path)}
+    fileMetaMap['contentHashPre'] = content_hash(file_path)
+
+    try:
+        subprocess.call([pngcrush, "-brute", "-ow", "-rem", "gAMA", "-rem", "cHRM", "-rem", "iCCP", "-rem", "sRGB", "-rem", "alla", "-rem", "text", file_path],
+                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+        raise CrushError("pngcrush is not installed, aborting...")
+
+    #verify
+    if "Not a PNG file" in subprocess.check_output([pngcrush, "-n", "-v", file_path], stderr=subprocess.STDOUT, universal_newlines=True, encoding='utf8'):
+        raise CrushError("PNG file "+file+" is corrupted after crushing, check out pngcursh version")
+
+    fileMetaMap['sha256New'] = file_hash(file_path)
+    fileMetaMap['contentHashPost'] = content_hash(file_path)
+
+    if fileMetaMap['contentHashPre'] != fileMetaMap['contentHashPost']:
+        raise CrushError("Image contents of PNG file {} before and after crushing don't match".format(file))
+
+    fileMetaMap['psize'] = os.path.getsize(file_path)
+    fileMetaMap['time'] = time.time() - start
+    return fileMetaMap
+
+def optimize_task(file_path):
+    try:
+        return optimize(file_path), None
+    except CrushError as e:
+        return None, str(e)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='number of files crushed in parallel (default: %(default)s)')
+    parser.add_argument('--manifest', help='manifest of already optimized files (default: optimize-pngs.json in the git directory)')
+    parser.add_argument('--force', action='store_true', help='crush all files, even if they are listed in the manifest')
+    args = parser.parse_args()
+
+    basePath = subprocess.check_output([git, 'rev-parse', '--show-toplevel'], universal_newlines=True, encoding='utf8').rstrip('\n')
+    manifestPath = args.manifest
+    if manifestPath is None:
+        gitDir = subprocess.check_output([git, 'rev-parse', '--git-dir'], cwd=basePath, universal_newlines=True, encoding='utf8').rstrip('\n')
+        manifestPath = os.path.join(basePath, gitDir, 'optimize-pngs.json')
+    optimized = set() if args.force else load_manifest(manifestPath)
+
+    files = []
+    for folder in folders:
+        absFolder=os.path.join(basePath, folder)
+        if not os.path.isdir(absFolder):
+            continue
+        for file in sorted(os.listdir(absFolder)):
+            extension = os.path.splitext(file)[1]
+            if extension.lower() == '.png':
+                files.append(os.path.join(absFolder, file))
+
+    start = time.time()
+    todo = []
+    current = set()
+    for file_path in files:
+        sha256 = file_hash(file_path)
+        current.add(sha256)
+        if sha256 not in optimized:
+            todo.append(file_path)
+    skipped = len(files) - len(todo)
+
+    outputArray = []
+    error = None
+    if todo:
+        with multiprocessing.Pool(max(1, min(args.jobs, len(todo)))) as pool:
+            for fileMetaMap, error in pool.imap(optimize_task, todo):
+                if error is not None:
+                    print(error)
+                    pool.terminate()
+                    break
+                print("optimized {} ({:.1f}s)".format(fileMetaMap['file'], fileMetaMap['time']))
+                outputArray.append(fileMetaMap)
+                current.add(fileMetaMap['sha256New'])
+    elapsed = time.time() - start
+
+    # Only keep the hashes of files currently in the tree. Saved before
+    # exiting on an error, so the files crushed so far are not crushed again.
+    optimized = set(m['sha256New'] for m in outputArray) | (optimized & current)
+    save_manifest(manifestPath, optimized)
+    if error is not None:
+        sys.exit(0 if error.startswith("pngcrush is not installed") else 1)
+
+    totalSaveBytes = 0
+    noHashChange = True
+    print("summary:\n+++++++++++++++++")
+    for fileDict in outputArray:
+        oldHash = fileDict['sha256Old']
+        newHash = fileDict['sha256New']
+        totalSaveBytes += fileDict['osize'] - fileDict['psize']
+        noHashChange = noHashChange and (oldHash == newHash)
+        print(fileDict['file']+"\n  size diff from: "+str(fileDict['osize'])+" to: "+str(fileDict['psize'])+"\n  old sha256: "+oldHash+"\n  new sha256: "+newHash+"\n")
+
+    crushTime = sum(fileDict['time'] for fileDict in outputArray)
+    print("{} file(s) optimized, {} skipped as already optimized. Time: {:.1f}s ({:.1f}s of crushing)".format(
+        len(outputArray), skipped, elapsed, crushTime))
+    print("completed. Checksum stable: "+str(noHashChange)+". Total reduction: "+str(totalSaveBytes)+" bytes")
+
+if __name__ == '__main__':
+    main()
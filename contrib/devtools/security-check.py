@@ -6,114 +6,62 @@
 Perform basic ELF security checks on a series of executables.
 Exit status will be 0 if successful, and the program will be silent.
 Otherwise the exit status will be 1 and it will log which executables failed which checks.
-Needs `readelf` (for ELF) and `objdump` (for PE).
+ELF files are parsed in-process (see elf.py); needs `objdump` (for PE).
+Executables are checked in parallel.
 '''
+import multiprocessing
 import subprocess
 import sys
 import os
 
-READELF_CMD = os.getenv('READELF', '/usr/bin/readelf')
+from elf import ELFFile, ELFError, PT_GNU_STACK, PT_GNU_RELRO, PF_W, PF_X, DT_BIND_NOW, DF_BIND_NOW
+
 OBJDUMP_CMD = os.getenv('OBJDUMP', '/usr/bin/objdump')
 NONFATAL = {} # checks which are non-fatal for now but only generate a warning
 
-def check_ELF_PIE(executable):
+def check_ELF_PIE(elf):
     '''
     Check for position independent executable (PIE), allowing for address space randomization.
     '''
-    p = subprocess.Popen([READELF_CMD, '-h', '-W', executable], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE, universal_newlines=True)
-    (stdout, stderr) = p.communicate()
-    if p.returncode:
-        raise IOError('Error opening file')
+    return elf.is_pie
 
-    ok = False
-    for line in stdout.splitlines():
-        line = line.split()
-        if len(line)>=2 and line[0] == 'Type:' and line[1] == 'DYN':
-            ok = True
-    return ok
-
-def get_ELF_program_headers(executable):
-    '''Return type and flags for ELF program headers'''
-    p = subprocess.Popen([READELF_CMD, '-l', '-W', executable], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE, universal_newlines=True)
-    (stdout, stderr) = p.communicate()
-    if p.returncode:
-        raise IOError('Error opening file')
-    in_headers = False
-    count = 0
-    headers = []
-    for line in stdout.splitlines():
-        if line.startswith('Program Headers:'):
-            in_headers = True
-        if line == '':
-            in_headers = False
-        if in_headers:
-            if count == 1: # header line
-                ofs_typ = line.find('Type')
-                ofs_offset = line.find('Offset')
-                ofs_flags = line.find('Flg')
-                ofs_align = line.find('Align')
-                if ofs_typ == -1 or ofs_offset == -1 or ofs_flags == -1 or ofs_align  == -1:
-                    raise ValueError('Cannot parse elfread -lW output')
-            elif count > 1:
-                typ = line[ofs_typ:ofs_offset].rstrip()
-                flags = line[ofs_flags:ofs_align].rstrip()
-                headers.append((typ, flags))
-            count += 1
-    return headers
-
-def check_ELF_NX(executable):
+def check_ELF_NX(elf):
     '''
     Check that no sections are writable and executable (including the stack)
     '''
     have_wx = False
     have_gnu_stack = False
-    for (typ, flags) in get_ELF_program_headers(executable):
-        if typ == 'GNU_STACK':
+    for (typ, flags) in elf.program_header_types():
+        if typ == PT_GNU_STACK:
             have_gnu_stack = True
-        if 'W' in flags and 'E' in flags: # section is both writable and executable
+        if flags & PF_W and flags & PF_X: # section is both writable and executable
             have_wx = True
     return have_gnu_stack and not have_wx
 
-def check_ELF_RELRO(executable):
+def check_ELF_RELRO(elf):
     '''
     Check for read-only relocations.
     GNU_RELRO program header must exist
     Dynamic section must have BIND_NOW flag
     '''
     have_gnu_relro = False
-    for (typ, flags) in get_ELF_program_headers(executable):
+    for (typ, flags) in elf.program_header_types():
         # Note: not checking flags == 'R': here as linkers set the permission differently
         # This does not affect security: the permission flags of the GNU_RELRO program header are ignored, the PT_LOAD header determines the effective permissions.
         # However, the dynamic linker need to write to this area so these are RW.
         # Glibc itself takes care of mprotecting this area R after relocations are finished.
         # See also https://marc.info/?l=binutils&m=1498883354122353
-        if typ == 'GNU_RELRO':
+        if typ == PT_GNU_RELRO:
             have_gnu_relro = True
 
-    have_bindnow = False
-    p = subprocess.Popen([READELF_CMD, '-d', '-W', executable], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE, universal_newlines=True)
-    (stdout, stderr) = p.communicate()
-    if p.returncode:
-        raise IOError('Error opening file')
-    for line in stdout.splitlines():
-        tokens = line.split()
-        if len(tokens)>1 and tokens[1] == '(BIND_NOW)' or (len(tokens)>2 and tokens[1] == '(FLAGS)' and 'BIND_NOW' in tokens[2:]):
-            have_bindnow = True
+    have_bindnow = DT_BIND_NOW in elf.dynamic_tags() or bool(elf.dynamic_flags() & DF_BIND_NOW)
     return have_gnu_relro and have_bindnow
 
-def check_ELF_Canary(executable):
+def check_ELF_Canary(elf):
     '''
     Check for use of stack canary
     '''
-    p = subprocess.Popen([READELF_CMD, '--dyn-syms', '-W', executable], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE, universal_newlines=True)
-    (stdout, stderr) = p.communicate()
-    if p.returncode:
-        raise IOError('Error opening file')
-    ok = False
-    for line in stdout.splitlines():
-        if '__stack_chk_fail' in line:
-            ok = True
-    return ok
+    return any('__stack_chk_fail' in sym.name for sym in elf.dynamic_symbols())
 
 def get_PE_dll_characteristics(executable):
     '''
@@ -177,7 +125,7 @@ CHECKS = {
 }
 
 def identify_executable(executable):
-    with open(filename, 'rb') as f:
+    with open(executable, 'rb') as f:
         magic = f.read(4)
     if magic.startswith(b'MZ'):
         return 'PE'
@@ -185,31 +133,50 @@ def identify_executable(executable):
         return 'ELF'
     return None
 
+def check_executable(filename):
+    '''
+    Run all checks for one executable. Returns the lines to print and whether
+    any check failed.
+    '''
+    try:
+        etype = identify_executable(filename)
+        if etype is None:
+            return (['%s: unknown format' % filename], True)
+
+        failed = []
+        warning = []
+        if etype == 'ELF':
+            # Parse once, and answer all checks from the parsed file
+            with ELFFile(filename) as elf:
+                results = [(name, func(elf)) for (name, func) in CHECKS[etype]]
+        else:
+            results = [(name, func(filename)) for (name, func) in CHECKS[etype]]
+        for (name, ok) in results:
+            if not ok:
+                if name in NONFATAL:
+                    warning.append(name)
+                else:
+                    failed.append(name)
+        lines = []
+        if failed:
+            lines.append('%s: failed %s' % (filename, ' '.join(failed)))
+        if warning:
+            lines.append('%s: warning %s' % (filename, ' '.join(warning)))
+        return (lines, bool(failed))
+    except (IOError, ELFError):
+        return (['%s: cannot open' % filename], True)
+
 if __name__ == '__main__':
     retval = 0
-    for filename in sys.argv[1:]:
-        try:
-            etype = identify_executable(filename)
-            if etype is None:
-                print('%s: unknown format' % filename)
-                retval = 1
-                continue
-
-            failed = []
-            warning = []
-            for (name, func) in CHECKS[etype]:
-                if not func(filename):
-                    if name in NONFATAL:
-                        warning.append(name)
-                    else:
-                        failed.append(name)
-            if failed:
-                print('%s: failed %s' % (filename, ' '.join(failed)))
-                retval = 1
-            if warning:
-                print('%s: warning %s' % (filename, ' '.join(warning)))
-        except IOError:
-            print('%s: cannot open' % filename)
+    filenames = sys.argv[1:]
+    if len(filenames) > 1:
+        with multiprocessing.Pool(min(len(filenames), os.cpu_count())) as pool:
+            results = pool.map(check_executable, filenames)
+    else:
+        results = [check_executable(filename) for filename in filenames]
+    for (lines, failed) in results:
+        for line in lines:
+            print(line)
+        if failed:
             retval = 1
     sys.exit(retval)
-
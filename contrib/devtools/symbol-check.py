@@ -10,12 +10,16 @@ still compatible with the minimum supported Linux distribution versions.
 Example usage:
 
     find ../gitian-builder/build -type f -executable | xargs python3 contrib/devtools/symbol-check.py
+
+The executables are parsed in-process (see elf.py) and checked in parallel.
 '''
+import multiprocessing
 import subprocess
-import re
 import sys
 import os
 
+from elf import ELFFile
+
 # Debian 6.0.9 (Squeeze) has:
 #
 # - g++ version 4.4.5 (https://packages.debian.org/search?suite=default&section=all&arch=any&searchon=names&keywords=g%2B%2B)
@@ -49,7 +53,6 @@ MAX_VERSIONS = {
 IGNORE_EXPORTS = {
 '_edata', '_end', '__end__', '_init', '__bss_start', '__bss_start__', '_bss_end__', '__bss_end__', '_fini', '_IO_stdin_used', 'stdin', 'stdout', 'stderr'
 }
-READELF_CMD = os.getenv('READELF', '/usr/bin/readelf')
 CPPFILT_CMD = os.getenv('CPPFILT', '/usr/bin/c++filt')
 # Allowed NEEDED libraries
 ALLOWED_LIBRARIES = {
@@ -79,47 +82,23 @@ ARCH_MIN_GLIBC_VER = {
 'AArch64':(2,17),
 'RISC-V': (2,27)
 }
-class CPPFilt(object):
+def demangle(names):
     '''
-    Demangle C++ symbol names.
-
-    Use a pipe to the 'c++filt' command.
+    Demangle C++ symbol names with a single 'c++filt' invocation.
     '''
-    def __init__(self):
-        self.proc = subprocess.Popen(CPPFILT_CMD, stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
-
-    def __call__(self, mangled):
-        self.proc.stdin.write(mangled + '\n')
-        self.proc.stdin.flush()
-        return self.proc.stdout.readline().rstrip()
+    if not names:
+        return []
+    p = subprocess.Popen(CPPFILT_CMD, stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True)
+    (stdout, _) = p.communicate(''.join(name + '\n' for name in names))
+    return stdout.splitlines()
 
-    def close(self):
-        self.proc.stdin.close()
-        self.proc.stdout.close()
-        self.proc.wait()
-
-def read_symbols(executable, imports=True):
+def read_symbols(elf, imports=True):
     '''
-    Parse an ELF executable and return a list of (symbol,version) tuples
-    for dynamic, imported symbols.
+    Return a list of (symbol,version,arch) tuples for the dynamic, imported
+    (or exported) symbols of a parsed ELF executable.
     '''
-    p = subprocess.Popen([READELF_CMD, '--dyn-syms', '-W', '-h', executable], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE, universal_newlines=True)
-    (stdout, stderr) = p.communicate()
-    if p.returncode:
-        raise IOError('Could not read symbols for %s: %s' % (executable, stderr.strip()))
-    syms = []
-    for line in stdout.splitlines():
-        line = line.split()
-        if 'Machine:' in line:
-            arch = line[-1]
-        if len(line)>7 and re.match('[0-9]+:$', line[0]):
-            (sym, _, version) = line[7].partition('@')
-            is_import = line[6] == 'UND'
-            if version.startswith('@'):
-                version = version[1:]
-            if is_import == imports:
-                syms.append((sym, version, arch))
-    return syms
+    arch = elf.machine_name
+    return [(sym.name, sym.version, arch) for sym in elf.dynamic_symbols() if sym.is_import == imports]
 
 def check_version(max_versions, version, arch):
     if '_' in version:
@@ -132,44 +111,48 @@ def check_version(max_versions, version, arch):
         return False
     return ver <= max_versions[lib] or lib == 'GLIBC' and ver <= ARCH_MIN_GLIBC_VER[arch]
 
-def read_libraries(filename):
-    p = subprocess.Popen([READELF_CMD, '-d', '-W', filename], stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE, universal_newlines=True)
-    (stdout, stderr) = p.communicate()
-    if p.returncode:
-        raise IOError('Error opening file')
-    libraries = []
-    for line in stdout.splitlines():
-        tokens = line.split()
-        if len(tokens)>2 and tokens[1] == '(NEEDED)':
-            match = re.match('^Shared library: \[(.*)\]$', ' '.join(tokens[2:]))
-            if match:
-                libraries.append(match.group(1))
-            else:
-                raise ValueError('Unparseable (NEEDED) specification')
-    return libraries
-
-if __name__ == '__main__':
-    cppfilt = CPPFilt()
-    retval = 0
-    for filename in sys.argv[1:]:
+def check_executable(filename):
+    '''
+    Run all checks for one executable. Returns a list of (kind, filename,
+    symbol or library, version) problems, where kind is one of 'version',
+    'export' or 'library'. Symbol names are not demangled yet.
+    '''
+    problems = []
+    try:
+        elf = ELFFile(filename)
+    except (IOError, ValueError) as e:
+        raise IOError('Could not read symbols for %s: %s' % (filename, e))
+    with elf:
         # Check imported symbols
-        for sym,version,arch in read_symbols(filename, True):
+        for sym,version,arch in read_symbols(elf, True):
             if version and not check_version(MAX_VERSIONS, version, arch):
-                print('%s: symbol %s from unsupported version %s' % (filename, cppfilt(sym), version))
-                retval = 1
+                problems.append(('version', filename, sym, version))
         # Check exported symbols
-        if arch != 'RISC-V':
-            for sym,version,arch in read_symbols(filename, False):
+        if elf.machine_name != 'RISC-V':
+            for sym,version,arch in read_symbols(elf, False):
                 if sym in IGNORE_EXPORTS:
                     continue
-                print('%s: export of symbol %s not allowed' % (filename, cppfilt(sym)))
-                retval = 1
+                problems.append(('export', filename, sym, version))
         # Check dependency libraries
-        for library_name in read_libraries(filename):
+        for library_name in elf.needed_libraries():
             if library_name not in ALLOWED_LIBRARIES:
-                print('%s: NEEDED library %s is not allowed' % (filename, library_name))
-                retval = 1
-
-    sys.exit(retval)
-
+                problems.append(('library', filename, library_name, None))
+    return problems
 
+if __name__ == '__main__':
+    filenames = sys.argv[1:]
+    if len(filenames) > 1:
+        with multiprocessing.Pool(min(len(filenames), os.cpu_count())) as pool:
+            problems = [p for result in pool.map(check_executable, filenames) for p in result]
+    else:
+        problems = [p for filename in filenames for p in check_executable(filename)]
+    # Only start c++filt if there is something to report
+    demangled = iter(demangle([name for (kind, _, name, _) in problems if kind != 'library']))
+    for (kind, filename, name, version) in problems:
+        if kind == 'version':
+            print('%s: symbol %s from unsupported version %s' % (filename, next(demangled), version))
+        elif kind == 'export':
+            print('%s: export of symbol %s not allowed' % (filename, next(demangled)))
+        else:
+            print('%s: NEEDED library %s is not allowed' % (filename, name))
+    sys.exit(1 if problems else 0)
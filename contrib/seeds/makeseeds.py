@@ -10,6 +10,12 @@ import re
 import sys
 import dns.resolver
 import collections
+import heapq
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 NSEEDS=512
 
@@ -100,72 +106,116 @@ def parseline(line):
     }
 
 def filtermultiport(ips):
-    '''Filter out hosts with more nodes per IP'''
-    hist = collections.defaultdict(list)
+    '''Filter out hosts with more nodes per IP.
+
+    Consumes the (already filtered) stream and only keeps one entry per host,
+    so memory is bounded by the number of distinct good hosts rather than the
+    size of the dump.'''
+    hosts = {}
     for ip in ips:
-        hist[ip['sortkey']].append(ip)
-    return [value[0] for (key,value) in list(hist.items()) if len(value)==1]
+        key = (ip['net'], ip['sortkey'])
+        # None marks a host that has been seen on more than one port.
+        hosts[key] = None if key in hosts else ip
+    return [ip for ip in hosts.values() if ip is not None]
+
+def rankkey(ip):
+    '''Min-heap key ranking by availability (last success, then address as
+    tie breakers), highest first.'''
+    # Negated code points plus a trailing sentinel give descending string order.
+    return (-ip['uptime'], -ip['lastsuccess'], tuple(-ord(c) for c in ip['ip']) + (1,))
+
+def lookup_asn(ip):
+    if ip['net'] == 'ipv4':
+        ipaddr = ip['ip']
+        prefix = '.origin'
+    else:                  # http://www.team-cymru.com/IP-ASN-mapping.html
+        res = str()                         # 2001:4860:b002:23::68
+        for nb in ip['ip'].split(':')[:4]:  # pick the first 4 nibbles
+            for c in nb.zfill(4):           # right padded with '0'
+                res += c + '.'              # 2001 4860 b002 0023
+        ipaddr = res.rstrip('.')            # 2.0.0.1.4.8.6.0.b.0.0.2.0.0.2.3
+        prefix = '.origin6'
+
+    return int([x.to_text() for x in dns.resolver.query('.'.join(
+               reversed(ipaddr.split('.'))) + prefix + '.asn.cymru.com',
+               'TXT').response.answer][0].split('\"')[1].split(' ')[0])
 
 # Based on Greg Maxwell's seed_filter.py
 def filterbyasn(ips, max_per_asn, max_total):
     # Sift out ips by type
-    ips_ipv46 = [ip for ip in ips if ip['net'] in ['ipv4', 'ipv6']]
-    ips_onion = [ip for ip in ips if ip['net'] == 'onion']
+    ips_ipv46 = []
+    ips_onion = []
+    for ip in ips:
+        if ip['net'] == 'onion':
+            ips_onion.append(ip)
+        else:
+            ips_ipv46.append((rankkey(ip), len(ips_ipv46), ip))
 
-    # Filter IPv46 by ASN
+    # Filter IPv46 by ASN. Candidates are popped best-first from a heap, so the
+    # ASN of a host is only resolved while there is still room for it.
+    heapq.heapify(ips_ipv46)
     result = []
-    asn_count = {}
-    for ip in ips_ipv46:
-        if len(result) == max_total:
-            break
+    asn_count = collections.Counter()
+    while ips_ipv46 and len(result) < max_total:
+        entry = heapq.heappop(ips_ipv46)
+        ip = entry[2]
         try:
-            if ip['net'] == 'ipv4':
-                ipaddr = ip['ip']
-                prefix = '.origin'
-            else:                  # http://www.team-cymru.com/IP-ASN-mapping.html
-                res = str()                         # 2001:4860:b002:23::68
-                for nb in ip['ip'].split(':')[:4]:  # pick the first 4 nibbles
-                    for c in nb.zfill(4):           # right padded with '0'
-                        res += c + '.'              # 2001 4860 b002 0023
-                ipaddr = res.rstrip('.')            # 2.0.0.1.4.8.6.0.b.0.0.2.0.0.2.3
-                prefix = '.origin6'
-
-            asn = int([x.to_text() for x in dns.resolver.query('.'.join(
-                       reversed(ipaddr.split('.'))) + prefix + '.asn.cymru.com',
-                       'TXT').response.answer][0].split('\"')[1].split(' ')[0])
-            if asn not in asn_count:
-                asn_count[asn] = 0
-            if asn_count[asn] == max_per_asn:
-                continue
-            asn_count[asn] += 1
-            result.append(ip)
+            asn = lookup_asn(ip)
         except:
             sys.stderr.write('ERR: Could not resolve ASN for "' + ip['ip'] + '"\n')
+            continue
+        # Being popped in rank order, the hosts already taken for a full ASN
+        # are the best ones.
+        if asn_count[asn] == max_per_asn:
+            continue
+        asn_count[asn] += 1
+        result.append(ip)
 
     # Add back Onions
     result.extend(ips_onion)
     return result
 
+def filterlines(lines, stats):
+    '''Parse and filter the seeder dump line by line.'''
+    for line in lines:
+        stats['lines'] += 1
+        ip = parseline(line)
+        # Skip entries with valid address.
+        if ip is None:
+            continue
+        # Skip entries from suspicious hosts.
+        if ip['ip'] in SUSPICIOUS_HOSTS:
+            continue
+        # Enforce minimal number of blocks.
+        if ip['blocks'] < MIN_BLOCKS:
+            continue
+        # Require service bit 1.
+        if (ip['service'] & 1) != 1:
+            continue
+        # Require at least 50% 30-day uptime.
+        if ip['uptime'] <= 50:
+            continue
+        # Require a known and recent user agent.
+        if not PATTERN_AGENT.match(ip['agent']):
+            continue
+        stats['candidates'] += 1
+        yield ip
+
+def peak_memory_kib():
+    '''Peak resident set size of this process in KiB, or None if unknown.'''
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in KiB elsewhere.
+    return maxrss // 1024 if sys.platform == 'darwin' else maxrss
+
 def main():
-    lines = sys.stdin.readlines()
-    ips = [parseline(line) for line in lines]
-
-    # Skip entries with valid address.
-    ips = [ip for ip in ips if ip is not None]
-    # Skip entries from suspicious hosts.
-    ips = [ip for ip in ips if ip['ip'] not in SUSPICIOUS_HOSTS]
-    # Enforce minimal number of blocks.
-    ips = [ip for ip in ips if ip['blocks'] >= MIN_BLOCKS]
-    # Require service bit 1.
-    ips = [ip for ip in ips if (ip['service'] & 1) == 1]
-    # Require at least 50% 30-day uptime.
-    ips = [ip for ip in ips if ip['uptime'] > 50]
-    # Require a known and recent user agent.
-    ips = [ip for ip in ips if PATTERN_AGENT.match(ip['agent'])]
-    # Sort by availability (and use last success as tie breaker)
-    ips.sort(key=lambda x: (x['uptime'], x['lastsuccess'], x['ip']), reverse=True)
+    stats = collections.Counter()
+    # The dump is streamed from stdin: only hosts passing the filters are kept.
+    ips = filterlines(sys.stdin, stats)
     # Filter out hosts with multiple defi ports, these are likely abusive
     ips = filtermultiport(ips)
+    stats['hosts'] = len(ips)
     # Look up ASNs and limit results, both per ASN and globally.
     ips = filterbyasn(ips, MAX_SEEDS_PER_ASN, NSEEDS)
     # Sort the results by IP address (for deterministic output).
@@ -177,5 +227,10 @@ def main():
         else:
             print('%s:%i' % (ip['ip'], ip['port']))
 
+    peak = peak_memory_kib()
+    sys.stderr.write('%i lines, %i candidates, %i unique hosts, %i seeds; peak memory %s\n' % (
+        stats['lines'], stats['candidates'], stats['hosts'], len(ips),
+        'unknown' if peak is None else '%i KiB' % peak))
+
 if __name__ == '__main__':
     main()
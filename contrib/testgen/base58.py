@@ -23,30 +23,32 @@ __b58chars = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
 __b58base = len(__b58chars)
 b58chars = __b58chars
 
+# The big integer is converted 10 base58 digits (58**10 < 2**64) at a time, and
+# each chunk two digits at a time through a table of all 58*58 digit pairs, so
+# only one big integer division is done per 10 characters.
+__chunk_digits = 10
+__chunk_base = __b58base ** __chunk_digits
+__pair_base = __b58base ** 2
+__b58pairs = [a + b for a in __b58chars for b in __b58chars]
+__b58values = dict((c, i) for (i, c) in enumerate(__b58chars))
+
 def b58encode(v):
     """ encode v, which is a string of bytes, to base58.
     """
-    long_value = 0
-    for (i, c) in enumerate(v[::-1]):
-        if isinstance(c, str):
-            c = ord(c)
-        long_value += (256**i) * c
-
-    result = ''
-    while long_value >= __b58base:
-        div, mod = divmod(long_value, __b58base)
-        result = __b58chars[mod] + result
-        long_value = div
-    result = __b58chars[long_value] + result
+    v = bytes(v)
+    long_value = int.from_bytes(v, 'big')
+
+    chunks = []
+    while long_value:
+        long_value, chunk = divmod(long_value, __chunk_base)
+        for _ in range(__chunk_digits // 2):
+            chunk, pair = divmod(chunk, __pair_base)
+            chunks.append(__b58pairs[pair])
+    result = ''.join(reversed(chunks)).lstrip(__b58chars[0]) or __b58chars[0]
 
     # Defi does a little leading-zero-compression:
     # leading 0-bytes in the input become leading-1s
-    nPad = 0
-    for c in v:
-        if c == 0:
-            nPad += 1
-        else:
-            break
+    nPad = len(v) - len(v.lstrip(b'\0'))
 
     return (__b58chars[0]*nPad) + result
 
@@ -54,24 +56,18 @@ def b58decode(v, length = None):
     """ decode v into a string of len bytes
     """
     long_value = 0
-    for i, c in enumerate(v[::-1]):
-        pos = __b58chars.find(c)
-        assert pos != -1
-        long_value += pos * (__b58base**i)
-
-    result = bytes()
-    while long_value >= 256:
-        div, mod = divmod(long_value, 256)
-        result = chr(mod) + result
-        long_value = div
-    result = chr(long_value) + result
-
-    nPad = 0
-    for c in v:
-        if c == __b58chars[0]:
-            nPad += 1
-            continue
-        break
+    for i in range(0, len(v), __chunk_digits):
+        chunk = v[i:i + __chunk_digits]
+        chunk_value = 0
+        for c in chunk:
+            pos = __b58values.get(c, -1)
+            assert pos != -1
+            chunk_value = chunk_value * __b58base + pos
+        long_value = long_value * __b58base ** len(chunk) + chunk_value
+
+    result = long_value.to_bytes(max(1, (long_value.bit_length() + 7) // 8), 'big')
+
+    nPad = len(v) - len(v.lstrip(__b58chars[0]))
 
     result = bytes(nPad) + result
     if length is not None and len(result) != length:
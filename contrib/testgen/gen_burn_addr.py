@@ -2,195 +2,171 @@
 # Distributed under the MIT software license, see the accompanying
 # file LICENSE or http://www.opensource.org/licenses/mit-license.php.
 '''
-Defi base58 encoding and decoding.
-
-Based on https://bitcointalk.org/index.php?topic=1026.0 (public domain)
+Generate unspendable (burn) addresses starting with a given string.
+
+The address is the prefix padded with 'X' characters, with a valid checksum in
+place of the last characters. As nobody knows a key hashing to the payload, the
+coins sent to it are lost.
+
+Instead of decoding padded strings until one fits, the range of payloads whose
+address starts with the prefix is computed directly from the base58 value of
+the prefix and the network's version byte. Candidates are then verified in
+batches, starting with the 'X' padded payload, so for prefixes of up to 28
+characters the first candidate is taken and the address is the same as
+generated by earlier versions of this script. Many prefixes are searched in
+parallel.
 '''
 
-import hashlib
+import argparse
+import multiprocessing
 import sys
+import time
 
-# for compatibility with following code...
-class SHA256:
-    new = hashlib.sha256
+from base58 import b58chars, b58decode, b58encode, checksum
 
-if str != bytes:
-    # Python 3.x
-    def ord(c):
-        return c
-    def chr(n):
-        return bytes( (n,) )
+ADDRESS_LENGTH = 34
+PAYLOAD_SIZE = 21
+CHECKSUM_BITS = 32
+PADDING = 'X'
 
-__b58chars = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
-__b58base = len(__b58chars)
-b58chars = __b58chars
+# Version byte of pubkey hash addresses, per network
+NETWORKS = [
+    ('main', 0x12),
+    ('test', 0x0f),
+    ('regtest', 0x6f),
+]
 
 __unusedChars = '0OIl'
 
-def b58encode(v):
-    """ encode v, which is a string of bytes, to base58.
-    """
-    long_value = 0
-    for (i, c) in enumerate(v[::-1]):
-        if isinstance(c, str):
-            c = ord(c)
-        long_value += (256**i) * c
-
-    result = ''
-    while long_value >= __b58base:
-        div, mod = divmod(long_value, __b58base)
-        result = __b58chars[mod] + result
-        long_value = div
-    result = __b58chars[long_value] + result
-
-    # Defi does a little leading-zero-compression:
-    # leading 0-bytes in the input become leading-1s
-    nPad = 0
-    for c in v:
-        if c == 0:
-            nPad += 1
-        else:
-            break
-
-    return (__b58chars[0]*nPad) + result
-
-def b58decode(v, length = None):
-    """ decode v into a string of len bytes
-    """
-    long_value = 0
-    for i, c in enumerate(v[::-1]):
-        pos = __b58chars.find(c)
-        assert pos != -1
-        long_value += pos * (__b58base**i)
-
-    result = bytes()
-    while long_value >= 256:
-        div, mod = divmod(long_value, 256)
-        result = chr(mod) + result
-        long_value = div
-    result = chr(long_value) + result
-
-    nPad = 0
-    for c in v:
-        if c == __b58chars[0]:
-            nPad += 1
-            continue
-        break
-
-    result = bytes(nPad) + result
-    if length is not None and len(result) != length:
-        return None
-
-    return result
-
-def checksum(v):
-    """Return 32-bit checksum based on SHA256"""
-    return SHA256.new(SHA256.new(v).digest()).digest()[0:4]
-
-def b58encode_chk(v):
-    """b58encode a string, with 32-bit checksum"""
-    return b58encode(v + checksum(v))
-
-def b58decode_chk(v):
-    """decode a base58 string, check and remove checksum"""
-    result = b58decode(v)
-    if result is None:
-        print("result is none")
-        return None
-    print("decode result: ", bytes(result).hex())
-    checksumResult = checksum(result[:-4])
-    if result[-4:] == checksumResult:
-        return result[:-4]
-    else:
-        print(bytes(result[-4:]).hex(), "\n")
-        print("check sum result: ", bytes(checksumResult).hex())
-        return None
-
-def get_bcaddress_version(strAddress):
-    """ Returns None if strAddress is invalid.  Otherwise returns integer version of address. """
-    addr = b58decode_chk(strAddress)
-    if addr is None or len(addr)!=21:
+def b58value(v):
+    """Return the integer value of base58 string v"""
+    return int.from_bytes(b58decode(v), 'big')
+
+def payload_range(prefix, version):
+    """Return the (first, last) payload of addresses of version starting with prefix, or None
+
+    A payload p covers the addresses with values p << 32 up to (p + 1) << 32,
+    depending on its checksum, so any payload overlapping the values of the
+    addresses starting with prefix is a candidate."""
+    rest = ADDRESS_LENGTH - len(prefix)
+    low = b58value(prefix + b58chars[0] * rest)
+    high = b58value(prefix + b58chars[-1] * rest)
+    first = max(low >> CHECKSUM_BITS, version << (8 * (PAYLOAD_SIZE - 1)))
+    last = min(high >> CHECKSUM_BITS, ((version + 1) << (8 * (PAYLOAD_SIZE - 1))) - 1)
+    if first > last:
         return None
-    version = addr[0]
-    return ord(version)
+    return first, last
+
+def address_for(payload):
+    data = payload.to_bytes(PAYLOAD_SIZE, 'big')
+    return b58encode(data + checksum(data))
+
+def candidates(prefix, first, last):
+    """Yield candidate payloads, nearest to the 'X' padded prefix first"""
+    anchor = b58value(prefix + PADDING * (ADDRESS_LENGTH - len(prefix))) >> CHECKSUM_BITS
+    anchor = min(max(anchor, first), last)
+    yield anchor
+    for distance in range(1, max(anchor - first, last - anchor) + 1):
+        if anchor + distance <= last:
+            yield anchor + distance
+        if anchor - distance >= first:
+            yield anchor - distance
+
+def search(prefix, version, batch_size=1024):
+    """Return (address, number of candidates tried) for prefix, or (None, tried) if there is none"""
+    bounds = payload_range(prefix, version)
+    if bounds is None:
+        return None, 0
+    tried = 0
+    batch = []
+    for payload in candidates(prefix, *bounds):
+        batch.append(payload)
+        if len(batch) == batch_size:
+            address, checked = verify_batch(prefix, batch)
+            tried += checked
+            if address is not None:
+                return address, tried
+            batch = []
+    address, checked = verify_batch(prefix, batch)
+    return address, tried + checked
+
+def verify_batch(prefix, payloads):
+    """Return the first address of payloads that starts with prefix, and the number of payloads checked"""
+    for checked, address in enumerate(map(address_for, payloads), 1):
+        if len(address) == ADDRESS_LENGTH and address.startswith(prefix):
+            return address, checked
+    return None, len(payloads)
+
+def search_task(task):
+    prefix, network, version = task
+    start = time.time()
+    address, tried = search(prefix, version)
+    return prefix, network, address, tried, time.time() - start
+
+def check_prefix(prefix):
+    """Return an error message if prefix cannot start an address, or None"""
+    if len(prefix) > ADDRESS_LENGTH:
+        return 'Address start string is too long!'
+    if not prefix.isalnum():
+        return 'Address start string containts invalid characters!'
+    if any((c in prefix) for c in __unusedChars):
+        return 'Address start string cannot contain 0OIl'
+    if len(prefix) < 2:
+        return 'The start string is too short'
+    return None
 
 def print_usage():
-    print('Usage of this script(Need python3):')
-    print('python3 ' + sys.argv[0] + ' AddressStartString')
     print('Mainnet address start with string from 8F ~ 8d')
     print('Testnet address start with string from 73 ~ 7R')
     print('Regtest address start with string from mf ~ n4')
     print('The address start string cannot contain these characters: 0OIl')
-    print('For example:')
-    print('  python3 gen_burn_addr.py 8addressForBurn')
-    print('  python3 gen_burn_addr.py 7AddressForBurn')
-
-def check_start_range(fst2):
-    if fst2 >= '73' and fst2 <= '7R':
-        return True
 
-    if fst2 >= '8F' and fst2 <= '8d':
-        return True
-
-    if fst2 >= 'mf' and fst2 <= 'n4':
-        return True
-
-    return False
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog='example: python3 gen_burn_addr.py 8addressForBurn 7AddressForBurn')
+    parser.add_argument('prefixes', nargs='+', metavar='AddressStartString')
+    parser.add_argument('-n', '--network', choices=[name for (name, _) in NETWORKS],
+                        help='only generate addresses for this network (default: every network the prefix fits)')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='do not report progress on stderr')
+    args = parser.parse_args()
+
+    tasks = []
+    for prefix in args.prefixes:
+        error = check_prefix(prefix)
+        if error is not None:
+            print('{}: {}'.format(prefix, error))
+            print_usage()
+            sys.exit(1)
+        fits = [(name, version) for (name, version) in NETWORKS
+                if args.network in (None, name) and payload_range(prefix, version) is not None]
+        if not fits:
+            print('{}: Address start is not correct!'.format(prefix))
+            print_usage()
+            sys.exit(1)
+        tasks.extend((prefix, name, version) for (name, version) in fits)
+
+    if len(tasks) < 2 or args.jobs == 1:
+        results = map(search_task, tasks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(args.jobs)
+        results = pool.imap(search_task, tasks)
+
+    failed = False
+    for i, (prefix, network, address, tried, elapsed) in enumerate(results, 1):
+        if not args.quiet and len(tasks) > 1:
+            print('[{}/{}] {} ({}): {} candidate(s) in {:.2f}s'.format(i, len(tasks), prefix, network, tried, elapsed),
+                  file=sys.stderr)
+        if address is None:
+            print('No {} address starts with {}'.format(network, prefix))
+            failed = True
+        else:
+            print("Generated address: ", address)
+    if pool is not None:
+        pool.close()
+        pool.join()
+    sys.exit(1 if failed else 0)
 
 if __name__ == '__main__':
-    # Check our input parameters for this script
-    if (len(sys.argv) < 2):
-        print_usage()
-        sys.exit(0)
-
-    if (len(sys.argv) > 2):
-        print("Too many input arguments!")
-        print_usage()
-        sys.exit(0)
-
-    if sys.argv[1] == '-h' or sys.argv[1] == '--help':
-        print_usage()
-        sys.exit(0)
-
-    startString = sys.argv[1]
-    if (len(startString) > 28):
-        print('Address start string is too long!')
-        sys.exit(0)
-
-    if not startString.isalnum():
-        print('Address start string containts invalid characters!')
-        sys.exit(0)
-
-    if any((c in startString) for c in __unusedChars):
-        print('Address start string cannot contain 0OIl')
-        sys.exit(0)
-
-    if (len(startString) < 2):
-        print('The start string is too short')
-        sys.exit(0)
-
-    fst2 = startString[0:2]
-    if not check_start_range(fst2):
-        print('Address start is not correct!')
-        print('Mainnet address start with string from 8F ~ 8d')
-        print('Testnet address start with string from 73 ~ 7R')
-        print('Regtest address start with string from mf ~ n4')
-        sys.exit(0)
-
-    anotherString = startString + "X" * (34 - len(startString))
-
-    result = b58decode(anotherString)
-    if result is None:
-        print("result is none")
-        exit(-1)
-
-    checksumResult = checksum(result[:-4])
-
-    mutableResult = bytearray(result)
-    mutableResult[-4] = checksumResult[0]
-    mutableResult[-3] = checksumResult[1]
-    mutableResult[-2] = checksumResult[2]
-    mutableResult[-1] = checksumResult[3]
-
-    finalResult = b58encode(mutableResult)
-    print("Generated address: ", finalResult)
+    main()
@@ -8,9 +8,13 @@ Generate valid and invalid base58 address and private key test vectors.
 Usage:
     PYTHONPATH=../../test/functional/test_framework ./gen_key_io_test_vectors.py valid 50 > ../../src/test/data/key_io_valid.json
     PYTHONPATH=../../test/functional/test_framework ./gen_key_io_test_vectors.py invalid 50 > ../../src/test/data/key_io_invalid.json
+
+Large sets are generated in batches by worker processes (-j N, default: number of CPUs).
 '''
 # 2012 Wladimir J. van der Laan
 # Released under MIT License
+import argparse
+import multiprocessing
 import os
 from itertools import islice
 from base58 import b58encode_chk, b58decode_chk, b58chars
@@ -217,11 +221,12 @@ def randbool(p = 0.5):
     '''Return True with P(p)'''
     return random.random() < p
 
-def gen_invalid_vectors():
+def gen_invalid_vectors(edge_cases=True):
     '''Generate invalid test vectors'''
     # start with some manual edge-cases
-    yield "",
-    yield "x",
+    if edge_cases:
+        yield "",
+        yield "x",
     glist = [gen_invalid_base58_vector, gen_invalid_bech32_vector]
     tlist = [templates, bech32_ng_templates]
     while True:
@@ -230,20 +235,34 @@ def gen_invalid_vectors():
             if not is_valid(val):
                 yield val,
 
+BATCH_SIZE = 1000
+
+def gen_batch(task):
+    '''Generate one batch of vectors in a worker process'''
+    kind, first, count = task
+    # Workers inherit the parent's random state, reseed so batches differ
+    random.seed()
+    if kind == 'valid':
+        return list(islice(gen_valid_vectors(), count))
+    return list(islice(gen_invalid_vectors(edge_cases=first), count))
+
+def gen_vectors(kind, count, jobs=None):
+    '''Generate count vectors of kind ('valid' or 'invalid'), in batches over jobs worker processes'''
+    tasks = [(kind, start == 0, min(BATCH_SIZE, count - start)) for start in range(0, count, BATCH_SIZE)]
+    if len(tasks) < 2 or jobs == 1:
+        return [vector for task in tasks for vector in gen_batch(task)]
+    with multiprocessing.Pool(jobs) as pool:
+        return [vector for batch in pool.imap(gen_batch, tasks) for vector in batch]
+
 if __name__ == '__main__':
     import sys
     import json
-    iters = {'valid':gen_valid_vectors, 'invalid':gen_invalid_vectors}
-    try:
-        uiter = iters[sys.argv[1]]
-    except IndexError:
-        uiter = gen_valid_vectors
-    try:
-        count = int(sys.argv[2])
-    except IndexError:
-        count = 0
-
-    data = list(islice(uiter(), count))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('kind', nargs='?', choices=['valid', 'invalid'], default='valid')
+    parser.add_argument('count', nargs='?', type=int, default=0)
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='number of worker processes (default: number of CPUs)')
+    args = parser.parse_args()
+
+    data = gen_vectors(args.kind, args.count, args.jobs)
     json.dump(data, sys.stdout, sort_keys=True, indent=4)
     sys.stdout.write('\n')
-
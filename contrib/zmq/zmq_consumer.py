@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+# Copyright (c) 2014-2018 The Bitcoin Core developers
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+
+"""
+    ZMQ consumer library for defid notifications
+
+    Unlike zmq_sub.py, which is a minimal example, this module is meant to be
+    imported by indexers and other services that have to keep up with defid:
+
+    - messages are drained from the socket in batches rather than one
+      coroutine per message,
+    - `rawtx` and `rawblock` bodies are decoded into `CTransaction` and
+      `CBlock` from the functional test framework,
+    - sequence numbers are tracked per topic and gaps (dropped messages) are
+      counted,
+    - notifications are fanned out to any number of sinks, each behind its own
+      bounded queue, and queue pressure is recorded per sink.
+
+    Example:
+
+        consumer = ZMQConsumer("tcp://127.0.0.1:28554")
+        consumer.add_sink(PrintSink())
+        consumer.run()
+
+    Running this file directly subscribes to all topics and prints them, with
+    a metrics summary on exit. Defi should be started with the same arguments
+    as for zmq_sub.py.
+"""
+
+import argparse
+import asyncio
+import collections
+import os
+import signal
+import struct
+import sys
+import time
+from io import BytesIO
+
+import zmq
+import zmq.asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../test/functional'))
+
+from test_framework.messages import CBlock, CTransaction  # noqa: E402
+
+if (sys.version_info.major, sys.version_info.minor) < (3, 5):
+    print("This library only works with Python 3.5 and greater")
+    sys.exit(1)
+
+TOPICS = ("hashblock", "hashtx", "rawblock", "rawtx")
+SEQUENCE_MODULUS = 1 << 32
+
+Notification = collections.namedtuple('Notification', ['topic', 'sequence', 'body', 'decoded', 'received'])
+
+
+def decode_body(topic, body):
+    """Decode a notification body according to its topic.
+
+    Hashes are returned as hex strings in the usual (reversed) display order,
+    raw transactions and blocks as deserialized framework objects with their
+    hashes computed."""
+    if topic in ("hashblock", "hashtx"):
+        return body.hex()
+    if topic == "rawtx":
+        tx = CTransaction()
+        tx.deserialize(BytesIO(body))
+        tx.calc_sha256()
+        return tx
+    if topic == "rawblock":
+        block = CBlock()
+        block.deserialize(BytesIO(body))
+        block.calc_sha256()
+        return block
+    return None
+
+
+class SequenceTracker():
+    """Detects gaps in the per-topic sequence numbers published by defid.
+
+    Sequence numbers are 32 bit and wrap around. The first message seen on a
+    topic only establishes the baseline."""
+    def __init__(self):
+        self.last = {}
+        self.gaps = collections.Counter()
+        self.missed = collections.Counter()
+
+    def check(self, topic, sequence):
+        """Record a sequence number and return how many messages were missed before it."""
+        last = self.last.get(topic)
+        self.last[topic] = sequence
+        if last is None:
+            return 0
+        missed = (sequence - last - 1) % SEQUENCE_MODULUS
+        if missed:
+            self.gaps[topic] += 1
+            self.missed[topic] += missed
+        return missed
+
+
+class Sink():
+    """Base class for notification consumers.
+
+    `process` is called with a non-empty list of notifications taken from the
+    sink's queue in one go. Override `on_gap` to react to dropped messages."""
+    def __init__(self, name=None):
+        self.name = name or type(self).__name__
+
+    async def process(self, notifications):
+        raise NotImplementedError
+
+    def on_gap(self, topic, missed):
+        pass
+
+
+class PrintSink(Sink):
+    """Prints notifications in the same format as zmq_sub.py."""
+    async def process(self, notifications):
+        for n in notifications:
+            sequence = "Unknown" if n.sequence is None else str(n.sequence)
+            if n.topic == "hashblock":
+                print('- HASH BLOCK (' + sequence + ') -')
+                print(n.decoded)
+            elif n.topic == "hashtx":
+                print('- HASH TX  (' + sequence + ') -')
+                print(n.decoded)
+            elif n.decoded is None:
+                print('- UNDECODED %s (%s) -' % (n.topic.upper(), sequence))
+                print(n.body.hex())
+            elif n.topic == "rawblock":
+                print('- RAW BLOCK (' + sequence + ') -')
+                print('%s height=%d txs=%d' % (n.decoded.hash, n.decoded.nHeight, len(n.decoded.vtx)))
+            elif n.topic == "rawtx":
+                print('- RAW TX (' + sequence + ') -')
+                print('%s vin=%d vout=%d' % (n.decoded.hash, len(n.decoded.vin), len(n.decoded.vout)))
+
+    def on_gap(self, topic, missed):
+        print('- GAP: %d %s message(s) missed -' % (missed, topic))
+
+
+class SinkMetrics():
+    """Backpressure metrics of a single sink queue."""
+    __slots__ = ("enqueued", "processed", "dropped", "batches", "stalls", "stall_time", "max_depth", "errors")
+
+    def __init__(self):
+        self.enqueued = 0
+        self.processed = 0
+        self.dropped = 0
+        self.batches = 0
+        # Number of times, and total seconds, the consumer waited for room in the queue.
+        self.stalls = 0
+        self.stall_time = 0.0
+        self.max_depth = 0
+        self.errors = 0
+
+    def as_dict(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+
+class _SinkWorker():
+    def __init__(self, sink, maxsize, drop, batch_size):
+        self.sink = sink
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.drop = drop
+        self.batch_size = batch_size
+        self.metrics = SinkMetrics()
+        self.task = None
+
+    async def put(self, notification):
+        m = self.metrics
+        if self.queue.full():
+            if self.drop:
+                m.dropped += 1
+                return
+            m.stalls += 1
+            start = time.monotonic()
+            await self.queue.put(notification)
+            m.stall_time += time.monotonic() - start
+        else:
+            self.queue.put_nowait(notification)
+        m.enqueued += 1
+        m.max_depth = max(m.max_depth, self.queue.qsize())
+
+    async def run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self.sink.process(batch)
+            except Exception as e:
+                self.metrics.errors += 1
+                print('ERR: sink %s failed: %r' % (self.sink.name, e), file=sys.stderr)
+            self.metrics.batches += 1
+            self.metrics.processed += len(batch)
+            for _ in batch:
+                self.queue.task_done()
+
+
+class ZMQConsumer():
+    """Subscribes to defid notifications and dispatches them to sinks.
+
+    Args:
+        address: ZMQ endpoint defid publishes on.
+        topics: topics to subscribe to.
+        batch_size: maximum number of messages drained from the socket (and
+            handed to a sink) at once.
+        queue_size: capacity of each sink queue.
+        drop: if set, notifications for a full sink queue are dropped instead
+            of stalling the consumer (and eventually defid's high water mark).
+        decode: decode raw transactions and blocks before dispatching.
+    """
+    def __init__(self, address, topics=TOPICS, batch_size=256, queue_size=10000, drop=False, decode=True, loop=None):
+        self.loop = loop or asyncio.get_event_loop()
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.drop = drop
+        self.decode = decode
+        self.sequences = SequenceTracker()
+        self.received = collections.Counter()
+        self.received_bytes = collections.Counter()
+        self.decode_errors = collections.Counter()
+        self.batches = 0
+        self.started = None
+        self._workers = []
+        self._task = None
+
+        self.zmqContext = zmq.asyncio.Context()
+        self.zmqSubSocket = self.zmqContext.socket(zmq.SUB)
+        self.zmqSubSocket.setsockopt(zmq.RCVHWM, 0)
+        for topic in topics:
+            self.zmqSubSocket.setsockopt_string(zmq.SUBSCRIBE, topic)
+        self.zmqSubSocket.connect(address)
+
+    def add_sink(self, sink):
+        self._workers.append(_SinkWorker(sink, self.queue_size, self.drop, self.batch_size))
+        return sink
+
+    async def _receive_batch(self):
+        """Wait for one message, then drain whatever else is already queued on the socket."""
+        batch = [await self.zmqSubSocket.recv_multipart()]
+        while len(batch) < self.batch_size and self.zmqSubSocket.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+            batch.append(await self.zmqSubSocket.recv_multipart())
+        return batch
+
+    def _notification(self, msg, received):
+        topic = msg[0].decode()
+        body = msg[1]
+        sequence = None
+        if len(msg[-1]) == 4:
+            sequence = struct.unpack('<I', msg[-1])[-1]
+        self.received[topic] += 1
+        self.received_bytes[topic] += len(body)
+        decoded = None
+        if self.decode:
+            try:
+                decoded = decode_body(topic, body)
+            except Exception:
+                self.decode_errors[topic] += 1
+        return Notification(topic, sequence, body, decoded, received)
+
+    async def consume(self):
+        for worker in self._workers:
+            worker.task = self.loop.create_task(worker.run())
+        self.started = time.monotonic()
+        while True:
+            batch = await self._receive_batch()
+            self.batches += 1
+            received = time.time()
+            for msg in batch:
+                n = self._notification(msg, received)
+                if n.sequence is not None:
+                    missed = self.sequences.check(n.topic, n.sequence)
+                    if missed:
+                        for worker in self._workers:
+                            worker.sink.on_gap(n.topic, missed)
+                for worker in self._workers:
+                    await worker.put(n)
+
+    def metrics(self):
+        """Snapshot of consumer and per-sink metrics."""
+        elapsed = time.monotonic() - self.started if self.started else 0.0
+        total = sum(self.received.values())
+        return {
+            "elapsed": elapsed,
+            "received": dict(self.received),
+            "received_bytes": dict(self.received_bytes),
+            "rate": total / elapsed if elapsed else 0.0,
+            "batches": self.batches,
+            "gaps": dict(self.sequences.gaps),
+            "missed": dict(self.sequences.missed),
+            "decode_errors": dict(self.decode_errors),
+            "sinks": {w.sink.name: dict(w.metrics.as_dict(), depth=w.queue.qsize()) for w in self._workers},
+        }
+
+    def start(self):
+        self._task = self.loop.create_task(self.consume())
+        return self._task
+
+    def run(self):
+        self.loop.add_signal_handler(signal.SIGINT, self.stop)
+        self.start()
+        self.loop.run_forever()
+
+    def stop(self):
+        for task in [self._task] + [w.task for w in self._workers]:
+            if task is not None:
+                task.cancel()
+        self.loop.stop()
+        self.zmqContext.destroy()
+
+
+def print_metrics(metrics):
+    print('Received %d messages in %.1fs (%.1f/s, %d batches)' % (
+        sum(metrics["received"].values()), metrics["elapsed"], metrics["rate"], metrics["batches"]), file=sys.stderr)
+    for topic, count in sorted(metrics["received"].items()):
+        print('  %-10s %8d msgs %12d bytes, %d gaps (%d missed), %d decode errors' % (
+            topic, count, metrics["received_bytes"].get(topic, 0), metrics["gaps"].get(topic, 0),
+            metrics["missed"].get(topic, 0), metrics["decode_errors"].get(topic, 0)), file=sys.stderr)
+    for name, m in sorted(metrics["sinks"].items()):
+        print('  sink %s: %d processed in %d batches, %d dropped, %d stalls (%.3fs), max depth %d, %d errors' % (
+            name, m["processed"], m["batches"], m["dropped"], m["stalls"], m["stall_time"], m["max_depth"], m["errors"]), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--address', default='tcp://127.0.0.1:28554', help='ZMQ endpoint to subscribe to (default: %(default)s)')
+    parser.add_argument('--topic', action='append', choices=TOPICS, help='topic to subscribe to (default: all)')
+    parser.add_argument('--batch-size', type=int, default=256, help='maximum number of messages handled at once (default: %(default)s)')
+    parser.add_argument('--queue-size', type=int, default=10000, help='capacity of each sink queue (default: %(default)s)')
+    parser.add_argument('--drop', action='store_true', help='drop notifications when a sink queue is full instead of stalling')
+    args = parser.parse_args()
+
+    consumer = ZMQConsumer(args.address, topics=args.topic or TOPICS, batch_size=args.batch_size,
+                           queue_size=args.queue_size, drop=args.drop)
+    consumer.add_sink(PrintSink())
+    try:
+        consumer.run()
+    finally:
+        print_metrics(consumer.metrics())
+
+
+if __name__ == '__main__':
+    main()
@@ -18,6 +18,10 @@
     loop having an empty stack of futures, this creates an infinite loop.  An
     alternative is to wrap the contents of `handle` inside `while True`.
 
+    For a library that drains messages in batches, decodes raw transactions
+    and blocks, detects sequence gaps and fans out to several consumers, see
+    zmq_consumer.py.
+
     A blocking example using python 2.7 can be obtained from the git history:
     https://github.com/bitcoin/bitcoin/blob/37a7fe9e440b83e2364d5498931253937abe9294/contrib/zmq/zmq_sub.py
 """
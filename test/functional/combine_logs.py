@@ -4,13 +4,25 @@
 This streams the combined log output to stdout. Use combine_logs.py > outputfile
 to write to an outputfile.
 
-If no argument is provided, the most recent test directory will be used."""
+If no argument is provided, the most recent test directory will be used.
+
+Large logs are parsed in chunks on a process pool (see --jobs). With --json,
+events are written as JSON lines with the node, thread and category split out,
+and --node/--category select the events to output.
+
+The first pass over a log file writes a sparse time index next to it
+(<logfile>.idx). Later runs use it to seek to --start or to the last --tail
+events without reading the whole file, and only parse what has been appended
+since to extend it."""
 
 import argparse
-from collections import defaultdict, namedtuple
+import bisect
+from collections import defaultdict, deque, namedtuple
 import glob
 import heapq
 import itertools
+import json
+import multiprocessing
 import os
 import pathlib
 import re
@@ -26,8 +38,24 @@ TMPDIR_PREFIX = "defi_func_test_"
 # Matches on the date format at the start of the log event
 TIMESTAMP_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{6})?Z")
 
+# Split the first line of a node or test framework log event into its parts
+NODE_EVENT_PATTERN = re.compile(r"^\S+(?: \(mocktime: (?P<mocktime>[^)]*)\))? (?:\[(?P<thread>[^\]]*)\] )?(?P<message>.*)$")
+TEST_EVENT_PATTERN = re.compile(r"^\S+ (?P<logger>\S+) \((?P<level>[A-Z]+)\): (?P<message>.*)$")
+# Matches a `Name: ` prefix of a node log message
+CATEGORY_PATTERN = re.compile(r"^(\w+): ")
+
 LogEvent = namedtuple('LogEvent', ['timestamp', 'source', 'event'])
 
+# Index sidecar format version and number of events between index checkpoints.
+INDEX_VERSION = 1
+INDEX_STRIDE = 1000
+
+# Logs are split into chunks of at least this many bytes for parallel parsing.
+MIN_CHUNK_SIZE = 4 * 1024 * 1024
+
+# Prefix for continuation lines, equivalent to the source + timestamp so log lines are aligned
+CONTINUATION_PREFIX = " " * 35
+
 def main():
     """Main function. Parses args, reads the log files and renders them as text or html."""
     parser = argparse.ArgumentParser(
@@ -38,10 +66,17 @@ def main():
               'Defaults to the most recent'))
     parser.add_argument('-c', '--color', dest='color', action='store_true', help='outputs the combined log with events colored by source (requires posix terminal colors. Use less -r for viewing)')
     parser.add_argument('--html', dest='html', action='store_true', help='outputs the combined log as html. Requires jinja2. pip install jinja2')
+    parser.add_argument('--start', help='only output events at or after this time (e.g. 2020-01-01T10:00:00)')
+    parser.add_argument('--end', help='only output events at or before this time (a prefix matches, e.g. 2020-01-01T10:00)')
+    parser.add_argument('--tail', type=int, metavar='n', help='only output the last n events')
+    parser.add_argument('--json', dest='json', action='store_true', help='outputs one JSON object per event, with timestamp, source, node, thread, category, level, mocktime and message fields')
+    parser.add_argument('--node', dest='nodes', action='append', metavar='node', help='only output events from this node (a number, or "test" for the test framework log). Can be given multiple times')
+    parser.add_argument('--category', dest='categories', action='append', metavar='category', help='only output events of this category (e.g. UpdateTip, or TestFramework.node0). Can be given multiple times')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help='number of processes used to parse large logs (default: %(default)s)')
     args = parser.parse_args()
 
-    if args.html and args.color:
-        print("Only one out of --color or --html should be specified")
+    if sum([args.html, args.color, args.json]) > 1:
+        print("Only one out of --color, --html or --json should be specified")
         sys.exit(1)
 
     testdir = args.testdir or find_latest_test_dir()
@@ -62,20 +97,28 @@ def main():
         colors["node3"] = "\033[0;33m"  # YELLOW
         colors["reset"] = "\033[0m"  # Reset font color
 
-    log_events = read_logs(testdir)
+    sources = None
+    if args.nodes:
+        sources = {"node" + n if n.isdigit() else n for n in args.nodes}
+    keep = EventFilter(args.categories) if args.categories else None
+    log_events = read_logs(testdir, start=args.start, end=args.end, tail=args.tail,
+                           sources=sources, keep=keep, jobs=args.jobs)
 
     if args.html:
         print_logs_html(log_events)
+    elif args.json:
+        print_logs_json(log_events)
     else:
         print_logs_plain(log_events, colors)
         print_node_warnings(testdir, colors)
 
 
-def read_logs(tmp_dir):
+def read_logs(tmp_dir, *, start=None, end=None, tail=None, sources=None, keep=None, jobs=1):
     """Reads log files.
 
     Delegates to generator function get_log_events() to provide individual log events
-    for each of the input log files."""
+    for each of the input log files, or to read_logs_parallel() if there is
+    enough to parse to be worth using `jobs` processes."""
 
     # Find out what the folder is called that holds the debug.log file
     chain = glob.glob("{}/node0/*/debug.log".format(tmp_dir))
@@ -91,8 +134,18 @@ def read_logs(tmp_dir):
         if not os.path.isfile(logfile):
             break
         files.append(("node%d" % i, logfile))
+    if sources is not None:
+        files = [(source, f) for source, f in files if source in sources]
+
+    total = sum(os.path.getsize(f) for _, f in files if os.path.isfile(f))
+    if tail is None and jobs > 1 and total > MIN_CHUNK_SIZE:
+        return read_logs_parallel(files, start=start, end=end, keep=keep, jobs=jobs)
 
-    return heapq.merge(*[get_log_events(source, f) for source, f in files])
+    log_events = heapq.merge(*[get_log_events(source, f, start=start, end=end, tail=tail, keep=keep) for source, f in files])
+    if tail is not None:
+        # Each file yields at least its own last `tail` (matching) events, so these are the last `tail` overall.
+        return iter(deque(log_events, tail))
+    return log_events
 
 
 def print_node_warnings(tmp_dir, colors):
@@ -137,39 +190,279 @@ def find_latest_test_dir():
     return max(testdir_paths, key=os.path.getmtime) if testdir_paths else None
 
 
-def get_log_events(source, logfile):
+def index_path(logfile):
+    return logfile + ".idx"
+
+
+def load_index(logfile, size):
+    """Load the index sidecar of a log file.
+
+    Returns a fresh index if there is none, or if it doesn't describe a prefix
+    of the current file."""
+    try:
+        with open(index_path(logfile), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index["version"] == INDEX_VERSION and index["stride"] == INDEX_STRIDE and index["size"] <= size:
+            return index
+    except (OSError, ValueError, KeyError):
+        pass
+    # checkpoints: [timestamp, byte offset] of every INDEX_STRIDE-th event, starting with the first.
+    # last: [event number, byte offset] of the last event, where indexing resumes if the file grows.
+    return {"version": INDEX_VERSION, "stride": INDEX_STRIDE, "size": 0, "events": 0, "checkpoints": [], "last": [0, 0]}
+
+
+def write_index(logfile, index):
+    tmp = index_path(logfile) + ".tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp, index_path(logfile))
+    except OSError:
+        print("Could not write index for %s. Continuing without it." % logfile, file=sys.stderr)
+
+
+def seek_position(index, start, end, tail):
+    """Return (event number, byte offset) of the checkpoint to start reading from."""
+    checkpoints = index["checkpoints"]
+    k = 0
+    if tail is not None and end is None:
+        # The last checkpoint that still has `tail` events after it.
+        k = max((index["events"] - tail) // INDEX_STRIDE, 0)
+    elif start is not None:
+        # The checkpoint before the first one at or after `start`; events in a
+        # file are only roughly ordered, so step back one more.
+        k = max(bisect.bisect_left([c[0] for c in checkpoints], start) - 2, 0)
+    # Never start past the resume point, so that growth gets indexed.
+    k = min(k, len(checkpoints) - 1, index["last"][0] // INDEX_STRIDE)
+    if k <= 0:
+        return 0, 0
+    return k * INDEX_STRIDE, checkpoints[k][1]
+
+
+def get_log_events(source, logfile, *, start=None, end=None, tail=None, keep=None):
     """Generator function that returns individual log events.
 
-    Log events may be split over multiple lines. We use the timestamp
-    regex match as the marker for a new log event."""
+    Reading starts at the latest index checkpoint that allows honouring
+    `start` and, without `keep`, `tail`, and stops after `end`. Events for which `keep`
+    returns False are skipped. Whenever the end of the file is reached, the
+    index is brought up to date."""
     try:
-        with open(logfile, 'r', encoding='utf-8') as infile:
-            event = ''
-            timestamp = ''
-            for line in infile:
-                # skip blank lines
-                if line == '\n':
-                    continue
-                # if this line has a timestamp, it's the start of a new log event.
-                time_match = TIMESTAMP_PATTERN.match(line)
-                if time_match:
-                    if event:
-                        yield LogEvent(timestamp=timestamp, source=source, event=event.rstrip())
-                    timestamp = time_match.group()
-                    if time_match.group(1) is None:
-                        # timestamp does not have microseconds. Add zeroes.
-                        timestamp_micro = timestamp.replace("Z", ".000000Z")
-                        line = line.replace(timestamp, timestamp_micro)
-                        timestamp = timestamp_micro
-                    event = line
-                # if it doesn't have a timestamp, it's a continuation line of the previous log.
-                else:
-                    # Add the line. Prefix with space equivalent to the source + timestamp so log lines are aligned
-                    event += "                                   " + line
-            # Flush the final event
-            yield LogEvent(timestamp=timestamp, source=source, event=event.rstrip())
+        infile = open(logfile, 'rb')
     except FileNotFoundError:
         print("File %s could not be opened. Continuing without it." % logfile, file=sys.stderr)
+        return
+    with infile:
+        index = load_index(logfile, os.fstat(infile.fileno()).st_size)
+        checkpoints = index["checkpoints"]
+        # Checkpoints count all events, so with a filter there is no telling
+        # how far back the last `tail` matching ones start.
+        event_no, offset = seek_position(index, start, end, tail if keep is None else None)
+        infile.seek(offset)
+
+        # Number of events started so far; the current one is event_no - 1.
+        event_no -= 1
+        event_offset = offset
+        for timestamp, event_offset, lines in read_events(infile, offset):
+            if end is not None and timestamp[:len(end)] > end:
+                return
+            event_no += 1
+            if event_no % INDEX_STRIDE == 0 and event_no // INDEX_STRIDE == len(checkpoints):
+                checkpoints.append([timestamp, event_offset])
+            if start is not None and timestamp < start:
+                continue
+            event = LogEvent(timestamp=timestamp, source=source, event="".join(lines).rstrip())
+            if keep is None or keep(event):
+                yield event
+        size = infile.tell()
+        if size != index["size"]:
+            index["size"] = size
+            index["events"] = event_no + 1
+            index["last"] = [max(event_no, 0), event_offset]
+            write_index(logfile, index)
+
+
+def read_events(infile, offset):
+    """Generator function that returns (timestamp, byte offset, lines) of raw log events.
+
+    Log events may be split over multiple lines. We use the timestamp
+    regex match as the marker for a new log event. `infile` must be a binary
+    file positioned at `offset`, which is the start of an event."""
+    lines = []
+    timestamp = ''
+    event_offset = offset
+    for raw in infile:
+        line_offset = offset
+        offset += len(raw)
+        line = raw.decode('utf-8').replace('\r\n', '\n')
+        # skip blank lines
+        if line == '\n':
+            continue
+        # if this line has a timestamp, it's the start of a new log event.
+        time_match = TIMESTAMP_PATTERN.match(line)
+        if time_match:
+            if lines:
+                yield timestamp, event_offset, lines
+            timestamp = time_match.group()
+            if time_match.group(1) is None:
+                # timestamp does not have microseconds. Add zeroes.
+                timestamp_micro = timestamp.replace("Z", ".000000Z")
+                line = line.replace(timestamp, timestamp_micro)
+                timestamp = timestamp_micro
+            event_offset = line_offset
+            lines = [line]
+        # if it doesn't have a timestamp, it's a continuation line of the previous log.
+        else:
+            if not lines:
+                # Lines before the first timestamp form an event of their own.
+                event_offset = line_offset
+            lines.append(CONTINUATION_PREFIX + line)
+    # Flush the final event
+    if lines:
+        yield timestamp, event_offset, lines
+
+
+def align_to_event(infile, offset):
+    """Position `infile` at the first event starting at or after `offset` and return its offset."""
+    if offset == 0:
+        infile.seek(0)
+        return 0
+    # Complete the line `offset` falls into, unless it is at the start of one.
+    infile.seek(offset - 1)
+    if infile.read(1) != b'\n':
+        infile.readline()
+    while True:
+        offset = infile.tell()
+        raw = infile.readline()
+        if not raw or TIMESTAMP_PATTERN.match(raw.decode('utf-8')):
+            infile.seek(offset)
+            return offset
+
+
+def parse_chunk(source, logfile, begin, stop, start, end, keep, positions):
+    """Parse the events of a log file that start in the byte range [begin, stop).
+
+    Runs in a worker process. Returns the matching events and, if `positions`
+    is set, (timestamp, offset) of every event in the range for indexing."""
+    events = []
+    event_positions = []
+    with open(logfile, 'rb') as infile:
+        offset = align_to_event(infile, begin)
+        for timestamp, event_offset, lines in read_events(infile, offset):
+            if event_offset >= stop or (end is not None and timestamp[:len(end)] > end):
+                break
+            if positions:
+                event_positions.append((timestamp, event_offset))
+            if start is not None and timestamp < start:
+                continue
+            event = LogEvent(timestamp=timestamp, source=source, event="".join(lines).rstrip())
+            if keep is None or keep(event):
+                events.append(event)
+    return events, event_positions
+
+
+def plan_chunks(logfile, index, size, start, end, chunk_size):
+    """Split the part of a log file that may hold events in [start, end] into byte ranges."""
+    begin = seek_position(index, start, end, None)[1]
+    stop = size
+    checkpoints = index["checkpoints"]
+    if end is not None and checkpoints:
+        # Two checkpoints past the first one after `end`, as events are only roughly ordered.
+        k = bisect.bisect_right([c[0][:len(end)] for c in checkpoints], end) + 2
+        if k < len(checkpoints):
+            stop = checkpoints[k][1]
+    bounds = list(range(begin, stop, chunk_size)) + [stop]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def update_index(logfile, index, size, positions):
+    """Rebuild an index from the positions of all events in a file."""
+    index["checkpoints"] = [[timestamp, offset] for timestamp, offset in positions[::INDEX_STRIDE]]
+    index["size"] = size
+    index["events"] = len(positions)
+    index["last"] = [max(len(positions) - 1, 0), positions[-1][1] if positions else 0]
+    write_index(logfile, index)
+
+
+def read_logs_parallel(files, *, start, end, keep, jobs):
+    """Parse log files in byte-range chunks on a process pool and k-way merge the results.
+
+    Each chunk is parsed independently; chunks of one file are consumed in
+    order, so every file still yields its events in file order."""
+    plans = []
+    for source, logfile in files:
+        try:
+            size = os.path.getsize(logfile)
+        except OSError:
+            print("File %s could not be opened. Continuing without it." % logfile, file=sys.stderr)
+            continue
+        index = load_index(logfile, size)
+        plans.append((source, logfile, size, index))
+    total = sum(size for _, _, size, _ in plans)
+    chunk_size = max(MIN_CHUNK_SIZE, total // (jobs * 4) + 1)
+
+    with multiprocessing.Pool(jobs) as pool:
+        def file_events(source, logfile, size, index):
+            # Only a full pass over a file that has changed can refresh its index.
+            positions = start is None and end is None and index["size"] != size
+            chunks = plan_chunks(logfile, index, size, start, end, chunk_size)
+            results = [pool.apply_async(parse_chunk, (source, logfile, begin, stop, start, end, keep, positions))
+                       for begin, stop in chunks]
+            all_positions = []
+            for result in results:
+                events, chunk_positions = result.get()
+                all_positions.extend(chunk_positions)
+                yield from events
+            if positions:
+                update_index(logfile, index, size, all_positions)
+
+        yield from heapq.merge(*[file_events(*plan) for plan in plans])
+
+
+class EventFilter():
+    """Picklable predicate selecting log events by category."""
+
+    def __init__(self, categories):
+        self.categories = {c.lower() for c in categories}
+
+    def __call__(self, event):
+        return (event_fields(event)["category"] or '').lower() in self.categories
+
+
+def event_fields(event):
+    """Split a log event into structured fields.
+
+    Node logs carry the thread name (-logthreadnames) but no log category;
+    the category is taken from the `Name: ` prefix most messages start with
+    (e.g. `UpdateTip`). For the test framework log it is the logger name."""
+    first, _, rest = event.event.partition('\n')
+    fields = {
+        "timestamp": event.timestamp,
+        "source": event.source,
+        "node": int(event.source[4:]) if event.source.startswith("node") else None,
+        "thread": None,
+        "category": None,
+        "level": None,
+        "mocktime": None,
+        "message": None,
+    }
+    if event.source == "test":
+        match = TEST_EVENT_PATTERN.match(first)
+        if match:
+            fields["category"] = match.group("logger")
+            fields["level"] = match.group("level")
+    else:
+        match = NODE_EVENT_PATTERN.match(first)
+        if match:
+            fields["thread"] = match.group("thread")
+            fields["mocktime"] = match.group("mocktime")
+            category = CATEGORY_PATTERN.match(match.group("message"))
+            if category:
+                fields["category"] = category.group(1)
+    message = match.group("message") if match else first[len(event.timestamp):].lstrip()
+    if rest:
+        message += '\n' + '\n'.join(line[len(CONTINUATION_PREFIX):] for line in rest.split('\n'))
+    fields["message"] = message
+    return fields
 
 
 def print_logs_plain(log_events, colors):
@@ -182,6 +475,12 @@ def print_logs_plain(log_events, colors):
                 print("{0}{1}{2}".format(colors[event.source.rstrip()], line, colors["reset"]))
 
 
+def print_logs_json(log_events):
+    """Renders the iterator of log events as JSON lines."""
+    for event in log_events:
+        print(json.dumps(event_fields(event)))
+
+
 def print_logs_html(log_events):
     """Renders the iterator of log events into html."""
     try:
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+"""Stress the DFIP2203 futures settlement block.
+
+Sets up DUSD and --tokens dTokens with oracle prices as feature_futures.py
+does, with a futures period just long enough to queue --swaps futureswap
+entries from --addresses addresses, half of them dToken to DUSD and half
+DUSD to dToken. All of them are settled in the same block.
+
+Measured: the latency of futureswap, of listpendingfutureswaps and
+getpendingfutureswaps with all swaps pending and after settlement, and the
+time to connect the settlement block from the debug log, along with the
+node's RSS before and after it (and its peak during it with
+--resourceinterval).
+
+Run e.g. with
+    feature_futures_bench.py --swaps 20000 --addresses 500 --tokens 8 --resourceinterval 0.1 --benchmarkoutput futures.json
+"""
+
+import random
+
+from test_framework.benchmark import DefiBenchmarkFramework
+from test_framework.resource_sampler import peak
+from test_framework.util import assert_equal
+
+
+class FuturesBenchmark(DefiBenchmarkFramework):
+    def set_test_params(self):
+        self.num_nodes = 1
+        self.setup_clean_chain = True
+        self.extra_args = [['-txnotokens=0', '-amkheight=1', '-bayfrontheight=1', '-eunosheight=1', '-fortcanningheight=1', '-fortcanninghillheight=1', '-fortcanningroadheight=150', '-subsidytest=1']]
+        self.FORK_HEIGHT = 150
+        self.PRICE = 100
+
+    def add_benchmark_options(self, parser):
+        parser.add_argument("--swaps", dest="swaps", default=1000, type=int,
+                            help="number of futureswap entries settled in one block (default: %(default)s)")
+        parser.add_argument("--addresses", dest="addresses", default=50, type=int,
+                            help="number of swapping addresses, each submitting one swap per block (default: %(default)s)")
+        parser.add_argument("--tokens", dest="tokens", default=4, type=int,
+                            help="number of dTokens (default: %(default)s)")
+        parser.add_argument("--queries", dest="queries", default=20, type=int,
+                            help="calls per measured query (default: %(default)s)")
+
+    def setup_tokens(self):
+        node = self.nodes[0]
+        self.owner = node.get_genesis_keys().ownerAuthAddress
+        self.symbols = ["FUT" + str(i) for i in range(self.options.tokens)]
+
+        self.setup_oracle([(symbol, self.PRICE) for symbol in ["DFI"] + self.symbols])
+        node.generate(10)
+
+        self.setup_loan_token("DUSD", interest=0)
+        for symbol in self.symbols:
+            self.setup_loan_token(symbol)
+        node.generate(1)
+        self.token_ids = {symbol: list(node.gettoken(symbol).keys())[0] for symbol in ["DUSD"] + self.symbols}
+
+        # Every address gets enough of each token for all its swaps
+        swaps_per_address = -(-self.options.swaps // self.options.addresses)
+        amount = swaps_per_address * self.PRICE * 2
+        node.minttokens(["{}@{}".format(amount * self.options.addresses, symbol) for symbol in ["DUSD"] + self.symbols])
+        node.generate(1)
+
+        self.addresses = [node.getnewaddress("", "legacy") for _ in range(self.options.addresses)]
+        self.send_tokens(self.owner, self.addresses, ["{}@{}".format(amount, symbol) for symbol in ["DUSD"] + self.symbols])
+
+    def setup_futures(self, period):
+        node = self.nodes[0]
+        node.generate(max(0, self.FORK_HEIGHT - node.getblockcount()))
+        node.setgov({"ATTRIBUTES": {'v0/params/dfip2203/reward_pct': '0.05', 'v0/params/dfip2203/block_period': str(period)}})
+        node.generate(1)
+        node.setgov({"ATTRIBUTES": {'v0/params/dfip2203/active': 'true'}})
+        node.generate(1)
+        # Start queueing right after a settlement, so a whole period is left
+        node.generate(node.getfutureswapblock() - node.getblockcount())
+
+    def queue_swaps(self):
+        node = self.nodes[0]
+        queued = 0
+        while queued < self.options.swaps:
+            senders = self.addresses[:self.options.swaps - queued]
+            self.fund_auth(senders)
+            for address in senders:
+                symbol = random.choice(self.symbols)
+                with self.results.timer("futureswap_ms"):
+                    if queued % 2 == 0:
+                        node.futureswap(address, "1@{}".format(symbol))
+                    else:
+                        node.futureswap(address, "{}@DUSD".format(self.PRICE), int(self.token_ids[symbol]))
+                queued += 1
+            node.generate(1)
+
+    def measure_queries(self, stage):
+        node = self.nodes[0]
+        for _ in range(self.options.queries):
+            with self.results.timer("{}_listpendingfutureswaps_ms".format(stage)):
+                pending = node.listpendingfutureswaps()
+            with self.results.timer("{}_getpendingfutureswaps_ms".format(stage)):
+                node.getpendingfutureswaps(random.choice(self.addresses))
+        return len(pending)
+
+    def run_test(self):
+        node = self.nodes[0]
+        node.generate(101)
+        self.start_benchmark("futures_settlement", [
+            ("swaps", self.options.swaps),
+            ("addresses", self.options.addresses),
+            ("tokens", self.options.tokens),
+            ("queries", self.options.queries),
+        ])
+        self.log.info("Setting up {} dTokens and {} addresses...".format(self.options.tokens, self.options.addresses))
+        self.setup_tokens()
+
+        # Two blocks per round of swaps, one to fund the addresses
+        period = 2 * -(-self.options.swaps // self.options.addresses) + 10
+        self.setup_futures(period)
+
+        self.log.info("Queueing {} future swaps...".format(self.options.swaps))
+        self.queue_swaps()
+        settlement_height = node.getfutureswapblock()
+        assert settlement_height > node.getblockcount(), "swaps were not all queued within the futures period"
+        assert_equal(self.measure_queries("pending"), self.options.swaps)
+
+        node.generate(settlement_height - node.getblockcount() - 1)
+        sampler = node.resource_sampler
+        before = sampler.sample_now()
+        self.mark_log()
+        with self.results.timer("settlement_generate_ms"):
+            node.generate(1)
+        timings = self.block_timings()
+        after = sampler.sample_now()
+        self.results.add_block_timings("settlement", timings)
+        if before is not None and after is not None:
+            self.results.set("settlement_rss_before_kb", before.rss_kb)
+            self.results.set("settlement_rss_after_kb", after.rss_kb)
+            self.results.set("settlement_peak_rss_kb", peak(sampler.since(before.time), 'rss_kb'))
+
+        assert_equal(self.measure_queries("settled"), 0)
+        self.write_results()
+
+
+if __name__ == '__main__':
+    FuturesBenchmark().main()
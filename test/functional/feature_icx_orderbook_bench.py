@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark the ICX orderbook with many open orders and offers expiring.
+
+Creates --orders orders, alternately internal (a token for BTC) and external
+(BTC for a token) over DFI and --tokens other tokens, and --offers offers on
+random orders. Expiries are chosen so that all of them fall within
+--expiryblocks blocks after the setup, then these blocks are mined.
+
+Measured: the latency of icx_createorder and icx_makeoffer, of
+icx_listorders with everything open (first page, all orders, by token and
+chain, offers of an order) and after expiry (closed orders), and the time to
+connect the blocks at which orders and offers expire, apart from the others.
+
+Run e.g. with
+    feature_icx_orderbook_bench.py --orders 5000 --offers 2000 --tokens 5 --benchmarkoutput icx.json
+"""
+
+import collections
+import random
+from decimal import Decimal
+
+from test_framework.benchmark import DefiBenchmarkFramework
+from test_framework.util import assert_equal
+
+# Pubkey receiving the BTC of internal orders, as in feature_icx_orderbook.py
+RECEIVE_PUBKEY = '037f9563f30c609b19fd435a19b8bde7d6db703012ba1aba72e9f42a87366d1941'
+
+
+class ICXOrderbookBenchmark(DefiBenchmarkFramework):
+    def set_test_params(self):
+        self.num_nodes = 1
+        self.setup_clean_chain = True
+        self.extra_args = [
+            ['-txnotokens=0', '-amkheight=1', '-bayfrontheight=1', '-eunosheight=1', '-eunospayaheight=1', '-txindex=1'],
+        ]
+        self.ALL = 1000000
+        # Offers expire 20 blocks after creation at the earliest
+        self.MIN_OFFER_EXPIRY = 20
+
+    def add_benchmark_options(self, parser):
+        parser.add_argument("--orders", dest="orders", default=200, type=int,
+                            help="number of orders (default: %(default)s)")
+        parser.add_argument("--offers", dest="offers", default=100, type=int,
+                            help="number of offers (default: %(default)s)")
+        parser.add_argument("--tokens", dest="tokens", default=2, type=int,
+                            help="number of tokens traded besides DFI (default: %(default)s)")
+        parser.add_argument("--expiryblocks", dest="expiry_blocks", default=20, type=int,
+                            help="number of blocks over which orders and offers expire (default: %(default)s)")
+        parser.add_argument("--queries", dest="queries", default=20, type=int,
+                            help="calls per measured query (default: %(default)s)")
+
+    def setup_tokens(self):
+        node = self.nodes[0]
+        self.owner = node.get_genesis_keys().ownerAuthAddress
+        self.symbols = ["ICX" + str(i) for i in range(self.options.tokens)]
+        for symbol in ["BTC"] + self.symbols:
+            node.createtoken({
+                "symbol": symbol,
+                "name": symbol + " token",
+                "isDAT": True,
+                "collateralAddress": self.owner
+            })
+        node.generate(1)
+        node.minttokens(["{}@{}".format(self.options.orders + 1, symbol) for symbol in ["BTC"] + self.symbols])
+        node.utxostoaccount({self.owner: "{}@DFI".format(self.options.orders + 100 + 10 * self.BATCH)})
+        node.generate(1)
+
+        # The taker fee is paid in DFI at the price of the BTC-DFI pool
+        node.createpoolpair({
+            "tokenA": "BTC",
+            "tokenB": "DFI",
+            "commission": 0,
+            "status": True,
+            "ownerAddress": self.owner,
+            "pairSymbol": "BTC-DFI",
+        }, [])
+        node.generate(1)
+        node.addpoolliquidity({self.owner: ["1@BTC", "100@DFI"]}, self.owner, [])
+        node.setgov({"ICX_TAKERFEE_PER_BTC": Decimal('0.001')})
+        node.generate(1)
+
+        self.takers = [node.getnewaddress("", "legacy") for _ in range(self.BATCH)]
+        node.accounttoaccount(self.owner, {taker: "10@DFI" for taker in self.takers})
+        node.generate(1)
+
+    def create_orders(self, first_expiry):
+        node = self.nodes[0]
+        self.orders = []
+        expiring = collections.Counter()
+        tokens = ["DFI"] + self.symbols
+        for start in range(0, self.options.orders, self.BATCH):
+            height = node.getblockcount() + 1
+            for i in range(start, min(start + self.BATCH, self.options.orders)):
+                expire_height = first_expiry + random.randrange(self.options.expiry_blocks)
+                amount = Decimal(random.randint(10, 100)) / 100
+                order = {
+                    'ownerAddress': self.owner,
+                    'amountFrom': amount,
+                    'expiry': expire_height - height,
+                }
+                if i % 2 == 0:
+                    order.update({'tokenFrom': random.choice(tokens), 'chainTo': "BTC", 'receivePubkey': RECEIVE_PUBKEY, 'orderPrice': Decimal('0.01')})
+                else:
+                    order.update({'chainFrom': "BTC", 'tokenTo': random.choice(tokens), 'orderPrice': Decimal('100')})
+                with self.results.timer("icx_createorder_ms"):
+                    txid = node.icx_createorder(order)["txid"]
+                self.orders.append((txid, order))
+                expiring[expire_height] += 1
+            node.generate(1)
+        return expiring
+
+    def make_offers(self, first_expiry):
+        node = self.nodes[0]
+        expiring = collections.Counter()
+        for start in range(0, self.options.offers, self.BATCH):
+            self.fund_auth(self.takers)
+            height = node.getblockcount() + 1
+            for taker in self.takers[:min(self.BATCH, self.options.offers - start)]:
+                txid, order = random.choice(self.orders)
+                expire_height = first_expiry + random.randrange(self.options.expiry_blocks)
+                offer = {
+                    'orderTx': txid,
+                    'amount': order['amountFrom'] * order['orderPrice'] / 2,
+                    'ownerAddress': taker,
+                    'expiry': expire_height - height,
+                }
+                if 'chainFrom' in order:
+                    offer['receivePubkey'] = RECEIVE_PUBKEY
+                with self.results.timer("icx_makeoffer_ms"):
+                    node.icx_makeoffer(offer)
+                expiring[expire_height] += 1
+            node.generate(1)
+        return expiring
+
+    def measure_queries(self, stage):
+        node = self.nodes[0]
+        for _ in range(self.options.queries):
+            with self.results.timer("{}_icx_listorders_ms".format(stage)):
+                node.icx_listorders()
+            with self.results.timer("{}_icx_listorders_all_ms".format(stage)):
+                orders = node.icx_listorders({"limit": self.ALL})
+            with self.results.timer("{}_icx_listorders_token_ms".format(stage)):
+                node.icx_listorders({"token": random.choice(["DFI"] + self.symbols), "chain": "BTC", "limit": self.ALL})
+            with self.results.timer("{}_icx_listorders_offers_ms".format(stage)):
+                node.icx_listorders({"orderTx": random.choice(self.orders)[0], "limit": self.ALL})
+            with self.results.timer("{}_icx_listorders_closed_ms".format(stage)):
+                node.icx_listorders({"closed": True, "limit": self.ALL})
+        # Every result has a WARNING entry besides the orders
+        return len(orders) - 1
+
+    def run_test(self):
+        node = self.nodes[0]
+        # Coinbases pay the fees and the DFI of the orders
+        node.generate(150 + self.options.orders // 20)
+        self.start_benchmark("icx_orderbook", [
+            ("orders", self.options.orders),
+            ("offers", self.options.offers),
+            ("tokens", self.options.tokens),
+            ("expiry_blocks", self.options.expiry_blocks),
+            ("queries", self.options.queries),
+        ])
+        self.log.info("Setting up tokens and taker fee...")
+        self.setup_tokens()
+
+        # Orders and offers expire after all of them are created
+        order_blocks = -(-self.options.orders // self.BATCH)
+        offer_blocks = 2 * -(-self.options.offers // self.BATCH)
+        first_expiry = node.getblockcount() + order_blocks + offer_blocks + self.MIN_OFFER_EXPIRY + 5
+        self.log.info("Creating {} orders and {} offers...".format(self.options.orders, self.options.offers))
+        expiring = self.create_orders(first_expiry)
+        expiring.update(self.make_offers(first_expiry))
+
+        open_orders = self.measure_queries("open")
+        assert_equal(open_orders, self.options.orders)
+        self.results.set("open_orders", open_orders)
+
+        self.log.info("Mining through the expiry of {} orders and offers...".format(sum(expiring.values())))
+        while node.getblockcount() < first_expiry + self.options.expiry_blocks:
+            self.mark_log()
+            node.generate(1)
+            height = node.getblockcount()
+            if expiring[height]:
+                self.results.add_block_timings("expiry", self.block_timings())
+                self.results.add("expiring_per_block", expiring[height])
+            else:
+                self.results.add_block_timings("block", self.block_timings())
+
+        assert_equal(self.measure_queries("expired"), 0)
+        self.write_results()
+
+
+if __name__ == '__main__':
+    ICXOrderbookBenchmark().main()
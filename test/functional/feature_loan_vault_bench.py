@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark vault revaluation and liquidation under oracle price swings.
+
+Creates --vaults vaults with DFI collateral and a TSLA loan each, their
+collateralization ratios spread between just above the 150% of the loan
+scheme and above what the largest price swing reaches. The TSLA oracle price
+is then raised --swings times by --swingsize and lowered back, so every step
+up sends another slice of the vaults into liquidation.
+
+Measured: the time to connect every block of the swings from the debug log,
+separately for the blocks where the fixed interval price changes and all
+vaults are revalued, the RPC latency of the vault operations during setup,
+and after every swing the latency of listvaults (ids only, verbose and by
+state), getvault and listauctions at that scale.
+
+Run e.g. with
+    feature_loan_vault_bench.py --vaults 2000 --swings 3 --benchmarkoutput vaults.json
+"""
+
+import random
+
+from test_framework.benchmark import DefiBenchmarkFramework
+from test_framework.util import assert_equal
+
+
+class VaultBenchmark(DefiBenchmarkFramework):
+    def set_test_params(self):
+        self.num_nodes = 1
+        self.setup_clean_chain = True
+        self.extra_args = [
+            ['-txnotokens=0', '-amkheight=1', '-bayfrontheight=1', '-eunosheight=1', '-txindex=1', '-fortcanningheight=1'],
+        ]
+        self.DFI_PRICE = 100
+        self.TSLA_PRICE = 10
+        self.MIN_RATIO = 150
+        # Prices more than 30% away from the active price are not accepted
+        self.MAX_SWING = 0.3
+
+    def add_benchmark_options(self, parser):
+        parser.add_argument("--vaults", dest="vaults", default=100, type=int,
+                            help="number of vaults (default: %(default)s)")
+        parser.add_argument("--swings", dest="swings", default=3, type=int,
+                            help="number of price steps up, followed by as many down (default: %(default)s)")
+        parser.add_argument("--swingsize", dest="swing_size", default=0.2, type=float,
+                            help="relative change of the TSLA price per step, below 0.3 (default: %(default)s)")
+        parser.add_argument("--queries", dest="queries", default=20, type=int,
+                            help="getvault calls after every price step (default: %(default)s)")
+
+    def set_price(self, tsla_price):
+        with self.results.timer("setoracledata_ms"):
+            self.set_oracle_prices(self.oracle_id, [("DFI", self.DFI_PRICE), ("TSLA", tsla_price)])
+
+    def setup_loans(self):
+        node = self.nodes[0]
+        self.account = node.get_genesis_keys().ownerAuthAddress
+        self.oracle_id = self.setup_oracle([("DFI", self.DFI_PRICE), ("TSLA", self.TSLA_PRICE)])
+        self.setup_loan_scheme(self.MIN_RATIO, 'LOAN150')
+        self.setup_loan_token("TSLA")
+        node.generate(12)  # let the prices become active
+
+        # 1 DFI of collateral per vault
+        node.utxostoaccount({self.account: "{}@DFI".format(self.options.vaults)})
+        node.generate(1)
+
+    def setup_vaults(self):
+        node = self.nodes[0]
+        count = self.options.vaults
+        self.vaults = self.run_batches("createvault_ms", node.createvault, [(self.account, 'LOAN150')] * count)
+        self.run_batches("deposittovault_ms", node.deposittovault, [(vault, self.account, '1@DFI') for vault in self.vaults])
+
+        # Spread the ratios so that each step up liquidates the next slice
+        growth = (1 + self.options.swing_size) ** self.options.swings
+        loans = []
+        for i, vault in enumerate(self.vaults):
+            ratio = (self.MIN_RATIO + 2) * growth ** ((i + 1) / count)
+            amount = self.DFI_PRICE * 100 / ratio / self.TSLA_PRICE
+            loans.append(({'vaultId': vault, 'amounts': "{:.8f}@TSLA".format(amount)},))
+        self.run_batches("takeloan_ms", node.takeloan, loans)
+        assert_equal(len(node.listvaults({}, {"limit": 0})), count)
+
+    def measure_blocks(self, blocks):
+        """Mine blocks one by one, timing revaluation blocks apart from the others."""
+        node = self.nodes[0]
+        for _ in range(blocks):
+            self.mark_log()
+            node.generate(1)
+            timings = self.block_timings()
+            price = node.getfixedintervalprice("TSLA/USD")
+            if price['activePriceBlock'] == node.getblockcount():
+                self.results.add_block_timings("revaluation", timings)
+            else:
+                self.results.add_block_timings("block", timings)
+
+    def measure_queries(self):
+        node = self.nodes[0]
+        with self.results.timer("listvaults_ms"):
+            node.listvaults({}, {"limit": 0})
+        with self.results.timer("listvaults_verbose_ms"):
+            node.listvaults({"verbose": True}, {"limit": 0})
+        with self.results.timer("listvaults_inliquidation_ms"):
+            node.listvaults({"state": "inLiquidation"}, {"limit": 0})
+        for vault in random.sample(self.vaults, min(self.options.queries, len(self.vaults))):
+            with self.results.timer("getvault_ms"):
+                node.getvault(vault)
+        with self.results.timer("listauctions_ms"):
+            auctions = node.listauctions({"limit": 0})
+        return len(auctions)
+
+    def run_test(self):
+        assert self.options.swing_size < self.MAX_SWING, "--swingsize must be below {}".format(self.MAX_SWING)
+        node = self.nodes[0]
+        # Coinbases pay the vault creation fees and the collateral
+        node.generate(150 + self.options.vaults // 10)
+
+        self.start_benchmark("loan_vault", [
+            ("vaults", self.options.vaults),
+            ("swings", self.options.swings),
+            ("swing_size", self.options.swing_size),
+            ("queries", self.options.queries),
+        ])
+        self.log.info("Setting up oracle and loan token...")
+        self.setup_loans()
+        self.log.info("Creating {} vaults...".format(self.options.vaults))
+        self.setup_vaults()
+        self.measure_queries()
+
+        steps = list(range(1, self.options.swings + 1)) + list(range(self.options.swings - 1, -1, -1))
+        for i, step in enumerate(steps, 1):
+            price = self.TSLA_PRICE * (1 + self.options.swing_size) ** step
+            self.log.info("Price step {}/{}: TSLA at {:.2f} USD".format(i, len(steps), price))
+            self.set_price(price)
+            # The new price is the next price at the following interval and
+            # the active price one interval later
+            self.measure_blocks(12)
+            auctions = self.measure_queries()
+            self.results.set("auctions_after_step{}".format(i), auctions)
+        self.write_results()
+
+
+if __name__ == '__main__':
+    VaultBenchmark().main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark oracle price ingestion and price queries as the feeds grow.
+
+Adds price feeds and oracles in --steps steps: every step adds --feeds/steps
+USD feeds and --oracles/steps oracles, each appointed over --feedsperoracle
+of the feeds added so far. After every step, each oracle submits a
+setoracledata with all its prices in every one of --rounds blocks, at
+--rate transactions per second overall.
+
+Measured per step, with the metric names prefixed by the number of feeds:
+the latency of setoracledata (mempool acceptance as seen by a wallet
+client), the time to connect each block from the debug log, and the latency
+of listlatestrawprices (first page of all raw prices, and all raw prices of
+one feed), getprice and listprices (all feeds).
+
+Run e.g. with
+    feature_oracles_bench.py --oracles 500 --feeds 200 --feedsperoracle 20 --steps 4 --rate 50 --benchmarkoutput oracles.json
+"""
+
+import random
+
+from test_framework.benchmark import DefiBenchmarkFramework, Pacer
+from test_framework.util import assert_equal
+
+
+class OraclesBenchmark(DefiBenchmarkFramework):
+    def set_test_params(self):
+        self.num_nodes = 1
+        self.setup_clean_chain = True
+        self.extra_args = [
+            ['-txnotokens=0', '-amkheight=1', '-bayfrontheight=1', '-eunosheight=1', '-fortcanningheight=1'],
+        ]
+
+    def add_benchmark_options(self, parser):
+        parser.add_argument("--oracles", dest="oracles", default=40, type=int,
+                            help="number of oracles after the last step (default: %(default)s)")
+        parser.add_argument("--feeds", dest="feeds", default=20, type=int,
+                            help="number of price feeds after the last step (default: %(default)s)")
+        parser.add_argument("--feedsperoracle", dest="feeds_per_oracle", default=5, type=int,
+                            help="number of feeds every oracle is appointed over (default: %(default)s)")
+        parser.add_argument("--steps", dest="steps", default=2, type=int,
+                            help="number of steps adding feeds and oracles (default: %(default)s)")
+        parser.add_argument("--rounds", dest="rounds", default=3, type=int,
+                            help="blocks of prices from every oracle per step (default: %(default)s)")
+        parser.add_argument("--rate", dest="rate", default=0, type=float,
+                            help="target setoracledata per second, 0 for as fast as possible (default: %(default)s)")
+        parser.add_argument("--queries", dest="queries", default=20, type=int,
+                            help="calls per measured query (default: %(default)s)")
+
+    def add_oracles(self, count, feeds):
+        node = self.nodes[0]
+        oracles = []
+        for _ in range(count):
+            tokens = random.sample(feeds, min(self.options.feeds_per_oracle, len(feeds)))
+            oracles.append((node.getnewaddress("", "legacy"), tokens))
+            self.covered.update(tokens)
+        arguments = [(address, [{"currency": "USD", "token": token} for token in tokens], random.randint(1, 100)) for address, tokens in oracles]
+        oracle_ids = self.run_batches("appointoracle_ms", node.appointoracle, arguments)
+        self.oracles += [(oracle_id, address, tokens) for oracle_id, (address, tokens) in zip(oracle_ids, oracles)]
+
+    def stream_prices(self, stage, pacer):
+        node = self.nodes[0]
+        for _ in range(self.options.rounds):
+            self.fund_auth([address for _, address, _ in self.oracles])
+            for oracle_id, _, tokens in self.oracles:
+                prices = [(token, random.uniform(90, 110)) for token in tokens]
+                pacer.wait()
+                with self.results.timer("{}_setoracledata_ms".format(stage)):
+                    self.set_oracle_prices(oracle_id, prices)
+            assert_equal(len(node.getrawmempool()), len(self.oracles))
+            self.mark_log()
+            node.generate(1)
+            self.results.add_block_timings(stage, self.block_timings())
+
+    def measure_queries(self, stage):
+        node = self.nodes[0]
+        covered = sorted(self.covered)
+        for _ in range(self.options.queries):
+            feed = {"currency": "USD", "token": random.choice(covered)}
+            with self.results.timer("{}_listlatestrawprices_ms".format(stage)):
+                node.listlatestrawprices()
+            with self.results.timer("{}_listlatestrawprices_feed_ms".format(stage)):
+                node.listlatestrawprices(feed, {"limit": 0})
+            with self.results.timer("{}_getprice_ms".format(stage)):
+                node.getprice(feed)
+            with self.results.timer("{}_listprices_ms".format(stage)):
+                prices = node.listprices({"limit": 0})
+        assert_equal(len([price for price in prices if price["ok"] is True]), len(covered))
+
+    def run_test(self):
+        node = self.nodes[0]
+        # Coinbases pay the oracle appointments and the price updates
+        node.generate(150 + self.options.oracles // 10)
+        self.start_benchmark("oracles", [
+            ("oracles", self.options.oracles),
+            ("feeds", self.options.feeds),
+            ("feeds_per_oracle", self.options.feeds_per_oracle),
+            ("steps", self.options.steps),
+            ("rounds", self.options.rounds),
+            ("rate", self.options.rate),
+            ("queries", self.options.queries),
+        ])
+        pacer = Pacer(self.options.rate)
+        self.oracles = []
+        self.covered = set()
+        feeds = []
+        for step in range(1, self.options.steps + 1):
+            feeds += ["FEED" + str(i) for i in range(len(feeds), self.options.feeds * step // self.options.steps)]
+            count = self.options.oracles * step // self.options.steps - len(self.oracles)
+            stage = "feeds{}".format(len(feeds))
+            self.log.info("Step {}/{}: {} feeds, {} oracles".format(step, self.options.steps, len(feeds), len(self.oracles) + count))
+            self.add_oracles(count, feeds)
+            self.stream_prices(stage, pacer)
+            self.measure_queries(stage)
+        self.write_results()
+
+
+if __name__ == '__main__':
+    OraclesBenchmark().main()
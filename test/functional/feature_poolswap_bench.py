@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark poolswap and compositeswap throughput and latency.
+
+Builds the pools and accounts of feature_poolswap_mechanism.py at a
+configurable scale: every pool pairs a token with DFI and every account holds
+all tokens. Then, for each benchmarked block, swaps are submitted at the
+target rate from the accounts in turn, either as a poolswap to DFI or as a
+compositeswap to the token of another pool (through both DFI pools), and the
+block including them is mined.
+
+Measured: the latency of the poolswap and compositeswap RPCs (mempool
+acceptance as seen by a wallet client, so including funding and signing),
+the time to connect each block from the debug log, and swaps per second both
+submitted and connected.
+
+Run e.g. with
+    feature_poolswap_bench.py --pools 10 --accounts 200 --swapsperblock 200 --blocks 20 --benchmarkoutput poolswap.json
+"""
+
+import random
+import time
+
+from test_framework.benchmark import DefiBenchmarkFramework, Pacer
+from test_framework.util import assert_equal
+
+
+class PoolSwapBenchmark(DefiBenchmarkFramework):
+    def set_test_params(self):
+        self.num_nodes = 1
+        self.setup_clean_chain = True
+        self.extra_args = [
+            ['-txnotokens=0', '-amkheight=1', '-bayfrontheight=1', '-bayfrontgardensheight=1', '-eunosheight=1', '-fortcanningheight=1', '-subsidytest=1'],
+        ]
+        self.AMOUNT_TOKEN = 1000
+        self.TOKEN_LIQUIDITY = 10000
+        self.DFI_LIQUIDITY = 10
+        self.COMMISSION = 0.001
+
+    def add_benchmark_options(self, parser):
+        parser.add_argument("--pools", dest="pools", default=3, type=int,
+                            help="number of token-DFI pools (default: %(default)s)")
+        parser.add_argument("--accounts", dest="accounts", default=20, type=int,
+                            help="number of swapping accounts (default: %(default)s)")
+        parser.add_argument("--swapsperblock", dest="swaps_per_block", default=20, type=int,
+                            help="swaps submitted per block (default: %(default)s)")
+        parser.add_argument("--blocks", dest="blocks", default=5, type=int,
+                            help="number of blocks of swaps (default: %(default)s)")
+        parser.add_argument("--rate", dest="rate", default=0, type=float,
+                            help="target swaps submitted per second, 0 for as fast as possible (default: %(default)s)")
+        parser.add_argument("--compositeshare", dest="composite_share", default=0.5, type=float,
+                            help="share of swaps submitted as compositeswap (default: %(default)s)")
+
+    def setup_pools(self, owner):
+        node = self.nodes[0]
+        symbols = ["SWAP" + str(i) for i in range(self.options.pools)]
+        self.fund_auth([owner])
+        for symbol in symbols:
+            node.createtoken({
+                "symbol": symbol,
+                "name": "Token " + symbol,
+                "isDAT": False,
+                "collateralAddress": owner
+            }, [])
+        node.generate(1)
+        self.tokens = self.token_ids(symbols)
+
+        for token in self.tokens:
+            node.createpoolpair({
+                "tokenA": token,
+                "tokenB": "DFI",
+                "commission": self.COMMISSION,
+                "status": True,
+                "ownerAddress": owner
+            }, [])
+        node.generate(1)
+        assert_equal(len(node.listpoolpairs({}, False)), self.options.pools)
+
+        mint_amount = self.TOKEN_LIQUIDITY + self.options.accounts * self.AMOUNT_TOKEN
+        self.fund_auth([owner])
+        node.minttokens([str(mint_amount) + "@" + token for token in self.tokens], [])
+        node.utxostoaccount({owner: str(self.DFI_LIQUIDITY * self.options.pools) + "@0"}, [])
+        node.generate(1)
+
+        for token in self.tokens:
+            self.fund_auth([owner])
+            node.addpoolliquidity({
+                owner: [str(self.TOKEN_LIQUIDITY) + "@" + token, str(self.DFI_LIQUIDITY) + "@0"]
+            }, owner, [])
+            node.generate(1)
+
+    def setup_accounts(self, owner):
+        node = self.nodes[0]
+        self.accounts = [node.getnewaddress("", "legacy") for _ in range(self.options.accounts)]
+        self.send_tokens(owner, self.accounts, [str(self.AMOUNT_TOKEN) + "@" + token for token in self.tokens])
+
+        # Each account needs a utxo for every swap it makes in a block
+        swaps_per_account = -(-self.options.swaps_per_block // len(self.accounts))
+        for _ in range(swaps_per_account):
+            node.sendmany("", {account: 0.1 for account in self.accounts})
+        node.generate(1)
+        return swaps_per_account
+
+    def swap(self, account):
+        node = self.nodes[0]
+        token_from = random.choice(self.tokens)
+        composite = len(self.tokens) > 1 and random.random() < self.options.composite_share
+        swap = {
+            "from": account,
+            "tokenFrom": token_from,
+            "amountFrom": round(random.uniform(0.1, 1), 8),
+            "to": account,
+            "tokenTo": random.choice([t for t in self.tokens if t != token_from]) if composite else "0",
+        }
+        if composite:
+            with self.results.timer("compositeswap_ms"):
+                node.compositeswap(swap, [])
+        else:
+            with self.results.timer("poolswap_ms"):
+                node.poolswap(swap, [])
+
+    def run_test(self):
+        node = self.nodes[0]
+        node.generate(101 + self.options.pools)
+        owner = node.getnewaddress("", "legacy")
+
+        self.log.info("Creating {} pools...".format(self.options.pools))
+        self.setup_pools(owner)
+        self.log.info("Funding {} accounts...".format(self.options.accounts))
+        swaps_per_account = self.setup_accounts(owner)
+
+        results = self.start_benchmark("poolswap", [
+            ("pools", self.options.pools),
+            ("accounts", self.options.accounts),
+            ("swaps_per_block", self.options.swaps_per_block),
+            ("blocks", self.options.blocks),
+            ("rate", self.options.rate),
+            ("composite_share", self.options.composite_share),
+        ])
+        pacer = Pacer(self.options.rate)
+        submit_time = connect_time = 0
+        swaps = 0
+        next_account = 0
+        for block in range(self.options.blocks):
+            self.log.info("Block {}/{}: submitting {} swaps".format(block + 1, self.options.blocks, self.options.swaps_per_block))
+            start = time.perf_counter()
+            for _ in range(self.options.swaps_per_block):
+                pacer.wait()
+                self.swap(self.accounts[next_account])
+                next_account = (next_account + 1) % len(self.accounts)
+            submit_time += time.perf_counter() - start
+            assert_equal(len(node.getrawmempool()), self.options.swaps_per_block)
+
+            self.mark_log()
+            with results.timer("generate_ms"):
+                block_hash = node.generate(1)[0]
+            timings = self.block_timings()
+            assert_equal(len(node.getrawmempool()), 0)
+            assert_equal(len(node.getblock(block_hash)["tx"]), self.options.swaps_per_block + 1)
+            results.add_block_timings("block", timings)
+            connect_time += timings[-1].total_ms / 1000
+            swaps += self.options.swaps_per_block
+
+            # Refill the auth utxos spent by the swaps
+            if block + 1 < self.options.blocks:
+                for _ in range(swaps_per_account):
+                    node.sendmany("", {account: 0.1 for account in self.accounts})
+                node.generate(1)
+
+        results.set("swaps", swaps)
+        results.set("submitted_swaps_per_second", swaps / submit_time)
+        results.set("connected_swaps_per_second", swaps / connect_time if connect_time else None)
+        self.write_results()
+
+
+if __name__ == '__main__':
+    PoolSwapBenchmark().main()
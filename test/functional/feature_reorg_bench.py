@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark disconnecting and reconnecting blocks dense in DeFi transactions.
+
+Builds a chain of as many blocks as the deepest of --depths, every block
+holding a minttokens from the token owner and one transaction from each of
+--txsperblock accounts, in turn a poolswap, a deposittovault or a takeloan
+on the account's vault. Then, --repeats times for each depth, the block that
+deep is invalidated with invalidateblock and reconsidered with
+reconsiderblock, as the reorg tests such as
+feature_communitybalance_reorg.py do through competing chains.
+
+Measured per depth, with the metric names prefixed by it: the latency of
+invalidateblock and reconsiderblock, the time to disconnect and connect each
+block from the debug log and its sum per call, to compare with the RPC
+latency, and the node's RSS after disconnecting and after reconnecting.
+
+Run e.g. with
+    feature_reorg_bench.py --depths 1,10,100 --txsperblock 50 --repeats 5 --benchmarkoutput reorg.json
+"""
+
+from test_framework.benchmark import DefiBenchmarkFramework
+from test_framework.util import assert_equal
+
+
+class ReorgBenchmark(DefiBenchmarkFramework):
+    def set_test_params(self):
+        self.num_nodes = 1
+        self.setup_clean_chain = True
+        self.extra_args = [
+            ['-txnotokens=0', '-amkheight=1', '-bayfrontheight=1', '-bayfrontgardensheight=1', '-eunosheight=1', '-fortcanningheight=1', '-txindex=1'],
+        ]
+        self.PRICE = 10
+        self.COLLATERAL = 10
+        self.AMOUNT = 0.01
+
+    def add_benchmark_options(self, parser):
+        parser.add_argument("--depths", dest="depths", default="1,10,100",
+                            help="comma separated numbers of blocks to disconnect and reconnect (default: %(default)s)")
+        parser.add_argument("--txsperblock", dest="txs_per_block", default=20, type=int,
+                            help="DeFi transactions per block besides the mint, one per account (default: %(default)s)")
+        parser.add_argument("--repeats", dest="repeats", default=3, type=int,
+                            help="reorgs per depth (default: %(default)s)")
+
+    def setup_loans(self):
+        node = self.nodes[0]
+        self.owner = node.get_genesis_keys().ownerAuthAddress
+        self.setup_oracle([("DFI", self.PRICE), ("TSLA", self.PRICE)])
+        self.setup_loan_scheme(150, 'LOAN150')
+        self.setup_loan_token("TSLA")
+        node.generate(12)  # let the prices become active
+
+    def setup_pool(self, blocks):
+        node = self.nodes[0]
+        node.createtoken({
+            "symbol": "BTC",
+            "name": "BTC token",
+            "isDAT": True,
+            "collateralAddress": self.owner
+        })
+        node.generate(1)
+        accounts = self.options.txs_per_block
+        dfi = self.COLLATERAL + self.AMOUNT * blocks
+        node.minttokens("{}@BTC".format(1000 + accounts * self.AMOUNT * blocks))
+        node.utxostoaccount({self.owner: "{}@DFI".format(1000 + accounts * dfi)})
+        node.generate(1)
+        node.createpoolpair({
+            "tokenA": "BTC",
+            "tokenB": "DFI",
+            "commission": 0.001,
+            "status": True,
+            "ownerAddress": self.owner,
+            "pairSymbol": "BTC-DFI",
+        }, [])
+        node.generate(1)
+        node.addpoolliquidity({self.owner: ["1000@BTC", "1000@DFI"]}, self.owner, [])
+        node.generate(1)
+
+    def setup_accounts(self, blocks):
+        node = self.nodes[0]
+        self.accounts = [node.getnewaddress("", "legacy") for _ in range(self.options.txs_per_block)]
+        self.send_tokens(self.owner, self.accounts, ["{}@BTC".format(self.AMOUNT * blocks), "{}@DFI".format(self.COLLATERAL + self.AMOUNT * blocks)])
+
+        # One utxo per account for every transaction it makes
+        for start in range(0, blocks + 1, self.BATCH):
+            for _ in range(min(self.BATCH, blocks + 1 - start)):
+                node.sendmany("", {account: 0.1 for account in self.accounts})
+            node.generate(1)
+
+        self.vaults = self.run_batches("createvault_ms", node.createvault, [(account, 'LOAN150') for account in self.accounts])
+        for account, vault in zip(self.accounts, self.vaults):
+            node.deposittovault(vault, account, "{}@DFI".format(self.COLLATERAL))
+        node.generate(1)
+
+    def build_chain(self, blocks):
+        node = self.nodes[0]
+        for block in range(blocks):
+            node.minttokens("{}@BTC".format(self.AMOUNT))
+            for i, (account, vault) in enumerate(zip(self.accounts, self.vaults)):
+                operation = (block + i) % 3
+                if operation == 0:
+                    node.poolswap({
+                        "from": account,
+                        "tokenFrom": "BTC",
+                        "amountFrom": self.AMOUNT,
+                        "to": account,
+                        "tokenTo": "DFI",
+                    }, [])
+                elif operation == 1:
+                    node.deposittovault(vault, account, "{}@DFI".format(self.AMOUNT))
+                else:
+                    node.takeloan({'vaultId': vault, 'amounts': "{}@TSLA".format(self.AMOUNT)})
+            node.generate(1)
+            assert_equal(len(node.getrawmempool()), 0)
+            if (block + 1) % 10 == 0:
+                self.log.info("{}/{} blocks built".format(block + 1, blocks))
+
+    def reorg(self, depth):
+        node = self.nodes[0]
+        sampler = node.resource_sampler
+        stage = "depth{}".format(depth)
+        tip = node.getbestblockhash()
+        height = node.getblockcount()
+        block_hash = node.getblockhash(height - depth + 1)
+
+        self.mark_log()
+        with self.results.timer("{}_invalidateblock_ms".format(stage)):
+            node.invalidateblock(block_hash)
+        timings = self.block_timings()
+        assert_equal(node.getblockcount(), height - depth)
+        assert_equal(len(timings), depth)
+        self.results.add_block_timings(stage, timings)
+        self.results.add("{}_disconnect_total_ms".format(stage), sum(t.total_ms for t in timings))
+        sample = sampler.sample_now()
+        if sample is not None:
+            self.results.add("{}_disconnected_rss_kb".format(stage), sample.rss_kb)
+
+        self.mark_log()
+        with self.results.timer("{}_reconsiderblock_ms".format(stage)):
+            node.reconsiderblock(block_hash)
+        timings = self.block_timings()
+        assert_equal(node.getbestblockhash(), tip)
+        self.results.add_block_timings(stage, timings)
+        self.results.add("{}_connect_total_ms".format(stage), sum(t.total_ms for t in timings))
+        sample = sampler.sample_now()
+        if sample is not None:
+            self.results.add("{}_reconnected_rss_kb".format(stage), sample.rss_kb)
+        self.results.set("{}_mempool_after".format(stage), len(node.getrawmempool()))
+
+    def run_test(self):
+        depths = [int(depth) for depth in self.options.depths.split(",")]
+        blocks = max(depths)
+        node = self.nodes[0]
+        # Coinbases pay the mints and the vault creation fees
+        node.generate(150 + blocks // 10 + self.options.txs_per_block // 10)
+        self.start_benchmark("reorg", [
+            ("depths", depths),
+            ("txs_per_block", self.options.txs_per_block),
+            ("repeats", self.options.repeats),
+        ])
+        self.log.info("Setting up loans, pool and {} accounts...".format(self.options.txs_per_block))
+        self.setup_loans()
+        self.setup_pool(blocks)
+        self.setup_accounts(blocks)
+        self.log.info("Building {} blocks...".format(blocks))
+        self.build_chain(blocks)
+
+        for depth in depths:
+            self.log.info("Disconnecting and reconnecting {} blocks {} times".format(depth, self.options.repeats))
+            for _ in range(self.options.repeats):
+                self.reorg(depth)
+        self.write_results()
+
+
+if __name__ == '__main__':
+    ReorgBenchmark().main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+"""Benchmark account history and account queries on a large history.
+
+Fills the account history index (-acindex) with transfers between
+--addresses addresses of --tokens tokens: every block holds
+--transfersperblock accounttoaccount transactions, each from one address to
+--recipients others, so each transaction adds recipients + 1 history
+entries. The history then holds about blocks * transfersperblock *
+(recipients + 1) entries.
+
+Measured, --queries times each unless noted: listaccounthistory of one
+address, of all addresses, of the wallet's addresses, with maxBlockHeight,
+depth and token filters, paging through the whole history of some addresses;
+accounthistorycount of one and of all addresses, with and without a token
+filter; listaccounts with the default page and paging through all accounts.
+
+Run e.g. with
+    rpc_accounthistory_bench.py --addresses 1000 --blocks 200 --transfersperblock 50 --recipients 50 --benchmarkoutput history.json
+"""
+
+import random
+
+from test_framework.benchmark import DefiBenchmarkFramework
+from test_framework.util import assert_equal
+
+
+class AccountHistoryBenchmark(DefiBenchmarkFramework):
+    def set_test_params(self):
+        self.num_nodes = 1
+        self.setup_clean_chain = True
+        self.extra_args = [
+            ['-acindex=1', '-txnotokens=0', '-amkheight=1', '-bayfrontheight=1', '-bayfrontgardensheight=1', '-eunosheight=1'],
+        ]
+        self.AMOUNT_TOKEN = 1000
+        self.PAGE = 100
+
+    def add_benchmark_options(self, parser):
+        parser.add_argument("--addresses", dest="addresses", default=100, type=int,
+                            help="number of addresses with history (default: %(default)s)")
+        parser.add_argument("--tokens", dest="tokens", default=3, type=int,
+                            help="number of tokens transferred (default: %(default)s)")
+        parser.add_argument("--blocks", dest="blocks", default=20, type=int,
+                            help="number of blocks of transfers (default: %(default)s)")
+        parser.add_argument("--transfersperblock", dest="transfers_per_block", default=20, type=int,
+                            help="accounttoaccount transactions per block (default: %(default)s)")
+        parser.add_argument("--recipients", dest="recipients", default=20, type=int,
+                            help="recipients per transaction (default: %(default)s)")
+        parser.add_argument("--queries", dest="queries", default=20, type=int,
+                            help="calls per measured query (default: %(default)s)")
+
+    def setup_accounts(self):
+        node = self.nodes[0]
+        owner = node.getnewaddress("", "legacy")
+        self.fund_auth([owner])
+        symbols = ["HIST" + str(i) for i in range(self.options.tokens)]
+        for symbol in symbols:
+            node.createtoken({
+                "symbol": symbol,
+                "name": "Token " + symbol,
+                "collateralAddress": owner
+            })
+        node.generate(1)
+        self.tokens = self.token_ids(symbols)
+
+        self.fund_auth([owner])
+        node.minttokens([str(self.AMOUNT_TOKEN * self.options.addresses) + "@" + token for token in self.tokens])
+        node.generate(1)
+
+        self.addresses = [node.getnewaddress("", "legacy") for _ in range(self.options.addresses)]
+        self.send_tokens(owner, self.addresses, [str(self.AMOUNT_TOKEN) + "@" + token for token in self.tokens])
+
+    def fill_history(self):
+        node = self.nodes[0]
+        recipients = min(self.options.recipients, len(self.addresses) - 1)
+        next_sender = 0
+        for block in range(self.options.blocks):
+            senders = [self.addresses[(next_sender + i) % len(self.addresses)] for i in range(self.options.transfers_per_block)]
+            next_sender = (next_sender + len(senders)) % len(self.addresses)
+            # sendmany pays every address once, so fund repeated senders in rounds
+            for round_start in range(0, len(senders), len(self.addresses)):
+                node.sendmany("", {sender: 0.1 for sender in senders[round_start:round_start + len(self.addresses)]})
+            node.generate(1)
+
+            for sender in senders:
+                others = random.sample([a for a in self.addresses if a != sender], recipients)
+                outputs = {to: "{:.8f}@{}".format(random.uniform(0.0001, 0.001), random.choice(self.tokens)) for to in others}
+                with self.results.timer("accounttoaccount_ms"):
+                    node.accounttoaccount(sender, outputs)
+            self.mark_log()
+            node.generate(1)
+            self.results.add_block_timings("block", self.block_timings())
+            assert_equal(len(node.getrawmempool()), 0)
+            if (block + 1) % 10 == 0:
+                self.log.info("{}/{} blocks of transfers".format(block + 1, self.options.blocks))
+
+    def page_history(self, owner):
+        """Page through the whole history of owner, returning the number of entries."""
+        node = self.nodes[0]
+        options = {"limit": self.PAGE}
+        entries = 0
+        while True:
+            with self.results.timer("listaccounthistory_page_ms"):
+                page = node.listaccounthistory(owner, options)
+            entries += len(page)
+            if len(page) < self.PAGE:
+                return entries
+            last = page[-1]
+            if last["txn"] > 0:
+                options = {"limit": self.PAGE, "maxBlockHeight": last["blockHeight"], "txn": last["txn"] - 1}
+            else:
+                options = {"limit": self.PAGE, "maxBlockHeight": last["blockHeight"] - 1}
+
+    def page_accounts(self):
+        """Page through all account balances, returning their number."""
+        node = self.nodes[0]
+        pagination = {"limit": self.PAGE}
+        accounts = 0
+        while True:
+            with self.results.timer("listaccounts_page_ms"):
+                page = node.listaccounts(pagination, False)
+            accounts += len(page)
+            if len(page) < self.PAGE:
+                return accounts
+            pagination = {"start": page[-1]["key"], "including_start": False, "limit": self.PAGE}
+
+    def measure_queries(self):
+        node = self.nodes[0]
+        height = node.getblockcount()
+        first_height = height - self.options.blocks * 2
+        for _ in range(self.options.queries):
+            address = random.choice(self.addresses)
+            token = random.choice(self.tokens)
+            max_height = random.randint(first_height, height)
+            with self.results.timer("listaccounthistory_address_ms"):
+                node.listaccounthistory(address)
+            with self.results.timer("listaccounthistory_all_ms"):
+                node.listaccounthistory("all")
+            with self.results.timer("listaccounthistory_mine_ms"):
+                node.listaccounthistory("mine")
+            with self.results.timer("listaccounthistory_maxblockheight_ms"):
+                node.listaccounthistory("all", {"maxBlockHeight": max_height})
+            with self.results.timer("listaccounthistory_depth_ms"):
+                node.listaccounthistory("all", {"maxBlockHeight": max_height, "depth": 10})
+            with self.results.timer("listaccounthistory_token_ms"):
+                node.listaccounthistory("all", {"token": token})
+            with self.results.timer("listaccounthistory_address_token_ms"):
+                node.listaccounthistory(address, {"token": token})
+            with self.results.timer("accounthistorycount_address_ms"):
+                node.accounthistorycount(address)
+            with self.results.timer("accounthistorycount_address_token_ms"):
+                node.accounthistorycount(address, {"token": token})
+            with self.results.timer("listaccounts_ms"):
+                node.listaccounts()
+        for _ in range(max(1, self.options.queries // 10)):
+            with self.results.timer("accounthistorycount_all_ms"):
+                entries = node.accounthistorycount("all")
+            with self.results.timer("accounthistorycount_all_token_ms"):
+                node.accounthistorycount("all", {"token": random.choice(self.tokens)})
+        self.results.set("history_entries", entries)
+
+        for address in random.sample(self.addresses, min(3, len(self.addresses))):
+            assert_equal(self.page_history(address), node.accounthistorycount(address))
+        self.results.set("account_balances", self.page_accounts())
+
+    def run_test(self):
+        node = self.nodes[0]
+        node.generate(101)
+        self.start_benchmark("account_history", [
+            ("addresses", self.options.addresses),
+            ("tokens", self.options.tokens),
+            ("blocks", self.options.blocks),
+            ("transfers_per_block", self.options.transfers_per_block),
+            ("recipients", self.options.recipients),
+            ("queries", self.options.queries),
+        ])
+        self.log.info("Creating {} tokens and {} accounts...".format(self.options.tokens, self.options.addresses))
+        self.setup_accounts()
+        self.log.info("Filling history...")
+        self.fill_history()
+        self.log.info("Measuring queries...")
+        self.measure_queries()
+        self.write_results()
+
+
+if __name__ == '__main__':
+    AccountHistoryBenchmark().main()
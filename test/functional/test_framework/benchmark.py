@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+"""Helpers for benchmark scenarios run as functional tests.
+
+A benchmark is a test script deriving from DefiBenchmarkFramework. It records
+latencies and other measurements in a BenchmarkResults, which logs a summary
+of every metric (count, mean, percentiles) at the end of the run and, with
+--benchmarkoutput, writes them as JSON together with the parameters of the
+run and the version of defid, so results can be compared across releases.
+
+Block connect and disconnect times are read from the `bench` debug category
+of the node's debug.log, which the test framework enables by default."""
+
+import calendar
+import collections
+import contextlib
+import json
+import os
+import re
+import time
+
+from .resource_sampler import peak
+from .test_framework import DefiTestFramework
+
+RESULTS_VERSION = 1
+
+# ConnectTip and DisconnectTip log one line per block in the bench category
+BLOCK_LINE = re.compile(r' - (Connect|Disconnect) block: ([0-9.]+)ms')
+# ConnectBlock, also run on block templates, so the count of the last one
+# before a "Connect block" line is the one of the connected block
+TRANSACTIONS_LINE = re.compile(r' - Connect (\d+) transactions: ([0-9.]+)ms')
+CONNECT_TOTAL_LINE = re.compile(r' - Connect total: ([0-9.]+)ms')
+FLUSH_LINE = re.compile(r' - Flush: ([0-9.]+)ms')
+
+# total_ms is the whole ConnectTip or DisconnectTip, connect_ms the part in
+# ConnectBlock (None for disconnects), flush_ms the flush of the view.
+BlockTiming = collections.namedtuple('BlockTiming', ('event', 'total_ms', 'connect_ms', 'flush_ms', 'transactions'))
+
+
+def percentile(values, fraction):
+    """Return the fraction (0 to 1) percentile of values, interpolating between ranks."""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    rank = (len(ordered) - 1) * fraction
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(values):
+    """Return count, total, mean, min, p50, p95, p99 and max of values."""
+    values = list(values)
+    if not values:
+        return collections.OrderedDict([('count', 0)])
+    return collections.OrderedDict([
+        ('count', len(values)),
+        ('total', sum(values)),
+        ('mean', sum(values) / len(values)),
+        ('min', min(values)),
+        ('p50', percentile(values, 0.5)),
+        ('p95', percentile(values, 0.95)),
+        ('p99', percentile(values, 0.99)),
+        ('max', max(values)),
+    ])
+
+
+def parse_block_timings(lines):
+    """Return the BlockTiming of every block connected or disconnected in debug.log lines."""
+    timings = []
+    connect_ms = flush_ms = transactions = None
+    for line in lines:
+        match = BLOCK_LINE.search(line)
+        if match:
+            event = match.group(1).lower()
+            if event == 'connect':
+                timings.append(BlockTiming(event, float(match.group(2)), connect_ms, flush_ms, transactions))
+            else:
+                timings.append(BlockTiming(event, float(match.group(2)), None, None, None))
+            connect_ms = flush_ms = transactions = None
+            continue
+        match = TRANSACTIONS_LINE.search(line)
+        if match:
+            transactions = int(match.group(1))
+            continue
+        match = CONNECT_TOTAL_LINE.search(line)
+        if match:
+            connect_ms = float(match.group(1))
+            continue
+        match = FLUSH_LINE.search(line)
+        if match:
+            flush_ms = float(match.group(1))
+    return timings
+
+
+class DebugLogReader():
+    """Reads the block timings a node logged since the last mark."""
+
+    def __init__(self, node):
+        self.path = os.path.join(node.datadir, node.chain, 'debug.log')
+        self.position = 0
+        self.mark()
+
+    def mark(self):
+        """Skip everything logged so far."""
+        try:
+            self.position = os.path.getsize(self.path)
+        except OSError:
+            self.position = 0
+
+    def read_lines(self):
+        """Return the complete lines logged since the last mark or read."""
+        with open(self.path, 'rb') as f:
+            f.seek(self.position)
+            data = f.read()
+        # A line may be in the middle of being written
+        end = data.rfind(b'\n') + 1
+        self.position += end
+        return data[:end].decode('utf8', 'replace').splitlines()
+
+    def read_block_timings(self):
+        return parse_block_timings(self.read_lines())
+
+
+class Pacer():
+    """Spaces out calls of wait() to a target rate per second.
+
+    Submissions that fall behind the schedule are not made up for with a
+    burst. A rate of 0 does not wait at all."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next = None
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.perf_counter()
+        if self.next is not None and self.next > now:
+            time.sleep(self.next - now)
+            now = self.next
+        self.next = now + self.interval
+
+
+class BenchmarkResults():
+    """Measurements of one benchmark run.
+
+    Metrics are series of samples (e.g. the latency of every call of an RPC,
+    in milliseconds) summarized by percentiles. Values are single numbers
+    (e.g. swaps per second over the whole run)."""
+
+    def __init__(self, name, params):
+        self.name = name
+        self.params = collections.OrderedDict(params)
+        self.metrics = collections.OrderedDict()
+        self.values = collections.OrderedDict()
+        self.started = time.time()
+
+    def add(self, metric, value):
+        self.metrics.setdefault(metric, []).append(value)
+
+    @contextlib.contextmanager
+    def timer(self, metric):
+        """Context manager that adds the time the block took, in milliseconds, to metric."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(metric, (time.perf_counter() - start) * 1000)
+
+    def set(self, metric, value):
+        self.values[metric] = value
+
+    def summary(self, metric):
+        return summarize(self.metrics.get(metric, []))
+
+    def add_block_timings(self, prefix, timings):
+        """Add the times of connected and disconnected blocks as <prefix>_connect_ms etc."""
+        for timing in timings:
+            if timing.event == 'connect':
+                self.add(prefix + '_connect_ms', timing.total_ms)
+                if timing.connect_ms is not None:
+                    self.add(prefix + '_connectblock_ms', timing.connect_ms)
+            else:
+                self.add(prefix + '_disconnect_ms', timing.total_ms)
+
+    def to_dict(self):
+        return collections.OrderedDict([
+            ('version', RESULTS_VERSION),
+            ('name', self.name),
+            ('started', self.started),
+            ('duration', time.time() - self.started),
+            ('params', self.params),
+            ('metrics', collections.OrderedDict((m, self.summary(m)) for m in self.metrics)),
+            ('values', self.values),
+        ])
+
+    def write(self, path, extra=None):
+        results = self.to_dict()
+        results.update(extra or {})
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp, 'w', encoding='utf8') as f:
+            json.dump(results, f, indent=1)
+            f.write('\n')
+        os.replace(tmp, path)
+
+    def log_summary(self, log):
+        log.info("Benchmark {} ({})".format(self.name, ", ".join("{}={}".format(k, v) for k, v in self.params.items())))
+        for metric in self.metrics:
+            s = self.summary(metric)
+            log.info("  {}: n={} mean={:.3f} p50={:.3f} p95={:.3f} p99={:.3f} max={:.3f}".format(
+                metric, s['count'], s['mean'], s['p50'], s['p95'], s['p99'], s['max']))
+        for metric, value in self.values.items():
+            log.info("  {}: {}".format(metric, round(value, 3) if isinstance(value, float) else value))
+
+
+class DefiBenchmarkFramework(DefiTestFramework):
+    """Base class for benchmark scenarios.
+
+    Scripts override add_benchmark_options() to add their scale parameters,
+    record measurements in self.results (created by start_benchmark()) and
+    call write_results() at the end of run_test."""
+
+    # Not a test script itself, see DefiTestMetaClass
+    abstract = True
+
+    # Keep every address' chain of unconfirmed transactions short
+    BATCH = 20
+
+    def add_options(self, parser):
+        parser.add_argument("--benchmarkoutput", dest="benchmark_output", metavar="FILE",
+                            help="write the benchmark results as JSON to FILE")
+        self.add_benchmark_options(parser)
+
+    def add_benchmark_options(self, parser):
+        """Override this method to add the parameters of the benchmark"""
+        pass
+
+    def start_benchmark(self, name, params):
+        self.results = BenchmarkResults(name, params)
+        self.log_readers = [DebugLogReader(node) for node in self.nodes]
+        return self.results
+
+    def block_timings(self, node=None):
+        """Return the timings of the blocks node (default: node0) connected or disconnected since the last call."""
+        node = node or self.nodes[0]
+        return self.log_readers[node.index].read_block_timings()
+
+    def mark_log(self, node=None):
+        node = node or self.nodes[0]
+        self.log_readers[node.index].mark()
+
+    def fund_auth(self, addresses):
+        """Send one utxo to each of addresses to authorize its next transaction, and mine it."""
+        self.nodes[0].sendmany("", {address: 0.1 for address in addresses})
+        self.nodes[0].generate(1)
+
+    def send_tokens(self, owner, addresses, amounts):
+        """Send amounts (a list of "amount@token") from the account of owner to each of addresses."""
+        node = self.nodes[0]
+        for start in range(0, len(addresses), 50):
+            self.fund_auth([owner])
+            node.accounttoaccount(owner, {address: amounts for address in addresses[start:start + 50]})
+            node.generate(1)
+
+    def token_ids(self, symbols):
+        """Return the ids of the tokens with symbols, in the same order."""
+        # Symbols of non-DAT tokens get the id appended, so look the ids up
+        ids = {token["symbol"]: idx for idx, token in self.nodes[0].listtokens().items()}
+        return [ids[symbol] for symbol in symbols]
+
+    def run_batches(self, metric, function, arguments):
+        """Call function with each of arguments, timing it as metric and mining a block after every BATCH calls."""
+        returned = []
+        for start in range(0, len(arguments), self.BATCH):
+            for args in arguments[start:start + self.BATCH]:
+                with self.results.timer(metric):
+                    returned.append(function(*args))
+            self.nodes[0].generate(1)
+        return returned
+
+    def setup_oracle(self, prices):
+        """Appoint an oracle over the USD prices of prices (a list of (symbol, price)) and set them.
+
+        Returns the oracle id."""
+        node = self.nodes[0]
+        address = node.getnewaddress("", "legacy")
+        oracle_id = node.appointoracle(address, [{"currency": "USD", "token": symbol} for symbol, _ in prices], 10)
+        node.generate(1)
+        self.set_oracle_prices(oracle_id, prices)
+        node.generate(1)
+        return oracle_id
+
+    def set_oracle_prices(self, oracle_id, prices):
+        """Submit the USD prices of prices (a list of (symbol, price)) from oracle_id."""
+        token_prices = [{"currency": "USD", "tokenAmount": "{:.8f}@{}".format(price, symbol)} for symbol, price in prices]
+        return self.nodes[0].setoracledata(oracle_id, calendar.timegm(time.gmtime()), token_prices)
+
+    def setup_loan_token(self, symbol, interest=1):
+        """Create the mintable loan token symbol, priced by the oracle feed symbol/USD."""
+        self.nodes[0].setloantoken({
+            'symbol': symbol,
+            'name': symbol,
+            'fixedIntervalPriceId': "{}/USD".format(symbol),
+            'mintable': True,
+            'interest': interest})
+
+    def setup_loan_scheme(self, ratio, scheme_id):
+        """Make DFI a collateral token and create a loan scheme with ratio and 1% interest."""
+        node = self.nodes[0]
+        node.setcollateraltoken({
+            'token': "DFI",
+            'factor': 1,
+            'fixedIntervalPriceId': "DFI/USD"})
+        node.createloanscheme(ratio, 1, scheme_id)
+
+    def write_results(self):
+        extra = collections.OrderedDict()
+        info = self.nodes[0].getnetworkinfo()
+        extra['node'] = collections.OrderedDict([('version', info['version']), ('subversion', info['subversion'])])
+        for node in self.nodes:
+            node.resource_sampler.sample_now()
+            rss_kb = peak(node.resource_sampler.since(0), 'rss_kb')
+            if rss_kb is not None:
+                self.results.set('node{}_peak_rss_kb'.format(node.index), rss_kb)
+        self.results.log_summary(self.log)
+        if self.options.benchmark_output:
+            path = os.path.abspath(self.options.benchmark_output)
+            self.results.write(path, extra)
+            self.log.info("Benchmark results written to {}".format(path))
@@ -5,13 +5,100 @@
 """Utilities for doing coverage analysis on the RPC interface.
 
 Provides a way to track which RPC commands are exercised during
-testing.
+testing, and how long they take.
+
+Calls are aggregated in memory per node: the set of methods called, and per
+method the number of calls and errors, total and maximum latency, request and
+response bytes and a latency histogram. flush() writes them out once, at the
+end of the test, as the coverage file and a JSON stats file next to it, which
+test_runner merges into a report of the slowest RPCs.
 """
 
+import bisect
+import json
 import os
+import time
 
 
 REFERENCE_FILENAME = 'rpc_interface.txt'
+STATS_FILE_PREFIX = 'rpcstats.'
+
+# Upper bounds (in seconds) of the latency histogram buckets; the last bucket
+# holds everything slower.
+LATENCY_BUCKETS = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# Per coverage logfile: the set of covered methods and {method: stats}
+_covered = {}
+_stats = {}
+
+
+def new_method_stats():
+    return {
+        'calls': 0,
+        'errors': 0,
+        'total_time': 0.0,
+        'max_time': 0.0,
+        'request_bytes': 0,
+        'response_bytes': 0,
+        'histogram': [0] * (len(LATENCY_BUCKETS) + 1),
+    }
+
+
+def record_call(coverage_logfile, method, elapsed, request_bytes, response_bytes, error):
+    stats = _stats.setdefault(coverage_logfile, {}).get(method)
+    if stats is None:
+        stats = _stats[coverage_logfile][method] = new_method_stats()
+    stats['calls'] += 1
+    stats['errors'] += bool(error)
+    stats['total_time'] += elapsed
+    stats['max_time'] = max(stats['max_time'], elapsed)
+    stats['request_bytes'] += request_bytes
+    stats['response_bytes'] += response_bytes
+    stats['histogram'][bisect.bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+
+
+def merge_stats(into, stats):
+    """Add the {method: stats} dict stats to into."""
+    for method, other in stats.items():
+        merged = into.setdefault(method, new_method_stats())
+        for key in ('calls', 'errors', 'total_time', 'request_bytes', 'response_bytes'):
+            merged[key] += other[key]
+        merged['max_time'] = max(merged['max_time'], other['max_time'])
+        merged['histogram'] = [a + b for a, b in zip(merged['histogram'], other['histogram'])]
+    return into
+
+
+def latency_percentile(stats, fraction):
+    """Return the upper bound of the histogram bucket holding the given fraction of calls."""
+    needed = fraction * stats['calls']
+    seen = 0
+    for bound, count in zip(LATENCY_BUCKETS + [stats['max_time']], stats['histogram']):
+        seen += count
+        if seen >= needed:
+            return min(bound, stats['max_time'])
+    return stats['max_time']
+
+
+def get_stats_filename(coverage_logfile):
+    """Return the stats file belonging to a coverage file, e.g. rpcstats.pid1.node0.json"""
+    dirname, filename = os.path.split(coverage_logfile)
+    name = os.path.splitext(filename)[0]
+    if name.startswith('coverage.'):
+        name = name[len('coverage.'):]
+    return os.path.join(dirname, STATS_FILE_PREFIX + name + '.json')
+
+
+def flush():
+    """Write out the calls recorded in this process."""
+    for coverage_logfile, methods in _covered.items():
+        with open(coverage_logfile, 'a+', encoding='utf8') as f:
+            f.writelines("%s\n" % method for method in sorted(methods))
+    for coverage_logfile, stats in _stats.items():
+        with open(get_stats_filename(coverage_logfile), 'w', encoding='utf8') as f:
+            json.dump(stats, f)
+    _covered.clear()
+    _stats.clear()
 
 
 class AuthServiceProxyWrapper():
@@ -24,8 +111,8 @@ class AuthServiceProxyWrapper():
         Kwargs:
             auth_service_proxy_instance (AuthServiceProxy): the instance
                 being wrapped.
-            coverage_logfile (str): if specified, write each service_name
-                out to a file when called.
+            coverage_logfile (str): if specified, record each service_name
+                and its latency when called, see flush().
 
         """
         self.auth_service_proxy_instance = auth_service_proxy_instance
@@ -40,11 +127,22 @@ class AuthServiceProxyWrapper():
 
     def __call__(self, *args, **kwargs):
         """
-        Delegates to AuthServiceProxy, then writes the particular RPC method
-        called to a file.
+        Delegates to AuthServiceProxy, then records the particular RPC method
+        called and its latency.
 
         """
-        return_val = self.auth_service_proxy_instance.__call__(*args, **kwargs)
+        if not self.coverage_logfile:
+            return self.auth_service_proxy_instance.__call__(*args, **kwargs)
+        proxy = self.auth_service_proxy_instance
+        start = time.time()
+        try:
+            return_val = proxy.__call__(*args, **kwargs)
+        except Exception:
+            record_call(self.coverage_logfile, proxy._service_name, time.time() - start,
+                        proxy.last_request_size, proxy.last_response_size, True)
+            raise
+        record_call(self.coverage_logfile, proxy._service_name, time.time() - start,
+                    proxy.last_request_size, proxy.last_response_size, False)
         self._log_call()
         return return_val
 
@@ -52,8 +150,7 @@ class AuthServiceProxyWrapper():
         rpc_method = self.auth_service_proxy_instance._service_name
 
         if self.coverage_logfile:
-            with open(self.coverage_logfile, 'a+', encoding='utf8') as f:
-                f.write("%s\n" % rpc_method)
+            _covered.setdefault(self.coverage_logfile, set()).add(rpc_method)
 
     def __truediv__(self, relative_uri):
         return AuthServiceProxyWrapper(self.auth_service_proxy_instance / relative_uri,
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+"""Per-phase profiling of the nodes under test.
+
+A PhaseProfiler profiles every running node for the duration of a named
+phase of a test (setup, run_test or a step of it, shutdown). Nodes started
+during a phase are attached when they start. At the end of a phase the
+samples of each node are folded into collapsed stacks, one
+`frame;frame;...;leaf count` line per distinct stack, the format read by
+flamegraph.pl and speedscope, and written to
+`<tmpdir>/profiles/<phase>.node<i>.folded`. The frames with the most self
+time are logged.
+
+Stacks are recorded with `perf record` where perf is installed and allowed
+to profile the node. Otherwise, or if perf did not collect anything, the
+profile falls back to the CPU time of each thread of the node as read from
+/proc/<pid>/task, folded as `defid;<thread name>` stacks, which still shows
+where the node spends its time at thread granularity."""
+
+import collections
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+
+# Interval of the /proc fallback; threads exiting between two samples lose
+# the CPU time they used since the previous one.
+PROC_INTERVAL = 0.1
+
+# Header line of an event in `perf script` output: comm, pid[/tid], ...
+PERF_EVENT = re.compile(r'^(\S.*?)\s+\d+(?:/\d+)?\s')
+
+
+def perf_available():
+    return sys.platform.startswith('linux') and shutil.which('perf') is not None
+
+
+def fold_perf_script(lines):
+    """Fold `perf script` output into a Counter of collapsed stacks."""
+    stacks = collections.Counter()
+    comm = None
+    frames = []
+
+    def flush():
+        if comm is not None:
+            stacks[';'.join([comm] + frames[::-1])] += 1
+
+    for line in lines:
+        if not line.strip():
+            flush()
+            comm = None
+            frames = []
+            continue
+        if not line[0].isspace():
+            flush()
+            frames = []
+            match = PERF_EVENT.match(line)
+            comm = match.group(1) if match else line.split()[0]
+            continue
+        # "    addr symbol+0xoff (dso)", innermost frame first
+        parts = line.strip().split(' ', 1)
+        if len(parts) < 2:
+            continue
+        symbol, _, dso = parts[1].rpartition(' (')
+        symbol = re.sub(r'\+0x[0-9a-f]+$', '', symbol)
+        if not symbol or symbol == '[unknown]':
+            symbol = '[{}]'.format(os.path.basename(dso.rstrip(')')))
+        frames.append(symbol.replace(';', ':'))
+    flush()
+    return stacks
+
+
+def top_self(stacks, n):
+    """Return the n leaf frames with the most samples as (frame, share) pairs."""
+    leaves = collections.Counter()
+    for stack, count in stacks.items():
+        leaves[stack.rsplit(';', 1)[-1]] += count
+    total = sum(leaves.values())
+    return [(frame, count / total) for frame, count in leaves.most_common(n)]
+
+
+def write_folded(path, stacks):
+    with open(path, 'w', encoding='utf8') as f:
+        for stack, count in sorted(stacks.items()):
+            f.write('{} {}\n'.format(stack, count))
+
+
+class PerfRecorder():
+    """Records stacks of one process with `perf record`."""
+
+    def __init__(self, pid, output_path):
+        self.output_path = output_path
+        self.process = subprocess.Popen(
+            ['perf', 'record', '-g', '-F', '99', '-p', str(pid), '-o', output_path],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def stop(self):
+        """Stop recording and return the folded stacks (empty if perf failed)."""
+        if self.process.poll() is None:
+            self.process.terminate()
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        if not os.path.exists(self.output_path):
+            return collections.Counter()
+        try:
+            script = subprocess.run(['perf', 'script', '-i', self.output_path],
+                                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=300)
+        except (OSError, subprocess.TimeoutExpired):
+            return collections.Counter()
+        finally:
+            os.remove(self.output_path)
+        return fold_perf_script(script.stdout.decode('utf8', 'replace').splitlines())
+
+
+class ProcRecorder():
+    """Accumulates the CPU time of each thread of one process from /proc."""
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.comm = self._read('/proc/{}/comm'.format(pid)) or 'defid'
+        self.last = {}
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+        self._sample()
+        self._thread = threading.Thread(target=self._run, name="proc-profile-{}".format(pid), daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, 'r', encoding='utf8') as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _sample(self):
+        task_dir = '/proc/{}/task'.format(self.pid)
+        try:
+            tids = os.listdir(task_dir)
+        except OSError:
+            return False
+        for tid in tids:
+            stat = self._read(os.path.join(task_dir, tid, 'stat'))
+            if stat is None:
+                continue
+            name = stat[stat.index('(') + 1:stat.rindex(')')]
+            fields = stat[stat.rindex(')') + 2:].split()
+            ticks = int(fields[11]) + int(fields[12])
+            previous = self.last.get(tid)
+            if previous is not None:
+                self.stacks['{};{}'.format(self.comm, name.replace(';', ':'))] += ticks - previous
+            self.last[tid] = ticks
+        return True
+
+    def _run(self):
+        while not self._stop.wait(PROC_INTERVAL):
+            if not self._sample():
+                break
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join(timeout=10)
+        self._sample()
+        return collections.Counter(dict((stack, ticks) for stack, ticks in self.stacks.items() if ticks > 0))
+
+
+class PhaseProfiler():
+    """Profiles the nodes under test per named phase, see the module docstring."""
+
+    def __init__(self, output_dir, log, top=10):
+        self.output_dir = output_dir
+        self.log = log
+        self.top = top
+        self.use_perf = perf_available()
+        self.phases = []
+        self.counts = collections.Counter()
+        os.makedirs(output_dir, exist_ok=True)
+
+    def start_phase(self, name, nodes):
+        # Phases may repeat (e.g. a step run in a loop); number the repeats
+        self.counts[name] += 1
+        if self.counts[name] > 1:
+            name = '{}.{}'.format(name, self.counts[name])
+        phase = (name, {})
+        self.phases.append(phase)
+        for node in nodes:
+            if node.running:
+                self._attach(phase, node)
+        return phase
+
+    def attach(self, node):
+        """Attach a node that just started to all phases in progress."""
+        for phase in self.phases:
+            self._attach(phase, node)
+
+    def _attach(self, phase, node):
+        name, recorders = phase
+        pid = node.process.pid
+        if (node.index, pid) in recorders:
+            return
+        perf = None
+        if self.use_perf:
+            output_path = os.path.join(self.output_dir, '{}.node{}.{}.perf.data'.format(name, node.index, pid))
+            try:
+                perf = PerfRecorder(pid, output_path)
+            except OSError:
+                self.use_perf = False
+        recorders[(node.index, pid)] = (perf, ProcRecorder(pid))
+
+    def end_phase(self, phase):
+        self.phases.remove(phase)
+        name, recorders = phase
+        per_node = collections.defaultdict(collections.Counter)
+        for (index, _), (perf, proc) in sorted(recorders.items()):
+            proc_stacks = proc.stop()
+            stacks = perf.stop() if perf is not None else None
+            per_node[index].update(stacks or proc_stacks)
+        for index, stacks in sorted(per_node.items()):
+            if not stacks:
+                continue
+            write_folded(os.path.join(self.output_dir, '{}.node{}.folded'.format(name, index)), stacks)
+            frames = ', '.join('{} {:.1%}'.format(frame, share) for frame, share in top_self(stacks, self.top))
+            self.log.info("Profile {} node{}: {}".format(name, index, frames))
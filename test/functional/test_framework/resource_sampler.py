@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+"""Background sampler of a node's resource usage read from /proc.
+
+A ResourceSampler reads /proc/<pid>/status, stat, io and fd of a running
+defid at a fixed interval and records RSS, CPU time, threads, open file
+descriptors and storage read/write bytes. Samples are kept in memory for the
+assertions in TestNode and benchmarks. With sampling enabled they are also
+appended to a CSV file in the node's datadir, so the time series of a failed
+or slow test can be inspected afterwards.
+
+Only Linux provides /proc; elsewhere sampling is silently unavailable."""
+
+import collections
+import os
+import threading
+import time
+
+FIELDS = ('rss_kb', 'cpu_seconds', 'threads', 'fds', 'read_bytes', 'write_bytes')
+
+# pid tells the runs of a restarted node apart; CPU time and I/O bytes are
+# cumulative per run.
+Sample = collections.namedtuple('Sample', ('time', 'pid') + FIELDS)
+
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = 100
+
+
+def proc_available(pid):
+    return os.path.exists('/proc/{}/status'.format(pid))
+
+
+def _read(path):
+    with open(path, 'r', encoding='utf8') as f:
+        return f.read()
+
+
+def read_sample(pid):
+    """Return a Sample of the process' current resource usage.
+
+    Raises OSError if the process is gone. Values that cannot be read (e.g.
+    /proc/<pid>/io of another user's process) are None."""
+    now = time.time()
+    rss_kb = threads = None
+    for line in _read('/proc/{}/status'.format(pid)).splitlines():
+        if line.startswith('VmRSS:'):
+            rss_kb = int(line.split()[1])
+        elif line.startswith('Threads:'):
+            threads = int(line.split()[1])
+
+    # The command name in parentheses may contain spaces, so split after it.
+    # utime and stime are the 14th and 15th fields.
+    stat = _read('/proc/{}/stat'.format(pid))
+    fields = stat[stat.rindex(')') + 2:].split()
+    cpu_seconds = (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+    read_bytes = write_bytes = None
+    try:
+        for line in _read('/proc/{}/io'.format(pid)).splitlines():
+            key, _, value = line.partition(':')
+            if key == 'read_bytes':
+                read_bytes = int(value)
+            elif key == 'write_bytes':
+                write_bytes = int(value)
+    except PermissionError:
+        pass
+
+    try:
+        fds = len(os.listdir('/proc/{}/fd'.format(pid)))
+    except PermissionError:
+        fds = None
+
+    return Sample(now, pid, rss_kb, cpu_seconds, threads, fds, read_bytes, write_bytes)
+
+
+def peak(samples, field):
+    """Return the highest value of field in samples, or None."""
+    values = [getattr(s, field) for s in samples if getattr(s, field) is not None]
+    return max(values) if values else None
+
+
+def total(samples, field):
+    """Return the sum over all runs of the cumulative field, or None."""
+    runs = {}
+    for s in samples:
+        if getattr(s, field) is not None:
+            runs[s.pid] = max(runs.get(s.pid, 0), getattr(s, field))
+    return sum(runs.values()) if runs else None
+
+
+def slope(samples, field):
+    """Return the least squares increase of field per second over samples, or None."""
+    points = [(s.time, getattr(s, field)) for s in samples if getattr(s, field) is not None]
+    if len(points) < 2:
+        return None
+    mean_t = sum(t for t, _ in points) / len(points)
+    mean_v = sum(v for _, v in points) / len(points)
+    var_t = sum((t - mean_t) ** 2 for t, _ in points)
+    if var_t == 0:
+        return None
+    return sum((t - mean_t) * (v - mean_v) for t, v in points) / var_t
+
+
+class ResourceSampler():
+    """Samples one node's resource usage, across restarts of the node.
+
+    With an interval of 0 no background thread is started and no CSV file is
+    written, but sample_now() still works, so assertions can compare explicit
+    samples."""
+
+    def __init__(self, index, path, interval):
+        self.index = index
+        self.path = path
+        self.interval = interval
+        self.samples = []
+        self.pid = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._file = None
+        self._stop = threading.Event()
+
+    @property
+    def available(self):
+        return self.pid is not None
+
+    def start(self, pid):
+        """Start sampling the process pid (a no-op where /proc is unavailable)."""
+        self.stop()
+        if not proc_available(pid):
+            return
+        self.pid = pid
+        if self.interval > 0:
+            new_file = not os.path.exists(self.path)
+            self._file = open(self.path, 'a', encoding='utf8')
+            if new_file:
+                self._file.write(','.join(Sample._fields) + '\n')
+        self.sample_now()
+        if self.interval > 0:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="resources-node{}".format(self.index), daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join(timeout=10)
+            self._thread = None
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        self.pid = None
+
+    def sample_now(self):
+        """Take and record a sample. Returns None if the process is gone."""
+        pid = self.pid
+        if pid is None:
+            return None
+        try:
+            sample = read_sample(pid)
+        except (OSError, ValueError, IndexError):
+            return None
+        with self._lock:
+            self.samples.append(sample)
+            if self._file is not None:
+                self._file.write(','.join('' if v is None else str(v) for v in sample) + '\n')
+                self._file.flush()
+        return sample
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.sample_now() is None:
+                break
+
+    def since(self, start_time):
+        with self._lock:
+            return [s for s in self.samples if s.time >= start_time]
+
+    def summary(self):
+        """Return a one line summary of all samples, or None if there are none."""
+        with self._lock:
+            samples = list(self.samples)
+        if not samples:
+            return None
+        parts = ["{} samples".format(len(samples))]
+        if peak(samples, 'rss_kb') is not None:
+            parts.append("peak RSS {:.1f} MiB".format(peak(samples, 'rss_kb') / 1024))
+        if total(samples, 'cpu_seconds') is not None:
+            parts.append("CPU {:.2f}s".format(total(samples, 'cpu_seconds')))
+        if peak(samples, 'threads') is not None:
+            parts.append("peak threads {}".format(peak(samples, 'threads')))
+        if peak(samples, 'fds') is not None:
+            parts.append("peak fds {}".format(peak(samples, 'fds')))
+        if total(samples, 'read_bytes') is not None:
+            parts.append("read {:.1f} MiB, written {:.1f} MiB".format(
+                total(samples, 'read_bytes') / 2**20, (total(samples, 'write_bytes') or 0) / 2**20))
+        return ", ".join(parts)
@@ -5,6 +5,7 @@
 """Base class for RPC testing."""
 
 import configparser
+import contextlib
 from enum import Enum
 import logging
 import argparse
@@ -20,6 +21,7 @@ from .authproxy import JSONRPCException
 from . import coverage
 from .test_node import TestNode
 from .mininode import NetworkThread
+from .profiler import PhaseProfiler
 from .util import (
     MAX_NODES,
     PortSeed,
@@ -31,7 +33,9 @@ from .util import (
     initialize_datadir,
     sync_blocks,
     sync_mempools,
+    zmq_port,
 )
+from .zmq_listener import zmq_available
 
 
 class TestStatus(Enum):
@@ -59,11 +63,13 @@ class DefiTestMetaClass(type):
     Ensures that any attempt to register a subclass of `DefiTestFramework`
     adheres to a standard whereby the subclass overrides `set_test_params` and
     `run_test` but DOES NOT override either `__init__` or `main`. If any of
-    those standards are violated, a ``TypeError`` is raised."""
+    those standards are violated, a ``TypeError`` is raised. Base classes of
+    test scripts set ``abstract = True`` in their body and only need to adhere
+    to the second part."""
 
     def __new__(cls, clsname, bases, dct):
         if not clsname == 'DefiTestFramework':
-            if not ('run_test' in dct and 'set_test_params' in dct):
+            if not dct.get('abstract', False) and not ('run_test' in dct and 'set_test_params' in dct):
                 raise TypeError("DefiTestFramework subclasses must override "
                                 "'run_test' and 'set_test_params'")
             if '__init__' in dct or 'main' in dct:
@@ -98,6 +104,7 @@ class DefiTestFramework(metaclass=DefiTestMetaClass):
         self.rpc_timeout = 60  # Wait for up to 60 seconds for the RPC server to respond
         self.supports_cli = False
         self.bind_to_localhost_only = True
+        self.phase_profiler = None
         self.set_test_params()
 
         assert hasattr(self, "num_nodes"), "Test must set self.num_nodes in set_test_params()"
@@ -134,6 +141,14 @@ class DefiTestFramework(metaclass=DefiTestMetaClass):
                             help="run nodes under the valgrind memory error detector: expect at least a ~10x slowdown, valgrind 3.14 or later required")
         parser.add_argument("--randomseed", type=int,
                             help="set a random seed for deterministically reproducing a previous test run")
+        parser.add_argument("--zmqsync", dest="zmqsync", default=False, action="store_true",
+                            help="track node tips and mempools over ZMQ so that sync_blocks and sync_mempools don't poll RPC (requires python3-zmq and defid built with zmq)")
+        parser.add_argument("--profilephases", dest="profile_phases", default=False, action="store_true",
+                            help="profile nodes per test phase (setup, run_test and its profile_phase steps, shutdown) into collapsed stacks in <tmpdir>/profiles, using perf if available and per thread CPU time from /proc otherwise")
+        parser.add_argument("--profiletop", dest="profile_top", default=10, type=int, metavar="N",
+                            help="number of frames with the most self time logged per profiled phase (default: %(default)s)")
+        parser.add_argument("--resourceinterval", dest="resource_interval", default=0, type=float, metavar="SECONDS",
+                            help="sample the resource usage of running nodes from /proc every SECONDS into resources.csv in their datadirs, and log a summary at shutdown")
         self.add_options(parser)
         self.options = parser.parse_args()
 
@@ -179,6 +194,9 @@ class DefiTestFramework(metaclass=DefiTestMetaClass):
         random.seed(seed)
         self.log.debug("PRNG seed is: {}".format(seed))
 
+        if self.options.profile_phases:
+            self.phase_profiler = PhaseProfiler(os.path.join(self.options.tmpdir, "profiles"), self.log, self.options.profile_top)
+
         self.log.debug('Setting up network thread')
         self.network_thread = NetworkThread()
         self.network_thread.start()
@@ -191,9 +209,11 @@ class DefiTestFramework(metaclass=DefiTestMetaClass):
                     raise SkipTest("--usecli specified but test does not support using CLI")
                 self.skip_if_no_cli()
             self.skip_test_if_missing_module()
-            self.setup_chain()
-            self.setup_network()
-            self.run_test()
+            with self.profile_phase("setup"):
+                self.setup_chain()
+                self.setup_network()
+            with self.profile_phase("run_test"):
+                self.run_test()
             success = TestStatus.PASSED
         except JSONRPCException:
             self.log.exception("JSONRPC error")
@@ -218,7 +238,13 @@ class DefiTestFramework(metaclass=DefiTestMetaClass):
         if not self.options.noshutdown:
             self.log.info("Stopping nodes")
             if self.nodes:
-                self.stop_nodes()
+                with self.profile_phase("shutdown"):
+                    self.stop_nodes()
+            if self.options.resource_interval > 0:
+                for node in self.nodes:
+                    summary = node.resource_sampler.summary()
+                    if summary is not None:
+                        self.log.info("node{} resource usage: {}".format(node.index, summary))
         else:
             for node in self.nodes:
                 node.cleanup_on_exit = False
@@ -228,12 +254,13 @@ class DefiTestFramework(metaclass=DefiTestMetaClass):
             not self.options.nocleanup and
             not self.options.noshutdown and
             success != TestStatus.FAILED and
-            not self.options.perf
+            not self.options.perf and
+            not self.options.profile_phases
         )
         if should_clean_up:
             self.log.info("Cleaning up {} on exit".format(self.options.tmpdir))
             cleanup_tree_on_exit = True
-        elif self.options.perf:
+        elif self.options.perf or self.options.profile_phases:
             self.log.warning("Not cleaning up dir {} due to perf data".format(self.options.tmpdir))
             cleanup_tree_on_exit = False
         else:
@@ -250,6 +277,8 @@ class DefiTestFramework(metaclass=DefiTestMetaClass):
             self.log.error("Test failed. Test logging available at %s/test_framework.log", self.options.tmpdir)
             self.log.error("Hint: Call {} '{}' to consolidate all logs".format(os.path.normpath(os.path.dirname(os.path.realpath(__file__)) + "/../combine_logs.py"), self.options.tmpdir))
             exit_code = TEST_EXIT_FAILED
+        if self.options.coveragedir is not None:
+            coverage.flush()
         logging.shutdown()
         if cleanup_tree_on_exit:
             shutil.rmtree(self.options.tmpdir)
@@ -423,6 +452,10 @@ class DefiTestFramework(metaclass=DefiTestMetaClass):
             extra_args = [[]] * num_nodes
         if binary is None:
             binary = [self.options.defid] * num_nodes
+        use_zmq = self.options.zmqsync
+        if use_zmq and not (zmq_available() and self.is_zmq_compiled()):
+            self.log.warning("--zmqsync requires python3-zmq and defid built with zmq, syncing over RPC instead")
+            use_zmq = False
         assert_equal(len(extra_confs), num_nodes)
         assert_equal(len(extra_args), num_nodes)
         assert_equal(len(binary), num_nodes)
@@ -442,7 +475,25 @@ class DefiTestFramework(metaclass=DefiTestMetaClass):
                 use_cli=self.options.usecli,
                 start_perf=self.options.perf,
                 use_valgrind=self.options.valgrind,
+                zmq_port=zmq_port(i) if use_zmq else None,
+                resource_interval=self.options.resource_interval,
             ))
+            self.nodes[-1].phase_profiler = self.phase_profiler
+
+    @contextlib.contextmanager
+    def profile_phase(self, name):
+        """Context manager that profiles the nodes while the block runs, as phase `name`.
+
+        Only has an effect with --profilephases. Phases may be nested, e.g.
+        steps of run_test are profiled both on their own and as part of it."""
+        if self.phase_profiler is None:
+            yield
+            return
+        phase = self.phase_profiler.start_phase(name, self.nodes)
+        try:
+            yield
+        finally:
+            self.phase_profiler.end_phase(phase)
 
     def start_node(self, i, *args, **kwargs):
         """Start a defid"""
@@ -22,6 +22,7 @@ import shlex
 import sys
 
 from .authproxy import JSONRPCException
+from .resource_sampler import ResourceSampler, peak, read_sample, slope
 from .util import (
     append_config,
     delete_cookie_file,
@@ -30,6 +31,7 @@ from .util import (
     wait_until,
     p2p_port,
 )
+from .zmq_listener import ZMQListener
 
 DEFID_PROC_WAIT_TIMEOUT = 60
 
@@ -58,11 +60,17 @@ class TestNode():
     To make things easier for the test writer, any unrecognised messages will
     be dispatched to the RPC connection."""
 
-    def __init__(self, i, datadir, *, chain, rpchost, timewait, defid, defi_cli, coverage_dir, cwd, extra_conf=None, extra_args=None, use_cli=False, start_perf=False, use_valgrind=False):
+    def __init__(self, i, datadir, *, chain, rpchost, timewait, defid, defi_cli, coverage_dir, cwd, extra_conf=None, extra_args=None, use_cli=False, start_perf=False, use_valgrind=False, zmq_port=None, resource_interval=0):
         """
         Kwargs:
             start_perf (bool): If True, begin profiling the node with `perf` as soon as
                 the node starts.
+            zmq_port (int): If set, the node publishes block and transaction
+                notifications on this port and a ZMQListener keeps track of its
+                tip and mempool, see `sync_blocks` and `sync_mempools`.
+            resource_interval (float): If positive, sample the node's resource
+                usage from /proc every this many seconds into resources.csv in
+                the datadir, see `assert_resource_usage`.
         """
 
         self.index = i
@@ -108,6 +116,16 @@ class TestNode():
                          "--gen-suppressions=all", "--exit-on-first-error=yes",
                          "--error-exitcode=1", "--quiet"] + self.args
 
+        self.zmq_listener = None
+        if zmq_port is not None:
+            zmq_address = "tcp://127.0.0.1:{}".format(zmq_port)
+            self.args += ["-zmqpubhashtx=" + zmq_address, "-zmqpubrawblock=" + zmq_address]
+            self.zmq_listener = ZMQListener(i, zmq_address)
+
+        self.resource_sampler = ResourceSampler(i, os.path.join(self.datadir, "resources.csv"), resource_interval)
+        # Set by the test framework when profiling test phases (see profiler.py)
+        self.phase_profiler = None
+
         self.cli = TestNodeCLI(defi_cli, self.datadir)
         self.use_cli = use_cli
         self.start_perf = start_perf
@@ -175,12 +193,17 @@ class TestNode():
 
 
     def get_mem_rss_kilobytes(self):
-        """Get the memory usage (RSS) per `ps`.
+        """Get the memory usage (RSS) from /proc, or per `ps` where there is no /proc.
 
         Returns None if `ps` is unavailable.
         """
         assert self.running
 
+        try:
+            return read_sample(self.process.pid).rss_kb
+        except (OSError, ValueError, IndexError):
+            pass
+
         try:
             return int(subprocess.check_output(
                 ["ps", "h", "-o", "rss", "{}".format(self.process.pid)],
@@ -248,6 +271,10 @@ class TestNode():
         self.running = True
         self.log.debug("defid started, waiting for RPC to come up")
 
+        self.resource_sampler.start(self.process.pid)
+        if self.phase_profiler is not None:
+            self.phase_profiler.attach(self)
+
         if self.start_perf:
             self._start_perf()
 
@@ -269,6 +296,8 @@ class TestNode():
                 self.rpc = rpc
                 self.rpc_connected = True
                 self.url = self.rpc.url
+                if self.zmq_listener is not None:
+                    self.zmq_listener.start(self.rpc)
                 return
             except IOError as e:
                 if e.errno != errno.ECONNREFUSED:  # Port not yet open?
@@ -302,6 +331,9 @@ class TestNode():
         except http.client.CannotSendRequest:
             self.log.exception("Unable to stop node.")
 
+        if self.zmq_listener is not None:
+            self.zmq_listener.stop()
+
         # If there are any running perf processes, stop them.
         for profile_name in tuple(self.perf_subprocesses.keys()):
             self._stop_perf(profile_name)
@@ -336,6 +368,9 @@ class TestNode():
         self.process = None
         self.rpc_connected = False
         self.rpc = None
+        self.resource_sampler.stop()
+        if self.zmq_listener is not None:
+            self.zmq_listener.stop()
         self.log.debug("Node stopped")
         return True
 
@@ -395,6 +430,36 @@ class TestNode():
                     increase_allowed * 100, before_memory_usage, after_memory_usage,
                     perc_increase_memory_usage * 100))
 
+    @contextlib.contextmanager
+    def assert_resource_usage(self, field, *, peak_max=None, slope_max=None):
+        """Context manager that asserts on a node's resource usage while the block runs.
+
+        The samples taken by the background sampler during the block, plus one
+        at its start and end, are checked.
+
+        Args:
+            field (str): one of `resource_sampler.FIELDS`, e.g. 'rss_kb' or 'fds'.
+            peak_max: fail if field ever exceeded this value.
+            slope_max (float): fail if field grew faster than this many units
+                per second (least squares fit over the samples).
+        """
+        start_time = time.time()
+        self.resource_sampler.sample_now()
+
+        yield
+
+        self.resource_sampler.sample_now()
+        samples = self.resource_sampler.since(start_time)
+        if len(samples) < 2 or peak(samples, field) is None:
+            self.log.warning("Unable to sample {} - skipping resource check.".format(field))
+            return
+
+        if peak_max is not None and peak(samples, field) > peak_max:
+            self._raise_assertion_error("Peak {} {} over threshold of {}".format(field, peak(samples, field), peak_max))
+        growth = slope(samples, field)
+        if slope_max is not None and growth is not None and growth > slope_max:
+            self._raise_assertion_error("{} grew by {:.3f}/s, over threshold of {}/s".format(field, growth, slope_max))
+
     @contextlib.contextmanager
     def profile_with_perf(self, profile_name):
         """
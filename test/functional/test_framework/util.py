@@ -18,6 +18,7 @@ import time
 
 from . import coverage
 from .authproxy import AuthServiceProxy, JSONRPCException
+from .zmq_listener import ZMQListener, sync_blocks_zmq, wait_for_mempools_zmq
 from io import BytesIO
 
 logger = logging.getLogger("TestFramework.utils")
@@ -225,7 +226,8 @@ def wait_until(predicate, *, attempts=float('inf'), timeout=float('inf'), lock=N
 MAX_NODES = 12
 # Don't assign rpc or p2p ports lower than this
 PORT_MIN = 11000
-# The number of ports to "reserve" for p2p and rpc, each
+# The number of ports to "reserve" for p2p and rpc, each. The range after
+# them is used by feature_proxy.py, the one after that by zmq_port().
 PORT_RANGE = 5000
 
 class PortSeed:
@@ -264,6 +266,9 @@ def p2p_port(n):
 def rpc_port(n):
     return PORT_MIN + PORT_RANGE + n + (MAX_NODES * PortSeed.n) % (PORT_RANGE - 1 - MAX_NODES)
 
+def zmq_port(n):
+    return PORT_MIN + 3 * PORT_RANGE + n + (MAX_NODES * PortSeed.n) % (PORT_RANGE - 1 - MAX_NODES)
+
 def rpc_url(datadir, i, chain, rpchost):
     rpc_u, rpc_p = get_auth_cookie(datadir, chain)
     host = '127.0.0.1'
@@ -365,6 +370,12 @@ def connect_nodes_bi(nodes, a, b):
     connect_nodes(nodes[a], b)
     connect_nodes(nodes[b], a)
 
+def _zmq_synced(rpc_connections):
+    """Whether every connection is a node with a running ZMQ listener."""
+    # Plain RPC proxies turn any attribute into an RPC method, so check the type.
+    listeners = [getattr(x, 'zmq_listener', None) for x in rpc_connections]
+    return all(isinstance(listener, ZMQListener) and listener.running for listener in listeners)
+
 def sync_blocks(rpc_connections, *, wait=1, timeout=60):
     """
     Wait until everybody has the same tip.
@@ -372,7 +383,12 @@ def sync_blocks(rpc_connections, *, wait=1, timeout=60):
     sync_blocks needs to be called with an rpc_connections set that has least
     one node already synced to the latest, stable tip, otherwise there's a
     chance it might return before all nodes are stably synced.
+
+    If all nodes have a running ZMQ listener, their tips are tracked locally
+    instead of being polled over RPC.
     """
+    if _zmq_synced(rpc_connections):
+        return sync_blocks_zmq(rpc_connections, wait=wait, timeout=timeout)
     stop_time = time.time() + timeout
     while time.time() <= stop_time:
         best_hash = [x.getbestblockhash() for x in rpc_connections]
@@ -385,15 +401,24 @@ def sync_mempools(rpc_connections, *, wait=1, timeout=60, flush_scheduler=True):
     """
     Wait until everybody has the same transactions in their memory
     pools
+
+    If all nodes have a running ZMQ listener, the RPC check is only done once
+    their local mempool views agree.
     """
     stop_time = time.time() + timeout
-    while time.time() <= stop_time:
+    if _zmq_synced(rpc_connections):
+        # Leave half of the time to the RPC check, in case the views disagree
+        wait_for_mempools_zmq(rpc_connections, wait=wait, timeout=timeout / 2)
+    pool = []
+    while True:
         pool = [set(r.getrawmempool()) for r in rpc_connections]
         if pool.count(pool[0]) == len(rpc_connections):
             if flush_scheduler:
                 for r in rpc_connections:
                     r.syncwithvalidationinterfacequeue()
             return
+        if time.time() > stop_time:
+            break
         time.sleep(wait)
     raise AssertionError("Mempool sync timed out:{}".format("".join("\n  {!r}".format(m) for m in pool)))
 
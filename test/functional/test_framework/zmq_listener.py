@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# Copyright (c) 2014-2019 The Bitcoin Core developers
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+"""Background ZMQ subscriber that tracks a node's tip and mempool.
+
+A ZMQListener subscribes to a node's `hashtx` and `rawblock` notifications and
+keeps a local view of the node's best block and of the transactions that
+entered its mempool since. sync_blocks() and sync_mempools() use these views to
+wait for nodes to converge without polling the nodes over RPC.
+
+The tip is exact: defid publishes the new tip after every tip update, reorgs
+included. The mempool view is an approximation, so it is only used to decide
+when to confirm over RPC: evictions and expiry are not published, `hashtx` is
+also published for the transactions of every connected and disconnected
+block, while `rawblock` is only published for the new tip and not at all
+during initial block download. Waiters therefore re-seed the views from RPC
+when nothing is heard for a while.
+
+All listeners share one condition variable, so a waiter is woken by a
+notification from any node."""
+
+from io import BytesIO
+import threading
+import time
+
+# Notified (with the lock held) whenever any listener's view changes.
+_changed = threading.Condition()
+
+
+def zmq_available():
+    """Return whether the python3-zmq module can be imported."""
+    try:
+        import zmq  # noqa
+    except ImportError:
+        return False
+    return True
+
+
+class ZMQListener():
+    """Keeps a live view of one node's tip and mempool arrivals."""
+
+    TOPICS = (b"hashtx", b"rawblock")
+
+    def __init__(self, index, address):
+        self.index = index
+        self.address = address
+        self.tip = None
+        self.mempool = set()
+        self.received = 0
+        self.running = False
+        self._thread = None
+        self._stop = threading.Event()
+        self._ready = threading.Event()
+
+    def start(self, rpc):
+        """Start the subscriber thread and seed the view from RPC.
+
+        Notifications received while seeding take precedence over the
+        RPC results, which may already be stale."""
+        self._stop.clear()
+        self._ready.clear()
+        self._thread = threading.Thread(target=self._run, name="zmq-node{}".format(self.index), daemon=True)
+        self._thread.start()
+        self._ready.wait(timeout=10)
+        self.running = True
+        self.refresh(rpc)
+
+    def refresh(self, rpc):
+        """Re-seed the view from RPC, e.g. after a notification may have been missed."""
+        tip = rpc.getbestblockhash()
+        mempool = set(rpc.getrawmempool())
+        with _changed:
+            changed = self.tip != tip or self.mempool != mempool
+            self.tip = tip
+            self.mempool = mempool
+            if changed:
+                _changed.notify_all()
+
+    def stop(self):
+        self.running = False
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    def _run(self):
+        import zmq
+        # messages imports util, which imports this module.
+        from .messages import CBlock
+        ctx = zmq.Context()
+        socket = ctx.socket(zmq.SUB)
+        try:
+            socket.set(zmq.RCVTIMEO, 100)
+            socket.set(zmq.RCVHWM, 0)
+            for topic in self.TOPICS:
+                socket.setsockopt(zmq.SUBSCRIBE, topic)
+            socket.connect(self.address)
+            self._ready.set()
+            while not self._stop.is_set():
+                try:
+                    topic, body, _ = socket.recv_multipart()
+                except zmq.Again:
+                    continue
+                if topic == b"rawblock":
+                    block = CBlock()
+                    block.deserialize(BytesIO(body))
+                    block.calc_sha256()
+                    for tx in block.vtx:
+                        tx.calc_sha256()
+                    self._block_connected(block.hash, [tx.hash for tx in block.vtx])
+                else:
+                    self._tx_added(body.hex())
+        finally:
+            socket.close(linger=0)
+            ctx.term()
+
+    def _tx_added(self, txid):
+        with _changed:
+            self.received += 1
+            self.mempool.add(txid)
+            _changed.notify_all()
+
+    def _block_connected(self, blockhash, txids):
+        with _changed:
+            self.received += 1
+            self.tip = blockhash
+            self.mempool.difference_update(txids)
+            _changed.notify_all()
+
+
+def sync_blocks_zmq(nodes, *, wait, timeout):
+    """Wait until all listeners report the same tip.
+
+    If nothing is heard for `wait` seconds the views are re-seeded from RPC,
+    so a notification lost before the subscription was established can not
+    stall the sync."""
+    stop_time = time.time() + timeout
+    tips = []
+    while time.time() <= stop_time:
+        with _changed:
+            tips = [n.zmq_listener.tip for n in nodes]
+            if tips.count(tips[0]) == len(nodes):
+                return
+            received = sum(n.zmq_listener.received for n in nodes)
+            _changed.wait(min(wait, max(stop_time - time.time(), 0)))
+            progressed = sum(n.zmq_listener.received for n in nodes) != received
+        if not progressed:
+            for n in nodes:
+                n.zmq_listener.refresh(n)
+    raise AssertionError("Block sync timed out:{}".format("".join("\n  {!r}".format(b) for b in tips)))
+
+
+def wait_for_mempools_zmq(nodes, *, wait, timeout):
+    """Wait until all listeners report the same mempool view.
+
+    As in sync_blocks_zmq(), the views are re-seeded from RPC if nothing is
+    heard for `wait` seconds. Returns whether they converged before the
+    timeout. The caller is expected to confirm over RPC."""
+    stop_time = time.time() + timeout
+    while True:
+        with _changed:
+            pools = [n.zmq_listener.mempool for n in nodes]
+            if pools.count(pools[0]) == len(nodes):
+                return True
+            remaining = stop_time - time.time()
+            if remaining <= 0:
+                return False
+            received = sum(n.zmq_listener.received for n in nodes)
+            _changed.wait(min(wait, remaining))
+            progressed = sum(n.zmq_listener.received for n in nodes) != received
+        if not progressed:
+            for n in nodes:
+                n.zmq_listener.refresh(n)
@@ -16,6 +16,7 @@ import argparse
 from collections import deque
 import configparser
 import datetime
+import json
 import os
 import time
 import shutil
@@ -26,6 +27,8 @@ import tempfile
 import re
 import logging
 
+from test_framework.coverage import STATS_FILE_PREFIX, latency_percentile, merge_stats
+
 # Formatting. Default colors to empty strings.
 BOLD, GREEN, RED, GREY = ("", ""), ("", ""), ("", ""), ("", "")
 try:
@@ -76,6 +79,14 @@ EXTENDED_SCRIPTS = [
     'wallet_hd.py',     # moved to ext due to heavy load for trevis
     'mempool_accept.py',# moved to ext due to heavy load for trevis
     'wallet_backup.py', # moved to ext due to heavy load for trevis
+    # Benchmarks, see "Benchmark scenarios" in README.md
+    'feature_poolswap_bench.py',
+    'feature_loan_vault_bench.py',
+    'rpc_accounthistory_bench.py',
+    'feature_icx_orderbook_bench.py',
+    'feature_futures_bench.py',
+    'feature_oracles_bench.py',
+    'feature_reorg_bench.py',
 ]
 
 BASE_SCRIPTS = [
@@ -313,6 +324,8 @@ def main():
     parser.add_argument('--ansi', action='store_true', default=sys.stdout.isatty(), help="Use ANSI colors and dots in output (enabled by default when standard output is a TTY)")
     parser.add_argument('--combinedlogslen', '-c', type=int, default=0, metavar='n', help='On failure, print a log (of length n lines) to the console, combined from the test framework and all test nodes.')
     parser.add_argument('--coverage', action='store_true', help='generate a basic coverage report for the RPC interface')
+    parser.add_argument('--rpcstats', action='store_true', help='report the RPCs that took the most time over all tests, with call counts, latency percentiles and payload sizes')
+    parser.add_argument('--rpcstatsfile', metavar='FILE', help='write the merged per RPC stats of all tests to FILE as JSON (implies --rpcstats)')
     parser.add_argument('--ci', action='store_true', help='Run checks and code that are usually only enabled in a continuous integration environment')
     parser.add_argument('--exclude', '-x', help='specify a comma-separated-list of scripts to exclude.')
     parser.add_argument('--extended', action='store_true', help='run the extended test suite in addition to the basic tests')
@@ -428,6 +441,8 @@ def main():
         tmpdir=tmpdir,
         jobs=args.jobs,
         enable_coverage=args.coverage,
+        rpc_stats=args.rpcstats or args.rpcstatsfile is not None,
+        rpc_stats_file=args.rpcstatsfile,
         args=passon_args,
         combined_logs_len=args.combinedlogslen,
         failfast=args.failfast,
@@ -435,7 +450,7 @@ def main():
         use_term_control=args.ansi,
     )
 
-def run_tests(*, test_list, src_dir, build_dir, tmpdir, jobs=1, enable_coverage=False, args=None, combined_logs_len=0, failfast=False, runs_ci, use_term_control):
+def run_tests(*, test_list, src_dir, build_dir, tmpdir, jobs=1, enable_coverage=False, rpc_stats=False, rpc_stats_file=None, args=None, combined_logs_len=0, failfast=False, runs_ci, use_term_control):
     args = args or []
 
     # Warn if defid is already running (unix only)
@@ -454,7 +469,7 @@ def run_tests(*, test_list, src_dir, build_dir, tmpdir, jobs=1, enable_coverage=
 
     flags = ['--cachedir={}'.format(cache_dir)] + args
 
-    if enable_coverage:
+    if enable_coverage or rpc_stats:
         coverage = RPCCoverage()
         flags.append(coverage.flag)
         logging.debug("Initializing coverage directory at %s" % coverage.dir)
@@ -502,7 +517,7 @@ def run_tests(*, test_list, src_dir, build_dir, tmpdir, jobs=1, enable_coverage=
                 print('\n============')
                 print('{}Combined log for {}:{}'.format(BOLD[1], testdir, BOLD[0]))
                 print('============\n')
-                combined_logs_args = [sys.executable, os.path.join(tests_dir, 'combine_logs.py'), testdir]
+                combined_logs_args = [sys.executable, os.path.join(tests_dir, 'combine_logs.py'), testdir, '--tail', str(combined_logs_len)]
                 if BOLD[0]:
                     combined_logs_args += ['--color']
                 combined_logs, _ = subprocess.Popen(combined_logs_args, universal_newlines=True, stdout=subprocess.PIPE).communicate()
@@ -514,13 +529,15 @@ def run_tests(*, test_list, src_dir, build_dir, tmpdir, jobs=1, enable_coverage=
 
     print_results(test_results, max_len_name, (int(time.time() - start_time)))
 
+    coverage_passed = True
     if coverage:
-        coverage_passed = coverage.report_rpc_coverage()
+        if enable_coverage:
+            coverage_passed = coverage.report_rpc_coverage()
+        if rpc_stats:
+            coverage.report_rpc_stats(rpc_stats_file)
 
         logging.debug("Cleaning up coverage data")
         coverage.cleanup()
-    else:
-        coverage_passed = True
 
     # Clear up the temp directory if all subdirectories are gone
     if not os.listdir(tmpdir):
@@ -737,6 +754,36 @@ class RPCCoverage():
             print("All RPC commands covered.")
             return True
 
+    def report_rpc_stats(self, stats_file=None, top=25):
+        """
+        Print the RPC methods that took the most time over all tests.
+
+        """
+        stats = {}
+        for root, _, files in os.walk(self.dir):
+            for filename in files:
+                if filename.startswith(STATS_FILE_PREFIX):
+                    with open(os.path.join(root, filename), 'r', encoding="utf8") as f:
+                        merge_stats(stats, json.load(f))
+
+        if stats_file is not None:
+            with open(stats_file, 'w', encoding="utf8") as f:
+                json.dump(stats, f, indent=1, sort_keys=True)
+
+        if not stats:
+            print("No RPC calls recorded.")
+            return
+        ranked = sorted(stats.items(), key=lambda item: item[1]['total_time'], reverse=True)
+        total = sum(s['total_time'] for s in stats.values())
+        print("Slowest RPCs by total time ({:.1f}s in {} calls):".format(total, sum(s['calls'] for s in stats.values())))
+        print("  {:<32} {:>8} {:>7} {:>9} {:>9} {:>9} {:>9} {:>10} {:>10}".format(
+            "method", "calls", "errors", "total s", "mean ms", "p95 ms", "max ms", "req B", "resp B"))
+        for method, s in ranked[:top]:
+            print("  {:<32} {:>8} {:>7} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.2f} {:>10.0f} {:>10.0f}".format(
+                method, s['calls'], s['errors'], s['total_time'], 1000 * s['total_time'] / s['calls'],
+                1000 * latency_percentile(s, 0.95), 1000 * s['max_time'],
+                s['request_bytes'] / s['calls'], s['response_bytes'] / s['calls']))
+
     def cleanup(self):
         return shutil.rmtree(self.dir)
 
@@ -5,12 +5,21 @@
 """Run fuzz test targets.
 """
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import argparse
 import configparser
+import hashlib
+import json
 import os
 import sys
 import subprocess
+import tempfile
 import logging
+import time
+
+# Corpora with more inputs than this are split into shards of this size, so
+# that a large corpus can be spread over several jobs.
+SHARD_SIZE = 1000
 
 
 def main():
@@ -27,6 +36,22 @@ def main():
         action='store_true',
         help='If true, export coverage information to files in the seed corpus',
     )
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=4,
+        help='How many fuzz target processes to run in parallel.',
+    )
+    parser.add_argument(
+        '--report',
+        help='Write per-target execs/sec and wall time to this file as JSON.',
+    )
+    parser.add_argument(
+        '--minimize',
+        metavar='OUT_DIR',
+        help='Instead of running the targets, write a deduplicated and libFuzzer-merged copy of the seed corpus to this directory.',
+    )
     parser.add_argument(
         'seed_dir',
         help='The seed corpus to run on (must contain subfolders for each fuzz target).',
@@ -90,34 +115,195 @@ def main():
         logging.error("subprocess timed out: Currently only libFuzzer is supported")
         sys.exit(1)
 
-    run_once(
-        corpus=args.seed_dir,
-        test_list=test_list_selection,
-        build_dir=config["environment"]["BUILDDIR"],
-        export_coverage=args.export_coverage,
-    )
+    if args.minimize:
+        if os.path.abspath(args.minimize) == os.path.abspath(args.seed_dir):
+            logging.error("The minimized corpus must be written to a different directory")
+            sys.exit(1)
+        with ThreadPoolExecutor(max_workers=args.jobs) as fuzz_pool:
+            report = minimize_corpus(
+                fuzz_pool=fuzz_pool,
+                corpus=args.seed_dir,
+                out_dir=args.minimize,
+                test_list=test_list_selection,
+                build_dir=config["environment"]["BUILDDIR"],
+            )
+    else:
+        with ThreadPoolExecutor(max_workers=args.jobs) as fuzz_pool:
+            report = run_once(
+                fuzz_pool=fuzz_pool,
+                corpus=args.seed_dir,
+                test_list=test_list_selection,
+                build_dir=config["environment"]["BUILDDIR"],
+                export_coverage=args.export_coverage,
+            )
 
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=2, sort_keys=True)
+    if any(r['failed'] for r in report.values()):
+        sys.exit(1)
 
-def run_once(*, corpus, test_list, build_dir, export_coverage):
+
+def make_shards(corpus_dir, export_coverage):
+    """Split a target's corpus into lists of input paths.
+
+    A corpus up to SHARD_SIZE inputs is run as a directory. With
+    export_coverage it is never split, as libFuzzer only reports coverage
+    (the INITED line) for directory runs."""
+    try:
+        inputs = sorted(os.listdir(corpus_dir))
+    except FileNotFoundError:
+        inputs = []
+    if export_coverage or len(inputs) <= SHARD_SIZE:
+        return [[corpus_dir]], len(inputs)
+    inputs = [os.path.join(corpus_dir, i) for i in inputs]
+    return [inputs[i:i + SHARD_SIZE] for i in range(0, len(inputs), SHARD_SIZE)], len(inputs)
+
+
+def run_shard(*, target, shard_id, args):
+    """Run a fuzz target on one shard, logging its output as it arrives."""
+    start = time.time()
+    output = []
+    with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True) as proc:
+        for line in proc.stdout:
+            output.append(line)
+            logging.debug('[{} #{}] {}'.format(target, shard_id, line.rstrip()))
+    end = time.time()
+    return proc.returncode, ''.join(output), start, end
+
+
+def run_once(*, fuzz_pool, corpus, test_list, build_dir, export_coverage):
+    """Run all targets over their corpus, a shard per job. Returns a report per target."""
+    jobs = {}
+    report = {}
     for t in test_list:
-        args = [
-            os.path.join(build_dir, 'src', 'test', 'fuzz', t),
-            '-runs=1',
-            os.path.join(corpus, t),
-        ]
-        logging.debug('Run {} with args {}'.format(t, args))
-        result = subprocess.run(args, stderr=subprocess.PIPE, universal_newlines=True)
-        output = result.stderr
-        logging.debug('Output: {}'.format(output))
-        result.check_returncode()
+        shards, num_inputs = make_shards(os.path.join(corpus, t), export_coverage)
+        report[t] = {'inputs': num_inputs, 'shards': len(shards), 'failed': False}
+        for shard_id, paths in enumerate(shards):
+            args = [
+                os.path.join(build_dir, 'src', 'test', 'fuzz', t),
+                '-runs=1',
+            ] + paths
+            logging.debug('Run {} shard {} with {} path(s)'.format(t, shard_id, len(paths)))
+            jobs[fuzz_pool.submit(run_shard, target=t, shard_id=shard_id, args=args)] = (t, shard_id)
+
+    timings = {t: [] for t in test_list}
+    for future in as_completed(jobs):
+        t, shard_id = jobs[future]
+        returncode, output, start, end = future.result()
+        timings[t].append((start, end))
+        if returncode != 0:
+            report[t]['failed'] = True
+            logging.error('{} shard {} failed with exit code {}:\n{}'.format(t, shard_id, returncode, output))
+            continue
+        if len(timings[t]) == report[t]['shards']:
+            logging.info('{} done'.format(t))
         if not export_coverage:
             continue
-        for l in output.splitlines():
-            if 'INITED' in l:
+        for line in output.splitlines():
+            if 'INITED' in line:
                 with open(os.path.join(corpus, t + '_coverage'), 'w', encoding='utf-8') as cov_file:
-                    cov_file.write(l)
+                    cov_file.write(line)
                     break
 
+    for t in test_list:
+        # Wall time spans all shards of the target; run time adds up the time
+        # of each shard, so execs/sec does not depend on the number of jobs.
+        wall_time = max(e for _, e in timings[t]) - min(s for s, _ in timings[t])
+        run_time = sum(e - s for s, e in timings[t])
+        report[t]['wall_time'] = round(wall_time, 3)
+        report[t]['run_time'] = round(run_time, 3)
+        report[t]['execs_per_sec'] = round(report[t]['inputs'] / run_time, 1) if run_time else None
+        logging.info('{}: {} inputs in {:.2f}s ({} execs/sec)'.format(
+            t, report[t]['inputs'], wall_time, report[t]['execs_per_sec']))
+    return report
+
+
+def dedup_inputs(corpus_dir, staging_dir):
+    """Copy the distinct inputs of a corpus into staging_dir, named by content hash like libFuzzer does.
+
+    Returns the number of inputs and bytes before deduplication."""
+    count = 0
+    size = 0
+    seen = set()
+    for root, _, files in os.walk(corpus_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                data = f.read()
+            count += 1
+            size += len(data)
+            digest = hashlib.sha1(data).hexdigest()
+            if digest in seen:
+                continue
+            seen.add(digest)
+            staged = os.path.join(staging_dir, digest)
+            with open(staged, 'wb') as f:
+                f.write(data)
+    return count, size
+
+
+def dir_stats(path):
+    files = [os.path.join(path, f) for f in os.listdir(path)]
+    return len(files), sum(os.path.getsize(f) for f in files)
+
+
+def merge_target(*, target, build_dir, staging_dir, out_dir):
+    """Let libFuzzer keep only the inputs of staging_dir that add coverage to out_dir."""
+    args = [
+        os.path.join(build_dir, 'src', 'test', 'fuzz', target),
+        '-merge=1',
+        out_dir,
+        staging_dir,
+    ]
+    logging.debug('Merge {} with args {}'.format(target, args))
+    start = time.time()
+    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    return result.returncode, result.stdout, time.time() - start
+
+
+def minimize_corpus(*, fuzz_pool, corpus, out_dir, test_list, build_dir):
+    """Deduplicate and merge the corpus of every target into out_dir, one merge job per target.
+
+    The time saved is an estimate: the merge runs every distinct input once,
+    so its duration per input approximates the cost of replaying one."""
+    report = {}
+    jobs = {}
+    with tempfile.TemporaryDirectory(prefix='fuzz_minimize_') as staging_root:
+        for t in test_list:
+            staging_dir = os.path.join(staging_root, t)
+            os.makedirs(staging_dir)
+            target_out = os.path.join(out_dir, t)
+            os.makedirs(target_out, exist_ok=True)
+            inputs, size = dedup_inputs(os.path.join(corpus, t), staging_dir)
+            unique = len(os.listdir(staging_dir))
+            report[t] = {'inputs': inputs, 'bytes': size, 'unique': unique, 'failed': False}
+            if not unique:
+                continue
+            jobs[fuzz_pool.submit(merge_target, target=t, build_dir=build_dir, staging_dir=staging_dir, out_dir=target_out)] = t
+
+        for future in as_completed(jobs):
+            t = jobs[future]
+            returncode, output, merge_time = future.result()
+            logging.debug('[{}] {}'.format(t, output))
+            if returncode != 0:
+                report[t]['failed'] = True
+                logging.error('Merging {} failed with exit code {}:\n{}'.format(t, returncode, output))
+                continue
+            report[t]['merge_time'] = round(merge_time, 3)
+
+    total_saved = 0.0
+    for t in test_list:
+        r = report[t]
+        r['minimized_inputs'], r['minimized_bytes'] = dir_stats(os.path.join(out_dir, t))
+        time_per_input = r.get('merge_time', 0.0) / r['unique'] if r['unique'] else 0.0
+        r['time_saved'] = round((r['inputs'] - r['minimized_inputs']) * time_per_input, 3)
+        total_saved += r['time_saved']
+        logging.info('{}: {} inputs ({} bytes), {} distinct, minimized to {} inputs ({} bytes), ~{:.2f}s saved per run'.format(
+            t, r['inputs'], r['bytes'], r['unique'], r['minimized_inputs'], r['minimized_bytes'], r['time_saved']))
+    logging.info('Minimized corpus written to {}, ~{:.2f}s saved per run'.format(out_dir, total_saved))
+    return report
+
 
 def parse_test_list(makefile):
     with open(makefile, encoding='utf-8') as makefile_test:
@@ -11,27 +11,31 @@ Author: @MarcoFalke
 '''
 
 from subprocess import check_output
+import os
 import re
 
+from source_index import SourceIndex
+
 FOLDER_GREP = 'src'
 FOLDER_TEST = 'src/test/'
-REGEX_ARG = '(?:ForceSet|SoftSet|Get|Is)(?:Bool)?Args?(?:Set)?\("(-[^"]+)"'
 REGEX_DOC = 'AddArg\("(-[^"=]+?)(?:=|")'
 CMD_ROOT_DIR = '$(git rev-parse --show-toplevel)/{}'.format(FOLDER_GREP)
-CMD_GREP_ARGS = r"git grep --perl-regexp '{}' -- {} ':(exclude){}'".format(REGEX_ARG, CMD_ROOT_DIR, FOLDER_TEST)
+CMD_SOURCE_FILES = "git ls-files --full-name -- {} | grep -E '\\.(h|c|cc|cpp)$'".format(CMD_ROOT_DIR)
 CMD_GREP_WALLET_ARGS = r"git grep --function-context 'void WalletInit::AddWalletOptions' -- {} | grep AddArg".format(CMD_ROOT_DIR)
 CMD_GREP_WALLET_HIDDEN_ARGS = r"git grep --function-context 'void DummyWalletInit::AddWalletOptions' -- {}".format(CMD_ROOT_DIR)
-CMD_GREP_DOCS = r"git grep --perl-regexp '{}' {}".format(REGEX_DOC, CMD_ROOT_DIR)
 # list unsupported, deprecated and duplicate args as they need no documentation
 SET_DOC_OPTIONAL = set(['-h', '-help', '-dbcrashratio', '-forcecompactdb'])
 
 
 def lint_missing_argument_documentation():
-    used = check_output(CMD_GREP_ARGS, shell=True).decode('utf8').strip()
-    docd = check_output(CMD_GREP_DOCS, shell=True).decode('utf8').strip()
-
-    args_used = set(re.findall(re.compile(REGEX_ARG), used))
-    args_docd = set(re.findall(re.compile(REGEX_DOC), docd)).union(SET_DOC_OPTIONAL)
+    args_used = set()
+    args_docd = set(SET_DOC_OPTIONAL)
+    with SourceIndex() as index:
+        for filename in check_output(CMD_SOURCE_FILES, shell=True).decode('utf8').split():
+            record = index.get(os.path.join(index.root, filename))
+            if not filename.startswith(FOLDER_TEST):
+                args_used.update(record["args_used"])
+            args_docd.update(record["args_documented"])
     args_need_doc = args_used.difference(args_docd)
     args_unknown = args_docd.difference(args_used)
 
@@ -6,9 +6,10 @@
 
 from collections import defaultdict
 import os
-import re
 import sys
 
+from source_index import SourceIndex
+
 # Source files (relative to root) to scan for dispatch tables
 SOURCES = [
     "src/rpc/server.cpp",
@@ -45,58 +46,21 @@ class RPCArgument:
         self.idx = idx
         self.convert = False
 
-def parse_string(s):
-    assert s[0] == '"'
-    assert s[-1] == '"'
-    return s[1:-1]
-
-def process_commands(fname):
-    """Find and parse dispatch table in implementation file `fname`."""
-    cmds = []
-    in_rpcs = False
-    with open(fname, "r", encoding="utf8") as f:
-        for line in f:
-            line = line.rstrip()
-            if not in_rpcs:
-                if re.match("static const CRPCCommand .*\[\] =", line):
-                    in_rpcs = True
-            else:
-                if line.startswith('};'):
-                    in_rpcs = False
-                elif '{' in line and '"' in line:
-                    m = re.search('{ *("[^"]*"), *("[^"]*"), *&([^,]*), *{([^}]*)} *},', line)
-                    assert m, 'No match to table expression: %s' % line
-                    name = parse_string(m.group(2))
-                    args_str = m.group(4).strip()
-                    if args_str:
-                        args = [RPCArgument(parse_string(x.strip()).split('|'), idx) for idx, x in enumerate(args_str.split(','))]
-                    else:
-                        args = []
-                    cmds.append(RPCCommand(name, args))
-    assert not in_rpcs and cmds, "Something went wrong with parsing the C++ file: update the regexps"
+def process_commands(index, fname):
+    """Get the dispatch table in implementation file `fname` from the source index."""
+    record = index.get(fname)
+    assert not record["rpc_errors"], "\n".join(record["rpc_errors"])
+    cmds = [RPCCommand(name, [RPCArgument(x.split('|'), idx) for idx, x in enumerate(args)])
+            for name, args in record["rpc_commands"]]
+    assert cmds, "Something went wrong with parsing the C++ file: update the regexps"
     return cmds
 
-def process_mapping(fname):
-    """Find and parse conversion table in implementation file `fname`."""
-    cmds = []
-    in_rpcs = False
-    with open(fname, "r", encoding="utf8") as f:
-        for line in f:
-            line = line.rstrip()
-            if not in_rpcs:
-                if line == 'static const CRPCConvertParam vRPCConvertParams[] =':
-                    in_rpcs = True
-            else:
-                if line.startswith('};'):
-                    in_rpcs = False
-                elif '{' in line and '"' in line:
-                    m = re.search('{ *("[^"]*"), *([0-9]+) *, *("[^"]*") *},', line)
-                    assert m, 'No match to table expression: %s' % line
-                    name = parse_string(m.group(1))
-                    idx = int(m.group(2))
-                    argname = parse_string(m.group(3))
-                    cmds.append((name, idx, argname))
-    assert not in_rpcs and cmds
+def process_mapping(index, fname):
+    """Get the conversion table in implementation file `fname` from the source index."""
+    record = index.get(fname)
+    assert not record["rpc_errors"], "\n".join(record["rpc_errors"])
+    cmds = [tuple(x) for x in record["rpc_mappings"]]
+    assert cmds
     return cmds
 
 def main():
@@ -106,18 +70,19 @@ def main():
 
     root = sys.argv[1]
 
-    # Get all commands from dispatch tables
-    cmds = []
-    for fname in SOURCES:
-        cmds += process_commands(os.path.join(root, fname))
+    with SourceIndex(root) as index:
+        # Get all commands from dispatch tables
+        cmds = []
+        for fname in SOURCES:
+            cmds += process_commands(index, os.path.join(root, fname))
+
+        # Get current convert mapping for client
+        mapping = set(process_mapping(index, os.path.join(root, SOURCE_CLIENT)))
 
     cmds_by_name = {}
     for cmd in cmds:
         cmds_by_name[cmd.name] = cmd
 
-    # Get current convert mapping for client
-    client = SOURCE_CLIENT
-    mapping = set(process_mapping(os.path.join(root, client)))
 
     print('* Checking consistency between dispatch tables and vRPCConvertParams')
 
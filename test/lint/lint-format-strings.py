@@ -9,9 +9,36 @@
 # in the format string.
 
 import argparse
+import bisect
+import os
 import re
+import subprocess
 import sys
 
+from source_index import SourceIndex
+
+FUNCTION_NAMES_AND_NUMBER_OF_LEADING_ARGUMENTS = [
+    ("FatalError", 0),
+    ("fprintf", 1),
+    ("tfm::format", 1),  # Assuming tfm::::format(std::ostream&, ...
+    ("LogConnectFailure", 1),
+    ("LogPrint", 1),
+    ("LogPrintf", 0),
+    ("printf", 0),
+    ("snprintf", 2),
+    ("sprintf", 1),
+    ("strprintf", 0),
+    ("vfprintf", 1),
+    ("vprintf", 1),
+    ("vsnprintf", 1),
+    ("vsprintf", 1),
+    ("WalletLogPrintf", 0),
+]
+
+# Sources checked by --all
+CMD_SOURCE_FILES = ["git", "ls-files", "--full-name", "--", "*.c", "*.cpp", "*.h"]
+EXCLUDED_FILES = re.compile("^src/(leveldb|secp256k1|tinyformat|univalue|spv)")
+
 FALSE_POSITIVES = [
     ("src/dbwrapper.cpp", "vsnprintf(p, limit - p, format, backup_ap)"),
     ("src/index/base.cpp", "FatalError(const char* fmt, const Args&... args)"),
@@ -39,10 +66,81 @@ def parse_function_calls(function_name, source_code):
     0
     """
     assert type(function_name) is str and type(source_code) is str and function_name
+    return re.findall(r"[^a-zA-Z_](?=({}\(.*).*)".format(function_name), join_source_lines(source_code))
+
+
+def join_source_lines(source_code):
+    """Return source_code as a single line with preprocessor directives and C++ style
+    comments ("//") removed, prefixed with a space.
+
+    >>> join_source_lines("#include <foo>\\nfoo(); // bar\\n  bar();")
+    ' foo(); bar();'
+    """
     lines = [re.sub("// .*", " ", line).strip()
              for line in source_code.split("\n")
              if not line.strip().startswith("#")]
-    return re.findall(r"[^a-zA-Z_](?=({}\(.*).*)".format(function_name), " " + " ".join(lines))
+    return " " + " ".join(lines)
+
+
+def parse_all_function_calls(function_names, source_code):
+    """Return a dict mapping each name in function_names to the calls to it in string
+    source_code, each split as by parse_function_call_and_arguments(...).
+
+    This is equivalent to calling parse_function_call_and_arguments(...) on every
+    call returned by parse_function_calls(...) for each name, but the source is
+    escaped and normalized once and every call is only scanned up to its closing
+    parenthesis, instead of normalizing the remainder of the file per call.
+
+    >>> calls = parse_all_function_calls(["foo", "bar"], 'foo("%s", bar(1));\\n/* foo(2) */ // bar(3)')
+    >>> calls["foo"]
+    [['foo(', '"%s",', ' bar(1)', ')'], ['foo(', '2', ')']]
+    >>> calls["bar"]
+    [['bar(', '1', ')']]
+    >>> parse_all_function_calls(["foo"], "bar();")
+    {}
+    """
+    assert type(source_code) is str and all(function_names)
+    text = join_source_lines(source_code)
+    call_regex = re.compile(r"(?<![a-zA-Z_])({})\(".format("|".join(re.escape(name) for name in function_names)))
+    # C style comments are only removed after a call has been found, so calls
+    # inside them are still reported; split from the remainder of the file.
+    comments = [m.span() for m in re.finditer(r"/\*.*?\*/", text)]
+    comment_starts = [start for start, _ in comments]
+    normalized = []
+    normalized_length = 0
+    segment_start = 0
+    found = []
+    for m in call_regex.finditer(text):
+        name, position = m.group(1), m.start()
+        comment = bisect.bisect_right(comment_starts, position) - 1
+        if text[position - 1] == "\\" or (comment >= 0 and position < comments[comment][1]):
+            found.append((position, name, None))
+            continue
+        # Outside of comments and escape sequences, normalizing the remainder of
+        # the file yields the suffix of the normalized file starting at the call.
+        segment = normalize_segment(escape(text[segment_start:position]))
+        normalized.append(segment)
+        normalized_length += len(segment)
+        segment_start = position
+        found.append((position, name, normalized_length))
+    normalized.append(normalize_segment(escape(text[segment_start:])))
+    normalized = "".join(normalized).rstrip()
+    calls = {}
+    for position, name, offset in found:
+        if offset is None:
+            parts = parse_function_call_and_arguments(name, text[position:])
+        else:
+            parts = split_function_call(name, normalized, offset)
+        calls.setdefault(name, []).append(parts)
+    return calls
+
+
+def normalize_segment(s):
+    """Like normalize(s), but without stripping leading and trailing spaces."""
+    s = s.replace("\n", " ")
+    s = s.replace("\t", " ")
+    s = re.sub(r"/\*.*?\*/", " ", s)
+    return re.sub(" {2,}", " ", s)
 
 
 def normalize(s):
@@ -151,17 +249,26 @@ def parse_function_call_and_arguments(function_name, function_call):
     ['strprintf(', '"%s (%d)",', ' foo>foo<1,2>(1,2),', 'err', ')']
     """
     assert type(function_name) is str and type(function_call) is str and function_name
-    remaining = normalize(escape(function_call))
+    return split_function_call(function_name, normalize(escape(function_call)), 0)
+
+
+def split_function_call(function_name, text, start):
+    """Split the call to function_name at offset start of the escaped and normalized
+    string text as described in parse_function_call_and_arguments(...).
+
+    >>> split_function_call("foo", 'x = foo("%s", 1); bar', 4)
+    ['foo(', '"%s",', ' 1', ')']
+    """
     expected_function_call = "{}(".format(function_name)
-    assert remaining.startswith(expected_function_call)
+    assert text.startswith(expected_function_call, start)
     parts = [expected_function_call]
-    remaining = remaining[len(expected_function_call):]
+    first = start + len(expected_function_call)
+    part_start = first
     open_parentheses = 1
     open_template_arguments = 0
     in_string = False
-    parts.append("")
-    for i, char in enumerate(remaining):
-        parts.append(parts.pop() + char)
+    for i in range(first, len(text)):
+        char = text[i]
         if char == "\"":
             in_string = not in_string
             continue
@@ -175,11 +282,11 @@ def parse_function_call_and_arguments(function_name, function_call):
         if open_parentheses > 1:
             continue
         if open_parentheses == 0:
-            parts.append(parts.pop()[:-1])
+            parts.append(text[part_start:i])
             parts.append(char)
-            break
-        prev_char = remaining[i - 1] if i - 1 >= 0 else None
-        next_char = remaining[i + 1] if i + 1 <= len(remaining) - 1 else None
+            return parts
+        prev_char = text[i - 1] if i > first else None
+        next_char = text[i + 1] if i + 1 < len(text) else None
         if char == "<" and next_char not in [" ", "<", "="] and prev_char not in [" ", "<"]:
             open_template_arguments += 1
             continue
@@ -188,7 +295,9 @@ def parse_function_call_and_arguments(function_name, function_call):
         if open_template_arguments > 0:
             continue
         if char == ",":
-            parts.append("")
+            parts.append(text[part_start:i + 1])
+            part_start = i + 1
+    parts.append(text[part_start:])
     return parts
 
 
@@ -254,35 +363,70 @@ def count_format_specifiers(format_string):
     return n
 
 
+def check_function_calls(index, function_name, skip_arguments, filenames):
+    """Print and return the number of mismatched calls to function_name in filenames."""
+    errors = 0
+    for filename in filenames:
+        for parts in index.format_calls(filename, function_name):
+            relevant_function_call_str = unescape("".join(parts))[:512]
+            if (filename, relevant_function_call_str) in FALSE_POSITIVES:
+                continue
+            if len(parts) < 3 + skip_arguments:
+                errors += 1
+                print("{}: Could not parse function call string \"{}(...)\": {}".format(filename, function_name, relevant_function_call_str))
+                continue
+            argument_count = len(parts) - 3 - skip_arguments
+            format_str = parse_string_content(parts[1 + skip_arguments])
+            format_specifier_count = count_format_specifiers(format_str)
+            if format_specifier_count != argument_count:
+                errors += 1
+                print("{}: Expected {} argument(s) after format string but found {} argument(s): {}".format(filename, format_specifier_count, argument_count, relevant_function_call_str))
+                continue
+    return errors
+
+
+def print_timings(index, filenames):
+    """Print the parse time of each file, slowest first, to stderr."""
+    times = [(index.parse_times.get(index.key(f)), f) for f in filenames]
+    parsed = sorted((t for t in times if t[0] is not None), reverse=True)
+    for elapsed, filename in parsed:
+        print("{:8.1f} ms  {}".format(elapsed * 1000, filename), file=sys.stderr)
+    print("Parsed {} file(s) in {:.1f} ms of CPU time, {} unchanged file(s) taken from the cache".format(
+        len(parsed), sum(t for t, _ in parsed) * 1000, len(times) - len(parsed)), file=sys.stderr)
+
+
 def main():
     parser = argparse.ArgumentParser(description="This program checks that the number of arguments passed "
                                      "to a variadic format string function matches the number of format "
                                      "specifiers in the format string.")
     parser.add_argument("--skip-arguments", type=int, help="number of arguments before the format string "
                         "argument (e.g. 1 in the case of fprintf)", default=0)
-    parser.add_argument("function_name", help="function name (e.g. fprintf)", default=None)
+    parser.add_argument("--all", action="store_true", help="check all known format string functions in all "
+                        "C++ source files of the repository (run from the repository root)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of processes used to "
+                        "parse changed files (default: %(default)s)")
+    parser.add_argument("--timings", action="store_true", help="print the time spent parsing each file to stderr")
+    parser.add_argument("function_name", nargs="?", help="function name (e.g. fprintf)", default=None)
     parser.add_argument("file", nargs="*", help="C++ source code file (e.g. foo.cpp)")
     args = parser.parse_args()
-    exit_code = 0
-    for filename in args.file:
-        with open(filename, "r", encoding="utf-8") as f:
-            for function_call_str in parse_function_calls(args.function_name, f.read()):
-                parts = parse_function_call_and_arguments(args.function_name, function_call_str)
-                relevant_function_call_str = unescape("".join(parts))[:512]
-                if (f.name, relevant_function_call_str) in FALSE_POSITIVES:
-                    continue
-                if len(parts) < 3 + args.skip_arguments:
-                    exit_code = 1
-                    print("{}: Could not parse function call string \"{}(...)\": {}".format(f.name, args.function_name, relevant_function_call_str))
-                    continue
-                argument_count = len(parts) - 3 - args.skip_arguments
-                format_str = parse_string_content(parts[1 + args.skip_arguments])
-                format_specifier_count = count_format_specifiers(format_str)
-                if format_specifier_count != argument_count:
-                    exit_code = 1
-                    print("{}: Expected {} argument(s) after format string but found {} argument(s): {}".format(f.name, format_specifier_count, argument_count, relevant_function_call_str))
-                    continue
-    sys.exit(exit_code)
+    if not args.all and args.function_name is None:
+        parser.error("either --all or a function name is required")
+    errors = 0
+    with SourceIndex() as index:
+        if args.all:
+            files = subprocess.check_output(CMD_SOURCE_FILES).decode("utf8").splitlines()
+            files = sorted(f for f in files if not EXCLUDED_FILES.match(f))
+        else:
+            files = args.file
+        index.update(files, jobs=args.jobs)
+        if args.all:
+            for function_name, skip_arguments in FUNCTION_NAMES_AND_NUMBER_OF_LEADING_ARGUMENTS:
+                errors += check_function_calls(index, function_name, skip_arguments, files)
+        else:
+            errors += check_function_calls(index, args.function_name, args.skip_arguments, files)
+        if args.timings:
+            print_timings(index, files)
+    sys.exit(1 if errors else 0)
 
 
 if __name__ == "__main__":
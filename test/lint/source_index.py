@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+"""Shared, cached index of the facts the lint scripts extract from C++ sources.
+
+check-rpc-mappings.py, check-doc.py, lint-format-strings.py and
+contrib/devtools/circular-dependencies.py all scan the same files. Instead of
+each of them reading and regex-scanning the tree on its own, they ask a
+SourceIndex for a file's record. The first request for a file reads it once and
+runs every extractor over its contents:
+
+- includes:        `#include <...>` targets, in order of appearance
+- rpc_commands:    CRPCCommand dispatch table entries as [name, [arg names]]
+- rpc_mappings:    vRPCConvertParams entries as [name, index, arg name]
+- rpc_errors:      table lines the extractor could not parse
+- args_used:       command line args read through gArgs
+- args_documented: command line args registered with AddArg
+- format_calls:    calls to the format string functions checked by
+                   lint-format-strings.py, split into arguments
+
+Records are kept in a JSON cache (by default in the git directory). A record
+is reused when the file's mtime and size are unchanged, or when they changed
+but the content hash did not (e.g. after a checkout), so running all lints on
+an unchanged tree does not re-read any source file. The cache is discarded
+whenever this module or lint-format-strings.py changes.
+
+SourceIndex.update() extracts the files that changed in a process pool, so a
+cold run scales with the number of CPUs.
+
+Set LINT_SOURCE_INDEX to use a different cache file, or to an empty string to
+disable caching.
+"""
+
+import hashlib
+import importlib.util
+import json
+import multiprocessing
+import os
+import re
+import subprocess
+import time
+
+INDEX_VERSION = 1
+
+LINT_DIR = os.path.dirname(os.path.abspath(__file__))
+FORMAT_STRINGS_LINT = os.path.join(LINT_DIR, "lint-format-strings.py")
+CACHE_FILE_NAME = "lint-source-index.json"
+
+REGEX_INCLUDE = re.compile("^#include <(.*)>")
+REGEX_RPC_TABLE = re.compile(r"static const CRPCCommand .*\[\] =")
+REGEX_RPC_COMMAND = re.compile('{ *("[^"]*"), *("[^"]*"), *&([^,]*), *{([^}]*)} *},')
+RPC_MAPPING_TABLE = 'static const CRPCConvertParam vRPCConvertParams[] ='
+REGEX_RPC_MAPPING = re.compile('{ *("[^"]*"), *([0-9]+) *, *("[^"]*") *},')
+REGEX_ARG = re.compile(r'(?:ForceSet|SoftSet|Get|Is)(?:Bool)?Args?(?:Set)?\("(-[^"]+)"')
+REGEX_DOC = re.compile(r'AddArg\("(-[^"=]+?)(?:=|")')
+
+_format_strings = None
+
+
+def format_strings_lint():
+    """Return lint-format-strings.py loaded as a module (it is not importable by name)."""
+    global _format_strings
+    if _format_strings is None:
+        spec = importlib.util.spec_from_file_location("lint_format_strings", FORMAT_STRINGS_LINT)
+        _format_strings = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(_format_strings)
+    return _format_strings
+
+
+def fingerprint():
+    """Hash of the extractor code; records made by other versions are ignored."""
+    h = hashlib.sha1(str(INDEX_VERSION).encode())
+    for path in (os.path.abspath(__file__), FORMAT_STRINGS_LINT):
+        with open(path, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def parse_string(s):
+    assert s[0] == '"'
+    assert s[-1] == '"'
+    return s[1:-1]
+
+
+def extract_lines(text, record):
+    """Collect includes and RPC tables in one pass over the lines of text."""
+    includes = []
+    commands = []
+    mappings = []
+    errors = []
+    table = None
+    for line in text.splitlines():
+        line = line.rstrip()
+        match = REGEX_INCLUDE.match(line)
+        if match:
+            includes.append(match.group(1))
+            continue
+        if table is None:
+            if REGEX_RPC_TABLE.match(line):
+                table = "commands"
+            elif line == RPC_MAPPING_TABLE:
+                table = "mappings"
+        elif line.startswith('};'):
+            table = None
+        elif '{' in line and '"' in line:
+            if table == "commands":
+                m = REGEX_RPC_COMMAND.search(line)
+                if not m:
+                    errors.append('No match to table expression: %s' % line)
+                    continue
+                args_str = m.group(4).strip()
+                args = [parse_string(x.strip()) for x in args_str.split(',')] if args_str else []
+                commands.append([parse_string(m.group(2)), args])
+            else:
+                m = REGEX_RPC_MAPPING.search(line)
+                if not m:
+                    errors.append('No match to table expression: %s' % line)
+                    continue
+                mappings.append([parse_string(m.group(1)), int(m.group(2)), parse_string(m.group(3))])
+    if table is not None:
+        errors.append('Unterminated %s table' % table)
+    record["includes"] = includes
+    record["rpc_commands"] = commands
+    record["rpc_mappings"] = mappings
+    record["rpc_errors"] = errors
+
+
+def extract_format_calls(text, record):
+    lint = format_strings_lint()
+    function_names = [name for name, _ in lint.FUNCTION_NAMES_AND_NUMBER_OF_LEADING_ARGUMENTS if name in text]
+    record["format_calls"] = lint.parse_all_function_calls(function_names, text) if function_names else {}
+
+
+def extract(text):
+    """Return a fresh record (without stat data) for a file with contents text."""
+    record = {}
+    extract_lines(text, record)
+    record["args_used"] = REGEX_ARG.findall(text)
+    record["args_documented"] = REGEX_DOC.findall(text)
+    extract_format_calls(text, record)
+    return record
+
+
+def read_record(abspath, cached_hash):
+    """Read abspath and extract a record from it, unless its content hash is cached_hash.
+
+    Returns the stat and hash data of the file, the new record (or None if the
+    cached one is still valid) and the seconds spent extracting it."""
+    st = os.stat(abspath)
+    with open(abspath, "rb") as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()
+    if digest == cached_hash:
+        return st.st_mtime_ns, st.st_size, digest, None, 0.0
+    start = time.time()
+    record = extract(data.decode("utf8", errors="replace"))
+    return st.st_mtime_ns, st.st_size, digest, record, time.time() - start
+
+
+def read_record_task(task):
+    return read_record(*task)
+
+
+def git_output(args, cwd):
+    try:
+        return subprocess.check_output(["git"] + args, cwd=cwd, stderr=subprocess.DEVNULL).decode("utf8").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def default_cache_path(root):
+    if "LINT_SOURCE_INDEX" in os.environ:
+        return os.environ["LINT_SOURCE_INDEX"] or None
+    git_dir = git_output(["rev-parse", "--git-dir"], root)
+    if git_dir is None:
+        return None
+    return os.path.join(root, git_dir, CACHE_FILE_NAME)
+
+
+class SourceIndex():
+    """Per file records of the facts extracted from C++ sources.
+
+    Paths may be given absolute or relative to the current directory; records
+    are keyed by their path relative to `root` (the top of the git checkout by
+    default). Use as a context manager to write the cache back on exit.
+    """
+
+    def __init__(self, root=None, cache_path=None):
+        if root is None:
+            root = git_output(["rev-parse", "--show-toplevel"], os.getcwd()) or os.getcwd()
+        self.root = os.path.abspath(root)
+        self.cache_path = cache_path if cache_path is not None else default_cache_path(self.root)
+        self.fingerprint = fingerprint()
+        self.records = {}
+        # Seconds spent extracting each file (by key) that changed since the cache was written
+        self.parse_times = {}
+        self.dirty = False
+        self.load()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.save()
+
+    def load(self):
+        if not self.cache_path:
+            return
+        try:
+            with open(self.cache_path, "r", encoding="utf8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return
+        if cache.get("fingerprint") == self.fingerprint:
+            self.records = cache.get("files", {})
+
+    def save(self):
+        if not self.cache_path or not self.dirty:
+            return
+        files = {key: record for key, record in self.records.items()
+                 if os.path.exists(os.path.join(self.root, key))}
+        tmp = "{}.{}.tmp".format(self.cache_path, os.getpid())
+        with open(tmp, "w", encoding="utf8") as f:
+            json.dump({"fingerprint": self.fingerprint, "files": files}, f, separators=(",", ":"))
+        os.replace(tmp, self.cache_path)
+        self.dirty = False
+
+    def key(self, path):
+        return os.path.relpath(os.path.abspath(path), self.root)
+
+    def cached(self, key, abspath):
+        """Return the record of key if the file's mtime and size did not change."""
+        record = self.records.get(key)
+        if record is None:
+            return None
+        st = os.stat(abspath)
+        if record["mtime"] == st.st_mtime_ns and record["size"] == st.st_size:
+            return record
+        return None
+
+    def store(self, key, result):
+        mtime, size, digest, record, elapsed = result
+        if record is None:
+            record = self.records[key]
+        else:
+            record["hash"] = digest
+            self.parse_times[key] = elapsed
+        record["mtime"] = mtime
+        record["size"] = size
+        self.records[key] = record
+        self.dirty = True
+        return record
+
+    def get(self, path):
+        """Return the record of path, (re-)extracting it if the file changed."""
+        key = self.key(path)
+        abspath = os.path.join(self.root, key)
+        record = self.cached(key, abspath)
+        if record is not None:
+            return record
+        cached_hash = self.records[key]["hash"] if key in self.records else None
+        return self.store(key, read_record(abspath, cached_hash))
+
+    def update(self, paths, jobs=None):
+        """Bring the records of paths up to date, extracting changed files in parallel.
+
+        jobs is the number of worker processes (default: number of CPUs)."""
+        stale = []
+        for path in paths:
+            key = self.key(path)
+            abspath = os.path.join(self.root, key)
+            if self.cached(key, abspath) is None:
+                cached_hash = self.records[key]["hash"] if key in self.records else None
+                stale.append((key, (abspath, cached_hash)))
+        if len(stale) < 2 or jobs == 1:
+            for key, task in stale:
+                self.store(key, read_record_task(task))
+            return
+        with multiprocessing.Pool(jobs) as pool:
+            results = pool.imap(read_record_task, [task for _, task in stale], chunksize=4)
+            for (key, _), result in zip(stale, results):
+                self.store(key, result)
+
+    def includes(self, path):
+        return self.get(path)["includes"]
+
+    def format_calls(self, path, function_name):
+        return self.get(path)["format_calls"].get(function_name, [])
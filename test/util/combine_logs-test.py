@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# Copyright (c) DeFi Blockchain Developers
+# Distributed under the MIT software license, see the accompanying
+# file LICENSE or http://www.opensource.org/licenses/mit-license.php.
+"""Test test/functional/combine_logs.py
+"""
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+class TestCombineLogs(unittest.TestCase):
+    def setUp(self):
+        sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "../functional")))
+        self.combine_logs = importlib.import_module('combine_logs')
+        self.tmpdir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmpdir, "node0", "regtest"))
+        with open(os.path.join(self.tmpdir, "test_framework.log"), 'w', encoding="utf8"):
+            pass
+        # The category only appears in the first 3 of 5000 events, so the
+        # last index checkpoint is far past them.
+        with open(os.path.join(self.tmpdir, "node0", "regtest", "debug.log"), 'w', encoding="utf8") as f:
+            for i in range(5000):
+                message = "UpdateTip: height={}".format(i) if i < 3 else "Other: event {}".format(i)
+                f.write("2020-01-01T{:02d}:{:02d}:{:02d}.000000Z {}\n".format(i // 3600, i // 60 % 60, i % 60, message))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read(self, **kwargs):
+        return list(self.combine_logs.read_logs(self.tmpdir, jobs=1, **kwargs))
+
+    def test_tail_with_index(self):
+        first = self.read(tail=10)
+        self.assertTrue(os.path.isfile(os.path.join(self.tmpdir, "node0", "regtest", "debug.log.idx")))
+        self.assertEqual(self.read(tail=10), first)
+        self.assertEqual(len(first), 10)
+        self.assertTrue(first[-1].event.endswith("Other: event 4999"))
+
+    def test_tail_with_category(self):
+        keep = self.combine_logs.EventFilter(["UpdateTip"])
+        first = self.read(tail=10, keep=keep)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(self.read(tail=10, keep=keep), first)
+
+if __name__ == '__main__':
+    unittest.main()